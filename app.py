@@ -11,8 +11,13 @@ import streamlit as st
 from datetime import datetime
 from pathlib import Path
 import base64
+import time
 
 from services.chat_logic import process_user_input
+from services.warmup import start_warmup, is_ready, readiness
+
+# Load models + index in the background as soon as the process starts
+start_warmup()
 
 
 
@@ -334,6 +339,9 @@ with st.sidebar:
         st.session_state.dark_mode = False
     st.session_state.dark_mode = st.toggle("🌙 Dark mode", value=st.session_state.dark_mode)
 
+    if not is_ready():
+        st.caption("⏳ جارٍ تهيئة النموذج..." if readiness()["state"] == "warming" else "⚠️ تعذّرت تهيئة النموذج مسبقًا")
+
 # Apply theme after toggle state
 render_theme_css(st.session_state.dark_mode)
 
@@ -447,6 +455,17 @@ def send_and_stream(prompt: str):
     </div>
     """, unsafe_allow_html=True)
 
+    # Still warming up: say so instead of looking hung
+    if not is_ready() and readiness()["state"] == "warming":
+        typing_placeholder.markdown(f"""
+        <div class="chat-row">
+            <img src="data:image/png;base64,{avatar_b64(bot_avatar_path)}" class="chat-avatar">
+            <div class="chat-bubble bot-bubble">⏳ جارٍ تهيئة النموذج، لحظات...</div>
+        </div>
+        """, unsafe_allow_html=True)
+        while not is_ready() and readiness()["state"] == "warming":
+            time.sleep(0.5)
+
     response = ""
     stream_placeholder = st.empty()
     typing_placeholder.empty()
@@ -0,0 +1,141 @@
+# core/chunk_store.py
+"""
+Zero-copy chunk store shared by ingest (writer) and the retriever (reader).
+
+Layout next to docs.json:
+  docs.bin          concatenated UTF-8 JSON records, one per chunk
+  docs.offsets.npy  int64[N+1] byte offsets into docs.bin
+  docs.source_id.npy / docs.domain_id.npy / docs.source_type.npy
+                    int32 / int32 / int8 [N] per-chunk source metadata
+  docs.sources.json {"sources": [...], "domains": [...]} names of those ids
+
+The reader memory-maps the arrays, so every worker on a host shares one
+page-cached copy and only the records actually returned get decoded.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import os, json, mmap
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+def store_paths(docs_json_path: str) -> Tuple[str, str]:
+    base = os.path.splitext(docs_json_path)[0]
+    return base + ".bin", base + ".offsets.npy"
+
+
+# ---- Source metadata ----
+
+SOURCE_TYPES = {"gdoc": 0, "web": 1, "lms": 2}
+_SOURCE_ARRAYS = ("source_id", "domain_id", "source_type")
+
+SourceArrays = Tuple[np.ndarray, np.ndarray, np.ndarray, List[str], List[str]]
+
+
+def source_domain(src: str) -> str:
+    if not src: return ""
+    if src.startswith("gdoc:"): return "gdoc"
+    try:
+        return urlparse(src).netloc
+    except Exception:
+        return ""
+
+
+def source_type(domain: str) -> int:
+    if domain == "gdoc": return SOURCE_TYPES["gdoc"]
+    return SOURCE_TYPES["lms"] if domain.startswith("lms.") else SOURCE_TYPES["web"]
+
+
+def source_arrays(chunks: Iterable[Dict[str, Any]], n: int) -> SourceArrays:
+    """(source_id, domain_id, source_type, source names, domain names) for n chunks."""
+    src_ids: Dict[str, int] = {}
+    dom_ids: Dict[str, int] = {}
+    sid = np.empty(n, dtype="int32"); did = np.empty(n, dtype="int32"); typ = np.empty(n, dtype="int8")
+    for i, c in enumerate(chunks):
+        src = c.get("source", "") or ""
+        dom = source_domain(src)
+        sid[i] = src_ids.setdefault(src, len(src_ids))
+        did[i] = dom_ids.setdefault(dom, len(dom_ids))
+        typ[i] = source_type(dom)
+    return sid, did, typ, list(src_ids), list(dom_ids)
+
+
+def _source_paths(docs_json_path: str) -> Tuple[List[str], str]:
+    base = os.path.splitext(docs_json_path)[0]
+    return [f"{base}.{name}.npy" for name in _SOURCE_ARRAYS], base + ".sources.json"
+
+
+def write_source_arrays(chunks: Sequence[Dict[str, Any]], docs_json_path: str) -> None:
+    *arrays, sources, domains = source_arrays(chunks, len(chunks))
+    npy_paths, names_path = _source_paths(docs_json_path)
+    for path, a in zip(npy_paths, arrays):
+        np.save(path, a)
+    with open(names_path, "w", encoding="utf-8") as f:
+        json.dump({"sources": sources, "domains": domains}, f, ensure_ascii=False)
+
+
+def read_source_arrays(docs_json_path: str, n: int) -> Optional[SourceArrays]:
+    """Memory-mapped arrays written at ingest; None if missing or not for n chunks."""
+    npy_paths, names_path = _source_paths(docs_json_path)
+    if not all(os.path.exists(p) for p in npy_paths + [names_path]):
+        return None
+    try:
+        sid, did, typ = (np.load(p, mmap_mode="r") for p in npy_paths)
+        with open(names_path, encoding="utf-8") as f:
+            names = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not len(sid) == len(did) == len(typ) == n:
+        return None
+    return sid, did, typ, list(names.get("sources") or []), list(names.get("domains") or [])
+
+
+def write_chunk_store(chunks: Sequence[Dict[str, Any]], docs_json_path: str) -> None:
+    bin_path, off_path = store_paths(docs_json_path)
+    offsets = np.zeros(len(chunks) + 1, dtype="int64")
+    with open(bin_path, "wb") as f:
+        for i, c in enumerate(chunks):
+            b = json.dumps(c, ensure_ascii=False).encode("utf-8")
+            f.write(b)
+            offsets[i + 1] = offsets[i] + len(b)
+    np.save(off_path, offsets)
+    write_source_arrays(chunks, docs_json_path)
+
+
+def has_chunk_store(docs_json_path: str) -> bool:
+    return all(os.path.exists(p) for p in store_paths(docs_json_path))
+
+
+class ChunkStore(Sequence):
+    """Read-only, list-like view over docs.bin (records decoded on access)."""
+
+    def __init__(self, docs_json_path: str):
+        bin_path, off_path = store_paths(docs_json_path)
+        self._offsets = np.load(off_path, mmap_mode="r")
+        self._f = open(bin_path, "rb")
+        size = os.fstat(self._f.fileno()).st_size
+        # mmap of an empty file is not allowed
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return max(0, len(self._offsets) - 1)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        a, b = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._mm[a:b].decode("utf-8"))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._f.close()
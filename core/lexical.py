@@ -0,0 +1,113 @@
+# core/lexical.py
+"""
+Arabic/English lexical search: normalization, tokenization and a compact BM25
+inverted index written at ingest time and memory-mapped by the retriever.
+
+On-disk layout (prefix = vectorstore/index.bm25):
+  <prefix>.vocab.json    {"n_docs": N, "terms": {term: [start, length]}}
+  <prefix>.docids.npy    int32   posting doc ids, grouped per term
+  <prefix>.weights.npy   float32 precomputed BM25 impact of (term, doc)
+
+Because the impacts already fold in idf, tf saturation and length
+normalization, a query is just a sum of array slices.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import os, re, json
+from collections import Counter
+
+import numpy as np
+
+_DIACRITICS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_AR_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+
+
+def ar_normalize(s: str) -> str:
+    """Strip tashkeel and unify alef / ya / ta-marbuta forms."""
+    s = _DIACRITICS_RE.sub("", s or "")
+    return s.replace("أ","ا").replace("إ","ا").replace("آ","ا").replace("ى","ي").replace("ة","ه")
+
+
+def tokenize(s: str) -> List[str]:
+    out = []
+    for t in _TOKEN_RE.findall(ar_normalize(s).lower()):
+        for p in _AR_PREFIXES:   # light stemming of the definite article
+            if t.startswith(p) and len(t) - len(p) >= 3:
+                t = t[len(p):]
+                break
+        if len(t) > 1:
+            out.append(t)
+    return out
+
+
+def bm25_paths(prefix: str) -> Tuple[str, str, str]:
+    return prefix + ".vocab.json", prefix + ".docids.npy", prefix + ".weights.npy"
+
+
+def build_bm25(texts: Sequence[str], prefix: str, k1: float = 1.2, b: float = 0.75) -> Dict[str, int]:
+    """Write the BM25 index for texts (doc id = position). Returns small stats."""
+    tfs = [Counter(tokenize(t)) for t in texts]
+    lens = np.array([sum(c.values()) for c in tfs], dtype="float32")
+    avgdl = float(lens.mean()) if len(lens) and lens.mean() > 0 else 1.0
+    n = len(texts)
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for doc, c in enumerate(tfs):
+        for term, tf in c.items():
+            postings.setdefault(term, []).append((doc, tf))
+
+    terms: Dict[str, List[int]] = {}
+    docids: List[int] = []
+    weights: List[float] = []
+    for term in sorted(postings):
+        plist = postings[term]
+        df = len(plist)
+        idf = float(np.log(1.0 + (n - df + 0.5) / (df + 0.5)))
+        terms[term] = [len(docids), df]
+        for doc, tf in plist:
+            norm = tf + k1 * (1.0 - b + b * lens[doc] / avgdl)
+            docids.append(doc)
+            weights.append(idf * tf * (k1 + 1.0) / norm)
+
+    vocab_path, ids_path, w_path = bm25_paths(prefix)
+    os.makedirs(os.path.dirname(os.path.abspath(vocab_path)), exist_ok=True)
+    with open(vocab_path, "w", encoding="utf-8") as f:
+        json.dump({"n_docs": n, "k1": k1, "b": b, "terms": terms}, f, ensure_ascii=False)
+    np.save(ids_path, np.asarray(docids, dtype="int32"))
+    np.save(w_path, np.asarray(weights, dtype="float32"))
+    return {"docs": n, "terms": len(terms), "postings": len(docids)}
+
+
+def has_bm25(prefix: str) -> bool:
+    return all(os.path.exists(p) for p in bm25_paths(prefix))
+
+
+class BM25Index:
+    """Memory-mapped reader for build_bm25() output."""
+
+    def __init__(self, prefix: str):
+        vocab_path, ids_path, w_path = bm25_paths(prefix)
+        with open(vocab_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.n_docs: int = int(meta["n_docs"])
+        self.terms: Dict[str, List[int]] = meta["terms"]
+        self.docids = np.load(ids_path, mmap_mode="r")
+        self.weights = np.load(w_path, mmap_mode="r")
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (doc_ids, scores) by BM25; mask (bool[N]) restricts to allowed docs."""
+        scores = np.zeros(self.n_docs, dtype="float32")
+        for term in set(tokenize(query)):
+            span = self.terms.get(term)
+            if span:
+                a, n = span
+                scores[self.docids[a:a + n]] += self.weights[a:a + n]
+        if mask is not None:
+            scores[~mask] = 0.0
+        hit = np.flatnonzero(scores)
+        if not len(hit):
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+        if len(hit) > k:
+            hit = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        order = hit[np.argsort(-scores[hit], kind="stable")]
+        return order, scores[order]
@@ -0,0 +1,72 @@
+# core/sparse.py
+"""
+CSR store for BGE-M3 lexical (sparse) weights, one row per chunk.
+
+  <prefix>.indptr.npy   int64[N+1]
+  <prefix>.indices.npy  int32  token ids
+  <prefix>.data.npy     float32 weights
+
+Written by ingest/build_index, memory-mapped by the retriever and used as a
+cheap second-stage scorer (dense + sparse) instead of the cross-encoder.
+"""
+from typing import Any, Dict, Mapping, Sequence, Tuple
+import os
+
+import numpy as np
+
+
+def sparse_paths(prefix: str) -> Tuple[str, str, str]:
+    return prefix + ".indptr.npy", prefix + ".indices.npy", prefix + ".data.npy"
+
+
+def write_sparse(rows: Sequence[Mapping[Any, float]], prefix: str) -> Dict[str, int]:
+    """rows: BGE-M3 `lexical_weights` ({token_id: weight}) per chunk."""
+    indptr = np.zeros(len(rows) + 1, dtype="int64")
+    indices, data = [], []
+    for i, row in enumerate(rows):
+        items = sorted((int(t), float(w)) for t, w in row.items())
+        indices.extend(t for t, _ in items)
+        data.extend(w for _, w in items)
+        indptr[i + 1] = len(indices)
+    p_ptr, p_idx, p_dat = sparse_paths(prefix)
+    os.makedirs(os.path.dirname(os.path.abspath(p_ptr)), exist_ok=True)
+    np.save(p_ptr, indptr)
+    np.save(p_idx, np.asarray(indices, dtype="int32"))
+    np.save(p_dat, np.asarray(data, dtype="float32"))
+    return {"rows": len(rows), "nnz": len(indices)}
+
+
+def has_sparse(prefix: str) -> bool:
+    return all(os.path.exists(p) for p in sparse_paths(prefix))
+
+
+def to_query(weights: Mapping[Any, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """{token_id: weight} -> (sorted token ids, weights) for SparseStore.scores()."""
+    items = sorted((int(t), float(w)) for t, w in (weights or {}).items())
+    return (np.asarray([t for t, _ in items], dtype="int32"),
+            np.asarray([w for _, w in items], dtype="float32"))
+
+
+class SparseStore:
+    def __init__(self, prefix: str):
+        p_ptr, p_idx, p_dat = sparse_paths(prefix)
+        self.indptr = np.load(p_ptr, mmap_mode="r")
+        self.indices = np.load(p_idx, mmap_mode="r")
+        self.data = np.load(p_dat, mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def scores(self, query: Tuple[np.ndarray, np.ndarray], ids: Sequence[int]) -> np.ndarray:
+        """Lexical-matching score (sum of q_w * d_w over shared tokens) for each row id."""
+        qk, qv = query
+        out = np.zeros(len(ids), dtype="float32")
+        if not len(qk):
+            return out
+        for j, i in enumerate(ids):
+            a, b = int(self.indptr[i]), int(self.indptr[i + 1])
+            idx = self.indices[a:b]
+            pos = np.minimum(np.searchsorted(qk, idx), len(qk) - 1)
+            hit = qk[pos] == idx
+            out[j] = float(np.dot(self.data[a:b][hit], qv[pos[hit]]))
+        return out
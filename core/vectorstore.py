@@ -0,0 +1,174 @@
+# core/vectorstore.py
+"""
+Small helpers shared by ingest and the retriever for vector-store side files.
+
+Versioned layout (ingest_runner, VECTORSTORE_VERSIONED=1):
+  <root>/builds/<build_id>/   index.faiss, docs.json, side files, manifest.json
+  <root>/current              id of the live build; replaced atomically
+When there is no `current`, FAISS_INDEX_PATH / DOCS_JSON_PATH are used as-is.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import os, json, time, shutil, hashlib
+
+
+def store_version(*paths: Any) -> str:
+    """Cheap version id of the on-disk index: size + mtime of each file."""
+    h = hashlib.sha1()
+    for p in paths:
+        try:
+            st = os.stat(p)
+            h.update(f"{p}:{st.st_size}:{st.st_mtime_ns};".encode())
+        except (OSError, TypeError):
+            h.update(f"{p}:missing;".encode())
+    return h.hexdigest()[:16]
+
+
+def canned_answers_path(faiss_path: str) -> str:
+    """index.faiss -> canned_answers.json (precomputed welcome-tile answers) in the same dir."""
+    return os.path.join(os.path.dirname(faiss_path), "canned_answers.json")
+
+
+def index_meta_path(faiss_path: str) -> str:
+    """index.faiss -> index.meta.json (index type, build params, recall report)."""
+    return os.path.splitext(faiss_path)[0] + ".meta.json"
+
+
+def bm25_prefix(faiss_path: str) -> str:
+    """index.faiss -> index.bm25 (prefix of the lexical inverted index files)."""
+    return os.path.splitext(faiss_path)[0] + ".bm25"
+
+
+def sparse_prefix(faiss_path: str) -> str:
+    """index.faiss -> index.sparse (prefix of the BGE-M3 lexical-weight CSR files)."""
+    return os.path.splitext(faiss_path)[0] + ".sparse"
+
+
+def write_index_meta(faiss_path: str, meta: Dict[str, Any]) -> None:
+    with open(index_meta_path(faiss_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def read_index_meta(faiss_path: str) -> Dict[str, Any]:
+    try:
+        with open(index_meta_path(faiss_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+# ---- Versioned builds -------------------------------------------------------
+
+@dataclass(frozen=True)
+class StorePaths:
+    faiss: str
+    docs: str
+    version: str          # build id, or a file fingerprint for the legacy layout
+    build_dir: str = ""   # "" for the legacy layout
+
+
+def store_root() -> str:
+    return os.getenv("VECTORSTORE_DIR") or os.path.dirname(os.getenv("FAISS_INDEX_PATH", "vectorstore/index.faiss")) or "."
+
+
+def _builds_dir(root: str) -> str:
+    return os.path.join(root, "builds")
+
+
+def new_build(root: str) -> Tuple[str, str]:
+    """(build_id, build_dir) for a fresh, empty build directory."""
+    base = time.strftime("%Y%m%d-%H%M%S")
+    build_id, n = base, 1
+    while os.path.exists(os.path.join(_builds_dir(root), build_id)):
+        n += 1
+        build_id = f"{base}-{n}"
+    path = os.path.join(_builds_dir(root), build_id)
+    os.makedirs(path)
+    return build_id, path
+
+
+def write_manifest(build_dir: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Adds the size of every file in the build (checked before a build is loaded)."""
+    files = {name: os.path.getsize(os.path.join(build_dir, name))
+             for name in sorted(os.listdir(build_dir)) if name != "manifest.json"}
+    manifest = dict(manifest, files=files)
+    with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def read_manifest(build_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(build_dir, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def verify_build(build_dir: str) -> bool:
+    files = read_manifest(build_dir).get("files")
+    if not files:
+        return False
+    try:
+        return all(os.path.getsize(os.path.join(build_dir, n)) == size for n, size in files.items())
+    except OSError:
+        return False
+
+
+def publish_build(root: str, build_id: str) -> None:
+    """Point <root>/current at build_id (write-then-rename, so readers never see a partial id)."""
+    tmp = os.path.join(root, "current.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(build_id)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, "current"))
+
+
+def current_build_id(root: str) -> Optional[str]:
+    """VECTORSTORE_BUILD pins a build (rollback / ingest-time use); else <root>/current."""
+    pinned = os.getenv("VECTORSTORE_BUILD")
+    if pinned:
+        return pinned
+    try:
+        with open(os.path.join(root, "current"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve_store() -> StorePaths:
+    """Paths + version of the live vector store."""
+    root = store_root()
+    build_id = current_build_id(root)
+    if build_id:
+        build_dir = os.path.join(_builds_dir(root), build_id)
+        m = read_manifest(build_dir)
+        if m:
+            return StorePaths(os.path.join(build_dir, m["faiss"]), os.path.join(build_dir, m["docs"]),
+                              build_id, build_dir)
+    faiss_path = os.getenv("FAISS_INDEX_PATH", "vectorstore/index.faiss")
+    docs_path = os.getenv("DOCS_JSON_PATH", "vectorstore/docs.json")
+    return StorePaths(faiss_path, docs_path, store_version(faiss_path, docs_path))
+
+
+def _build_order(build_id: str) -> List[Tuple[int, Any]]:
+    """Sort key, oldest first, for new_build() ids <date>-<time>[-<n>]: numeric parts compare
+    as numbers, so ...-10 comes after ...-2 (and an id without -<n> before both)."""
+    return [(0, int(p)) if p.isdigit() else (1, p) for p in build_id.split("-")]
+
+
+def prune_builds(root: str, keep: int = 3) -> List[str]:
+    """Delete all but the newest `keep` builds (never the live one). Returns removed ids."""
+    try:
+        ids = sorted(os.listdir(_builds_dir(root)), key=_build_order)
+    except OSError:
+        return []
+    live = current_build_id(root)
+    removed = []
+    for build_id in ids[:-keep] if keep > 0 else ids:
+        if build_id == live:
+            continue
+        shutil.rmtree(os.path.join(_builds_dir(root), build_id), ignore_errors=True)
+        removed.append(build_id)
+    return removed
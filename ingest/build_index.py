@@ -1,7 +1,7 @@
 # ingest/build_index.py
 
-from typing import Optional, List, Dict
-import os, json, pickle
+from typing import Optional, List, Dict, Any, Tuple
+import os, json, time, pickle
 from pathlib import Path
 
 import numpy as np
@@ -9,18 +9,118 @@ import faiss
 from FlagEmbedding import BGEM3FlagModel
 from dotenv import load_dotenv
 
+from core.chunk_store import write_chunk_store
+from core.lexical import build_bm25
+from core.sparse import write_sparse
+from core.vectorstore import write_index_meta, bm25_prefix, sparse_prefix
+
 load_dotenv()
 
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+def _index_params_from_env() -> Dict[str, int]:
+    return {
+        "hnsw_m": int(os.getenv("HNSW_M", "32")),
+        "hnsw_ef_construction": int(os.getenv("HNSW_EF_CONSTRUCTION", "200")),
+        "ivf_nlist": int(os.getenv("IVF_NLIST", "256")),
+        "pq_m": int(os.getenv("PQ_M", "64")),          # sub-quantizers; must divide dim
+        "pq_nbits": int(os.getenv("PQ_NBITS", "8")),
+    }
+
+def _make_index(embs: np.ndarray, index_type: str, p: Dict[str, int]) -> Tuple[Any, str, Dict[str, int]]:
+    """Build + train + fill the requested index. Returns (index, effective_type, effective_params)."""
+    n, dim = embs.shape
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, p["hnsw_m"])
+        index.hnsw.efConstruction = p["hnsw_ef_construction"]
+        index.add(embs)
+        return index, "hnsw", {k: p[k] for k in ("hnsw_m", "hnsw_ef_construction")}
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # faiss wants ~39 training points per list; shrink nlist on small corpora
+        nlist = max(1, min(p["ivf_nlist"], n // 39))
+        if index_type == "ivf_pq" and (n < 2 ** p["pq_nbits"] or dim % p["pq_m"]):
+            print(f"[warn] ivf_pq needs >= {2 ** p['pq_nbits']} chunks and dim % PQ_M == 0; using ivf_flat.")
+            index_type = "ivf_flat"
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, p["pq_m"], p["pq_nbits"])
+            eff = {"ivf_nlist": nlist, "pq_m": p["pq_m"], "pq_nbits": p["pq_nbits"]}
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+            eff = {"ivf_nlist": nlist}
+        index.train(embs)
+        index.add(embs)
+        return index, index_type, eff
+
+    if index_type not in INDEX_TYPES:
+        print(f"[warn] unknown INDEX_TYPE={index_type!r}; using flat.")
+    index = faiss.IndexFlatL2(dim)
+    index.add(embs)
+    return index, "flat", {}
+
+def _search_ms(index, q: np.ndarray, k: int) -> Tuple[np.ndarray, float]:
+    t0 = time.perf_counter()
+    _, I = index.search(q, k)
+    return I, (time.perf_counter() - t0) * 1000.0 / max(1, len(q))
+
+def recall_report(index, embs: np.ndarray, index_type: str, ks=(1, 5, 10), n_queries: int = 200) -> List[Dict[str, Any]]:
+    """
+    recall@k of the ANN index vs exact IndexFlatL2, swept over efSearch / nprobe.
+    Queries are a random sample of the corpus vectors (lightly perturbed so the
+    query is not trivially its own nearest neighbour).
+    """
+    rng = np.random.default_rng(0)
+    n = len(embs)
+    sel = rng.choice(n, size=min(n_queries, n), replace=False)
+    q = embs[sel] + rng.normal(0, 0.01, size=embs[sel].shape).astype("float32")
+    kmax = min(max(ks), n)
+
+    exact = faiss.IndexFlatL2(embs.shape[1]); exact.add(embs)
+    truth, exact_ms = _search_ms(exact, q, kmax)
+
+    if index_type == "hnsw":
+        knob, values = "efSearch", [16, 32, 64, 128, 256]
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = faiss.extract_index_ivf(index).nlist
+        knob, values = "nprobe", sorted({v for v in (1, 2, 4, 8, 16, 32, 64) if v <= nlist} | {nlist})
+    else:
+        knob, values = None, [None]
+
+    rows = []
+    for v in values:
+        if knob == "efSearch": index.hnsw.efSearch = max(v, kmax)
+        elif knob == "nprobe": faiss.extract_index_ivf(index).nprobe = v
+        got, ms = _search_ms(index, q, kmax)
+        row: Dict[str, Any] = {"param": knob, "value": v, "ms_per_query": round(ms, 3),
+                               "exact_ms_per_query": round(exact_ms, 3)}
+        for k in ks:
+            k = min(k, kmax)
+            hits = sum(len(set(got[i, :k]) & set(truth[i, :k])) for i in range(len(q)))
+            row[f"recall@{k}"] = round(hits / (k * len(q)), 4)
+        rows.append(row)
+
+    print(f"[index] recall vs exact ({len(q)} queries, type={index_type}):")
+    for r in rows:
+        rec = "  ".join(f"{k}={v:.3f}" for k, v in r.items() if k.startswith("recall@"))
+        label = f"{r['param']}={r['value']}" if r["param"] else "exact"
+        print(f"  {label:<14} {rec}  {r['ms_per_query']:.3f} ms/q (exact {r['exact_ms_per_query']:.3f})")
+    return rows
+
 def build_index(
     records: List[Dict],
     faiss_path: str,
     docs_json_path: str,
     model_path: Optional[str] = None,
     pkl_path: Optional[str] = None,
+    index_type: Optional[str] = None,
+    index_params: Optional[Dict[str, int]] = None,
 ) -> None:
     """
     records: list of {"source": str, "text": str}
-    Writes: FAISS index + docs.json (+ optional legacy index.pkl)
+    index_type: flat | hnsw | ivf_flat | ivf_pq (default: env INDEX_TYPE or flat)
+    Writes: FAISS index + index.meta.json + BM25 inverted index + BGE-M3 sparse
+            weights (CSR) + docs.json + mmap-able chunk store (+ optional legacy index.pkl)
     """
     if not records:
         raise ValueError("No records to index.")
@@ -37,24 +137,53 @@ def build_index(
     if not chunks:
         raise ValueError("No chunks produced from records.")
 
+    # 1b) Exact + near-duplicate elimination (replaces query-time dedup)
+    dedup_report: Dict[str, Any] = {}
+    if os.getenv("DEDUP", "1") == "1":
+        from ingest.dedup import dedup_chunks
+        chunks, dedup_report = dedup_chunks(chunks, threshold=float(os.getenv("DEDUP_THRESHOLD", "0.9")))
+        print(f"[dedup] kept {dedup_report['kept']}/{dedup_report['input']} chunks "
+              f"(empty -{dedup_report['empty_dropped']}, exact -{dedup_report['exact_dropped']}, near -{dedup_report['near_dropped']})")
+        for src, n in dedup_report["top_dropped_sources"]:
+            print(f"  dropped {n:>4} from {src}")
+
     # 2) Encode (CPU-friendly defaults)
     model_name = model_path if (model_path and os.path.isdir(model_path)) else "BAAI/bge-m3"
     model = BGEM3FlagModel(model_name, use_fp16=False)
-    vecs = model.encode([c["text"] for c in chunks], batch_size=16, return_dense=True)["dense_vecs"]
-    embs = np.asarray(vecs, dtype="float32")   # shape: (N, 1024)
+    # lexical_weights come from the same forward pass (used for sparse rescoring)
+    with_sparse = os.getenv("BUILD_SPARSE", "1") == "1"
+    enc = model.encode([c["text"] for c in chunks], batch_size=16,
+                       return_dense=True, return_sparse=with_sparse)
+    embs = np.asarray(enc["dense_vecs"], dtype="float32")   # shape: (N, 1024)
 
-    # 3) FAISS
+    # 3) FAISS (+ recall/latency report against exact search)
     Path(faiss_path).parent.mkdir(parents=True, exist_ok=True)
-    index = faiss.IndexFlatL2(embs.shape[1])
-    index.add(embs)
+    index_type = (index_type or os.getenv("INDEX_TYPE") or "flat").lower()
+    params = {**_index_params_from_env(), **(index_params or {})}
+    index, index_type, eff_params = _make_index(embs, index_type, params)
+    report = recall_report(index, embs, index_type) if index_type != "flat" else []
     faiss.write_index(index, faiss_path)
+    write_index_meta(faiss_path, {
+        "index_type": index_type, "params": eff_params, "dim": int(embs.shape[1]),
+        "ntotal": int(index.ntotal), "recall_report": report,
+        "deduped": bool(dedup_report), "dedup_report": dedup_report,
+    })
+
+    # 4) Lexical BM25 index over Arabic-normalized tokens (doc id == FAISS id)
+    stats = build_bm25([c["text"] for c in chunks], bm25_prefix(faiss_path))
+    print(f"[index] bm25: {stats['terms']} terms, {stats['postings']} postings")
+
+    if with_sparse:
+        stats = write_sparse(enc["lexical_weights"], sparse_prefix(faiss_path))
+        print(f"[index] sparse: {stats['nnz']} non-zeros over {stats['rows']} chunks")
 
-    # 4) docs.json (canonical)
+    # 5) docs.json (canonical)
     Path(docs_json_path).parent.mkdir(parents=True, exist_ok=True)
     with open(docs_json_path, "w", encoding="utf-8") as f:
         json.dump(chunks, f, ensure_ascii=False)
+    write_chunk_store(chunks, docs_json_path)   # docs.bin + docs.offsets.npy + source arrays
 
-    # 5) Legacy pickle (optional)
+    # 6) Legacy pickle (optional)
     if pkl_path:
         Path(pkl_path).parent.mkdir(parents=True, exist_ok=True)
         with open(pkl_path, "wb") as f:
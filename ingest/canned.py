@@ -0,0 +1,72 @@
+# ingest/canned.py
+"""
+Post-ingest stage: answer the welcome-tile prompts (canned_prompts.yaml) once
+against the freshly built index and store them next to it, so the chat path
+can serve those clicks instantly (services/canned_answers.py).
+"""
+from typing import Optional
+from pathlib import Path
+import os, json, time
+
+import yaml
+
+from core.vectorstore import canned_answers_path, store_version
+
+
+def _rejected(answer: str) -> Optional[str]:
+    """Why an answer must not become a tile answer (served to everyone for the whole build), or None."""
+    text = (answer or "").strip()
+    if not text:
+        return "empty answer"
+    if text.startswith("[HTTP error]"):
+        return "LLM error text"
+    if text.startswith("⚠️"):
+        return "warning text"
+    return None
+
+
+def build_canned_answers(cfg_path: Path, faiss_path: str, docs_json_path: str,
+                         version: Optional[str] = None) -> int:
+    """Returns the number of answers written. version: build id (versioned store),
+    defaults to the file fingerprint of the legacy layout."""
+    if not cfg_path.exists():
+        print(f"[canned] {cfg_path.name} not found; skipping.")
+        return 0
+    prompts = yaml.safe_load(cfg_path.read_text(encoding="utf-8")).get("prompts") or []
+
+    # Answer from the index just built (not a running retrieval server) and
+    # without the runtime answer caches.
+    os.environ["RETRIEVAL_SERVER_URL"] = ""
+    os.environ["ANSWER_CACHE"] = "0"
+    os.environ["CANNED_ANSWERS"] = "0"
+    from services.chat_logic import generate_answer
+
+    answers = []
+    for p in prompts:
+        text = p if isinstance(p, str) else p.get("prompt", "")
+        if not text:
+            continue
+        t0 = time.perf_counter()
+        try:
+            answer, lang, docs = generate_answer(text)
+        except Exception as e:
+            print(f"[warn] canned answer failed for {text!r}: {e}")
+            continue
+        if not docs:
+            print(f"[warn] no context for canned prompt {text!r}; skipping.")
+            continue
+        reason = _rejected(answer)
+        if reason:
+            print(f"[warn] canned answer for {text!r} rejected ({reason}: {answer[:60]!r}); skipping.")
+            continue
+        answers.append({"prompt": text, "lang": lang, "answer": answer, "docs": docs})
+        print(f"[canned] {text[:40]!r}: {len(answer)} chars, {len(docs)} docs, {time.perf_counter() - t0:.1f}s")
+
+    out = canned_answers_path(faiss_path)
+    tmp = out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"index_version": version or store_version(faiss_path, docs_json_path),
+                   "created": time.time(), "answers": answers}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, out)
+    print(f"[canned] {len(answers)}/{len(prompts)} answers -> {out}")
+    return len(answers)
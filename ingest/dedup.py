@@ -0,0 +1,105 @@
+# ingest/dedup.py
+"""
+Ingest-time duplicate elimination for chunks:
+  1) exact duplicates   - sha1 of the whitespace/case/Arabic-normalized text
+  2) near duplicates    - MinHash over character 5-grams + LSH banding,
+                          confirmed by the estimated Jaccard similarity
+The first occurrence is kept (records arrive gdocs first, then crawls).
+"""
+from typing import Any, Dict, List, Tuple
+import re, zlib, hashlib
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from core.lexical import ar_normalize
+
+_PRIME = (1 << 31) - 1
+
+
+def _norm(text: str) -> str:
+    return " ".join(ar_normalize(text or "").lower().split())
+
+
+def _shingles(text: str, n: int = 5) -> np.ndarray:
+    s = re.sub(r"\W+", " ", text)
+    grams = {s[i:i + n] for i in range(max(1, len(s) - n + 1))}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams), dtype="int64")
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=num_perm, dtype="int64")
+        self.b = rng.integers(0, _PRIME, size=num_perm, dtype="int64")
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        # (a*x + b) mod p for every permutation x shingle, min over shingles
+        h = (np.outer(self.a, shingles) + self.b[:, None]) % _PRIME
+        return h.min(axis=1)
+
+
+def dedup_chunks(
+    chunks: List[Dict[str, Any]],
+    threshold: float = 0.9,
+    num_perm: int = 64,
+    bands: int = 16,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Returns (kept_chunks, report). Chunks with no text after normalization are dropped
+    too (report["empty_dropped"]), so input == kept + empty + exact + near dropped."""
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    seen_exact: Dict[str, int] = {}
+    buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+    sigs: List[np.ndarray] = []          # signatures of kept chunks (by kept index)
+    kept: List[Dict[str, Any]] = []
+    dropped_by_source: Counter = Counter()
+    empty = exact = near = 0
+    examples: List[Dict[str, str]] = []
+
+    for c in chunks:
+        text = _norm(c.get("text", ""))
+        if not text:
+            empty += 1
+            dropped_by_source[c.get("source", "")] += 1
+            continue
+        h = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if h in seen_exact:
+            exact += 1
+            dropped_by_source[c.get("source", "")] += 1
+            if len(examples) < 5:
+                examples.append({"kind": "exact", "dropped": c.get("source", ""),
+                                 "kept": kept[seen_exact[h]].get("source", "")})
+            continue
+
+        sig = hasher.signature(_shingles(text))
+        keys = [(b, sig[b * rows:(b + 1) * rows].tobytes()) for b in range(bands)]
+        dup_of = -1
+        for k in keys:
+            for j in buckets.get(k, ()):
+                if float(np.mean(sigs[j] == sig)) >= threshold:
+                    dup_of = j
+                    break
+            if dup_of >= 0:
+                break
+        if dup_of >= 0:
+            near += 1
+            dropped_by_source[c.get("source", "")] += 1
+            if len(examples) < 10:
+                examples.append({"kind": "near", "dropped": c.get("source", ""),
+                                 "kept": kept[dup_of].get("source", "")})
+            continue
+
+        idx = len(kept)
+        seen_exact[h] = idx
+        sigs.append(sig)
+        for k in keys:
+            buckets[k].append(idx)
+        kept.append(c)
+
+    report = {
+        "input": len(chunks), "kept": len(kept), "empty_dropped": empty, "exact_dropped": exact, "near_dropped": near,
+        "threshold": threshold, "num_perm": num_perm, "bands": bands,
+        "top_dropped_sources": dropped_by_source.most_common(10), "examples": examples,
+    }
+    return kept, report
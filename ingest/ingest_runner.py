@@ -1,5 +1,6 @@
 ﻿# ingest/ingest_runner.py
 import os
+import time
 from pathlib import Path
 from collections import deque
 from urllib.parse import urljoin, urlparse
@@ -7,6 +8,8 @@ from urllib.parse import urljoin, urlparse
 import yaml
 from dotenv import load_dotenv
 from .build_index import build_index
+from core.vectorstore import (store_root, new_build, write_manifest, publish_build,
+                              prune_builds, read_index_meta)
 
 SOCIAL_HOSTS = ("facebook.com","fb.com","instagram.com","t.me","telegram.me","x.com","twitter.com","youtube.com","linkedin.com","wa.me","whatsapp.com")
 
@@ -118,10 +121,51 @@ def main():
     pkl_path   = os.getenv("METADATA_PATH", "vectorstore/index.pkl")
     model_path = os.getenv("BGE_MODEL_PATH")
 
+    # Versioned layout: build into vectorstore/builds/<id>/ and flip
+    # vectorstore/current at the end, so running retrievers never see a
+    # half-written index and pick the new build up without a restart.
+    versioned = os.getenv("VECTORSTORE_VERSIONED", "1") == "1"
+    build_id = None
+    if versioned:
+        root = store_root()
+        build_id, build_dir = new_build(root)
+        faiss_path = os.path.join(build_dir, os.path.basename(faiss_path))
+        docs_json  = os.path.join(build_dir, os.path.basename(docs_json))
+        pkl_path   = os.path.join(build_dir, os.path.basename(pkl_path))
+
     Path(faiss_path).parent.mkdir(parents=True, exist_ok=True)
     print(f"[ingest] Building index ->\n  FAISS: {faiss_path}\n  DOCS : {docs_json}\n  PKL  : {pkl_path}\n")
     build_index(records, faiss_path, docs_json, model_path=model_path, pkl_path=pkl_path)
     print(f"[done] records={len(records)} -> {faiss_path} / {docs_json}")
 
+    if versioned:
+        meta = read_index_meta(faiss_path)
+        manifest = {
+            "build_id": build_id, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "faiss": os.path.basename(faiss_path), "docs": os.path.basename(docs_json),
+            "records": len(records), "chunks": meta.get("ntotal"), "index_type": meta.get("index_type"),
+            "embed_model": model_path or "BAAI/bge-m3",
+        }
+        write_manifest(build_dir, manifest)   # lets the canned stage resolve the build; rewritten below
+        os.environ["VECTORSTORE_BUILD"] = build_id   # canned stage reads this build before it goes live
+
+    # --- Precomputed answers for the welcome tiles ---------------------------
+    if os.getenv("CANNED_ANSWERS", "1") == "1":
+        from .canned import build_canned_answers
+        try:
+            build_canned_answers(Path(__file__).with_name("canned_prompts.yaml"), faiss_path, docs_json,
+                                 version=build_id)
+        except Exception as e:
+            print(f"[warn] canned answers failed: {e}")
+
+    # --- Publish -------------------------------------------------------------
+    if versioned:
+        write_manifest(build_dir, manifest)   # last write: file sizes now include canned_answers.json
+        publish_build(root, build_id)
+        print(f"[ingest] current -> {build_id}")
+        removed = prune_builds(root, keep=int(os.getenv("VECTORSTORE_KEEP", "3")))
+        if removed:
+            print(f"[ingest] pruned old builds: {', '.join(removed)}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,110 @@
+# services/answer_cache.py
+"""
+Semantic answer cache for chat_logic.process_user_input.
+
+A question whose embedding has cosine >= ANSWER_CACHE_THRESHOLD with a cached
+question (same language, same index version, not older than
+ANSWER_CACHE_TTL_S) reuses the stored answer + sources. Entries built on an
+older index version are dropped as soon as a newer version is seen, so a
+re-ingest invalidates the cache.
+"""
+from typing import Any, Dict, List, Optional
+import os, time, threading
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    lang: str
+    index_version: str
+    answer: str
+    docs: List[Dict[str, Any]]
+    created: float = field(default_factory=time.time)
+    hits: int = 0
+    last_hit: float = 0.0
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl_s: float = 86400.0, max_items: int = 1000):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self._entries: List[CachedAnswer] = []
+        self._vecs = np.zeros((0, 0), dtype="float32")
+        self._version = ""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _set_version(self, version: str) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries, self._vecs, self._version = [], np.zeros((0, 0), dtype="float32"), version
+
+    def _drop(self, keep: List[int]) -> None:
+        self._entries = [self._entries[i] for i in keep]
+        self._vecs = self._vecs[keep] if keep else np.zeros((0, 0), dtype="float32")
+
+    def lookup(self, vec: np.ndarray, lang: str, version: str) -> Optional[CachedAnswer]:
+        now = time.time()
+        with self._lock:
+            self._set_version(version)
+            fresh = [i for i, e in enumerate(self._entries) if now - e.created <= self.ttl_s]
+            if len(fresh) < len(self._entries):
+                self._drop(fresh)
+            if self._entries:
+                sims = self._vecs @ vec
+                for i in np.argsort(-sims):
+                    if sims[i] < self.threshold:
+                        break
+                    e = self._entries[i]
+                    if e.lang == lang:
+                        e.hits += 1; e.last_hit = now
+                        self.hits += 1
+                        return e
+            self.misses += 1
+            return None
+
+    def store(self, vec: np.ndarray, entry: CachedAnswer) -> None:
+        with self._lock:
+            self._set_version(entry.index_version)
+            if len(self._entries) >= self.max_items:
+                # evict the least recently useful entry
+                worst = min(range(len(self._entries)),
+                            key=lambda i: self._entries[i].last_hit or self._entries[i].created)
+                self._drop([i for i in range(len(self._entries)) if i != worst])
+            v = vec.astype("float32").reshape(1, -1)
+            self._vecs = v if not len(self._entries) else np.vstack([self._vecs, v])
+            self._entries.append(entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries, self._vecs = [], np.zeros((0, 0), dtype="float32")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"items": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "invalidations": self.invalidations, "index_version": self._version}
+
+
+_cache: Optional[AnswerCache] = None
+
+
+def get_cache() -> Optional[AnswerCache]:
+    """Process-wide cache from env (None when ANSWER_CACHE=0)."""
+    global _cache
+    if os.getenv("ANSWER_CACHE", "1") != "1":
+        return None
+    if _cache is None:
+        _cache = AnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl_s=float(os.getenv("ANSWER_CACHE_TTL_S", "86400")),
+            max_items=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+        )
+    return _cache
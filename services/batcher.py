@@ -0,0 +1,74 @@
+# services/batcher.py
+"""
+Micro-batching dispatcher: items submitted from many threads within a short
+wait window are handed to one batch function call, and each caller gets its
+own result back. Used by the retriever to share one encode + one FAISS search
+across concurrent Streamlit sessions.
+"""
+from typing import Any, Callable, Dict, List, Sequence
+from concurrent.futures import Future
+from collections import Counter
+import time, queue, threading
+
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], max_wait_ms: float = 5.0,
+                 max_batch: int = 32, name: str = "batcher"):
+        self.fn = fn
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._q: "queue.Queue[tuple]" = queue.Queue()
+        self._sizes: Counter = Counter()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    # ------------------------------ callers ------------------------------
+    def submit_many(self, items: Sequence[Any]) -> List[Any]:
+        """Enqueue items (they may land in the same or different batches) and wait for all results."""
+        futs = []
+        for it in items:
+            f: Future = Future()
+            self._q.put((it, f))
+            futs.append(f)
+        return [f.result() for f in futs]
+
+    def submit(self, item: Any) -> Any:
+        return self.submit_many([item])[0]
+
+    # ------------------------------ worker -------------------------------
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=left))
+                except queue.Empty:
+                    break
+            with self._lock:
+                self._sizes[len(batch)] += 1
+            items = [it for it, _ in batch]
+            try:
+                results = list(self.fn(items))
+                for (_, f), r in zip(batch, results):
+                    f.set_result(r)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self._thread.name}: batch fn returned {len(results)} "
+                                       f"results for {len(batch)} items")
+            except Exception as e:
+                for _, f in batch:
+                    if not f.done():
+                        f.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = dict(sorted(self._sizes.items()))
+        batches = sum(sizes.values())
+        items = sum(k * v for k, v in sizes.items())
+        return {"batches": batches, "items": items,
+                "mean_batch": round(items / batches, 2) if batches else 0.0,
+                "batch_sizes": sizes}
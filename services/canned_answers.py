@@ -0,0 +1,59 @@
+# services/canned_answers.py
+"""
+Precomputed answers for the welcome-screen tile prompts.
+
+ingest_runner writes canned_answers.json into each index build (prompts from
+ingest/canned_prompts.yaml). An entry is served only while the live index is
+the one it was generated from (the retriever's loaded build, not whatever
+`current` points at on disk), so the next build replaces (or, if its canned
+stage fails, retires) them.
+"""
+from typing import Any, Dict, Optional
+import os, re, json, threading
+
+from core.lexical import ar_normalize
+from core.vectorstore import canned_answers_path
+from services import retriever
+
+_PUNCT_RE = re.compile(r"[\s\?\!\.,:;؟،؛]+")
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {"path": None, "mtime": None, "version": "", "answers": {}}
+
+
+def normalize_prompt(text: str) -> str:
+    return _PUNCT_RE.sub(" ", ar_normalize(text or "").lower()).strip()
+
+
+def _refresh(faiss_path: str) -> None:
+    path = canned_answers_path(faiss_path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    if path == _state["path"] and mtime == _state["mtime"]:
+        return
+    answers, version = {}, ""
+    if mtime is not None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            version = data.get("index_version", "")
+            answers = {normalize_prompt(a["prompt"]): a for a in data.get("answers", [])}
+        except (OSError, ValueError, KeyError, TypeError):
+            answers = {}
+    _state.update(path=path, mtime=mtime, version=version, answers=answers)
+
+
+def lookup(prompt: str) -> Optional[Dict[str, Any]]:
+    """{"prompt", "lang", "answer", "docs"} for a canned prompt, or None."""
+    if os.getenv("CANNED_ANSWERS", "1") != "1":
+        return None
+    live = retriever.live_store()
+    with _lock:
+        _refresh(live.faiss)
+        entry = _state["answers"].get(normalize_prompt(prompt))
+        version = _state["version"]
+    if entry is None or version != live.version:
+        return None
+    return entry
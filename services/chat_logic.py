@@ -1,12 +1,17 @@
 # services/chat_logic.py
 from __future__ import annotations
 
-from typing import Generator, Union, Iterable, Any, Optional, List, Tuple
+from typing import AsyncGenerator, Generator, Union, Iterable, Any, Dict, Optional, List, Tuple
 import os
 import re
+import time
+import asyncio
+import contextvars
 
-from services.llm_client import call_llm, stream_llm
-from services.retriever import retrieve
+from services.llm_client import call_llm, stream_llm, acall_llm, astream_llm
+from services.retriever import retrieve, embed_query
+from services.answer_cache import CachedAnswer, get_cache
+from services import canned_answers, context_packer, retrieval_client, stream_sanitizer
 
 
 # ======================= System prompts (EN / AR) =======================
@@ -55,100 +60,47 @@ def _detect_lang(text: str) -> str:
 
 def _clean_response(text: Optional[str]) -> str:
     """Strip provider artefacts / special tags."""
-    if not text:
-        return ""
-    text = re.sub(r"\[/?thought\]|<\|[^>]*\|>|/think\b.*|<\|end_of_turn\|>", "", text, flags=re.IGNORECASE)
-    text = re.sub(r"```.*?```", "", text, flags=re.DOTALL)
-    text = re.sub(r"^\s*(Answer|إجابة)\s*:\s*", "", text, flags=re.IGNORECASE)
-    return text.strip()
-
-
-# ---------- Linkification: preserve existing MD, then wrap the rest ----------
-
-_MD_LINK_RE = re.compile(r"\[[^\]]+\]\((?:https?://)[^)]+\)")
-_HTTP_RE     = re.compile(r"(?<!\()https?://[^\s)]+")
-_BARE_DOMAIN_RE = re.compile(
-    r"""(?<!\(|\])                # not right after '(' or ']'
-        \b(
-          (?:www\.)?
-          [A-Za-z0-9.-]+\.[A-Za-z]{2,}   # domain.tld
-          (?:/[^\s)]+)?                  # optional path
-        )\b
-    """,
-    re.VERBOSE,
-)
+    return stream_sanitizer.sanitize(text or "", linkify=False, strip_sources=False)
 
-def _auto_linkify_markdown(s: str) -> str:
-    """
-    1) Temporarily mask existing Markdown links.
-    2) Wrap naked http(s) links and bare domains with Markdown.
-    3) Restore original Markdown links.
-    """
-    if not s:
-        return ""
 
-    # 1) Mask existing Markdown links
-    placeholders: List[str] = []
-    def _mask(m: re.Match) -> str:
-        placeholders.append(m.group(0))
-        return f"§§LINK{len(placeholders)-1}§§"
-    masked = _MD_LINK_RE.sub(_mask, s)
-
-    # 2a) Wrap naked http(s) links
-    def _wrap_http(m: re.Match) -> str:
-        url = m.group(0)
-        label = re.sub(r"^https?://", "", url).split("/")[0]
-        return f"[{label}]({url})"
-    masked = _HTTP_RE.sub(_wrap_http, masked)
-
-    # 2b) Convert bare domains to https://
-    def _wrap_domain(m: re.Match) -> str:
-        url = m.group(1)
-        link = url if url.startswith(("http://", "https://")) else "https://" + url
-        label = re.sub(r"^https?://", "", link).split("/")[0]
-        return f"[{label}]({link})"
-    masked = _BARE_DOMAIN_RE.sub(_wrap_domain, masked)
-
-    # 3) Restore originals
-    def _unmask(m: re.Match) -> str:
-        idx = int(m.group(0)[6:-2])
-        return placeholders[idx]
-    unmasked = re.sub(r"§§LINK\d+§§", _unmask, masked)
-
-    return unmasked
-
-
-def _strip_model_sources(text: str) -> str:
-    """Remove a trailing model-written 'Sources'/'المصادر' section to avoid duplication with UI."""
-    if INLINE_SOURCES:
-        return text
-    # remove from the last occurrence of a heading/bold 'Sources' onward
-    return re.sub(
-        r"(?is)\n+\s*(?:#{1,3}\s*)?(?:\*\*?\s*)?(sources|المصادر)\s*(?:\*\*?)?\s*:?.*$",
-        "",
-        text,
-    ).rstrip()
+# Answer clean-up (tags, ``` blocks, "Answer:" lead-in, Markdown links, model-written
+# "Sources" section) lives in services/stream_sanitizer: it works on token streams
+# chunk by chunk, and the one-shot form gives the same text for full answers.
 
+def _sanitizer() -> stream_sanitizer.StreamSanitizer:
+    return stream_sanitizer.StreamSanitizer(strip_sources=not INLINE_SOURCES)
 
-def _build_context(docs: Iterable[Any]) -> str:
-    """Build the text block fed to the LLM from docs (strings or dicts)."""
-    if not docs:
-        return ""
 
-    def to_text(d: Any) -> str:
-        if isinstance(d, str):
-            body, src = d, None
-        elif isinstance(d, dict):
-            body = d.get("text") or d.get("chunk") or d.get("content") or ""
-            src  = d.get("source")
-        else:
-            body, src = str(d or ""), None
-        body = (body or "").strip()
-        if not body:
-            return ""
-        return f"{body}\n\n(Source: {src})" if src else body
+def _clean_full(text: str) -> str:
+    return stream_sanitizer.sanitize(text or "", strip_sources=not INLINE_SOURCES)
+
 
-    return "\n\n".join(t for t in (to_text(d) for d in docs) if t)
+def _stop_sequences(lang: str) -> Optional[List[str]]:
+    """Backend stop strings at a model-written "Sources" heading (dropped from the answer anyway)."""
+    if INLINE_SOURCES or os.getenv("LLM_STOP_AT_SOURCES", "1") != "1":
+        return None
+    kw = "المصادر" if lang == "ar" else "Sources"
+    return [f"\n{kw}", f"\n**{kw}", f"\n## {kw}", f"\n### {kw}"]
+
+
+def _sources_stop(dl: Optional[_Deadline], tokens: int) -> None:
+    """The stream reached a "Sources" heading: the caller stops reading, which cancels generation upstream."""
+    max_new = _max_new()
+    if dl is not None:
+        dl.sources_stop = tokens
+    print(f"[llm] Sources heading after {tokens} tokens: generation cancelled, "
+          f"up to {max(0, max_new - tokens)} of {max_new} tokens saved")
+
+
+def _build_context(docs: Iterable[Any], query: str = "") -> str:
+    """Build the text block fed to the LLM from docs (strings or dicts), packed to CONTEXT_TOKENS."""
+    if not docs:
+        return ""
+    context, st = context_packer.pack(docs, query)
+    if st["saved"]:
+        print(f"[context] {st['raw_tokens']} -> {st['tokens']} tokens (saved {st['saved']}; "
+              f"{st['chunks']} chunks -> {st['passages']} passages)")
+    return context
 
 
 def _unique_sources(docs: Iterable[Any]) -> List[str]:
@@ -171,86 +123,521 @@ def _no_context_reply(lang: str) -> str:
     )
 
 
-# ============================ Prompt builder ============================
-
-_TOP_K = int(os.getenv("TOP_K", "6"))
+def _busy_reply(lang: str) -> str:
+    return (
+        "The assistant is busy right now. Please try again in a moment."
+        if lang == "en" else
+        "المساعد مشغول حاليًا. يُرجى إعادة المحاولة بعد لحظات."
+    )
 
-def _make_prompt_and_docs(user_input: str) -> Tuple[Optional[str], str, List[dict]]:
-    """
-    Returns: (prompt or None if no docs, lang, docs)
-    Also stores docs in Streamlit session_state['last_docs'] for the UI Sources box.
-    """
-    lang = _detect_lang(user_input)
-    docs = retrieve(user_input, top_k=_TOP_K)
 
-    # Expose docs to the Streamlit UI (to render clickable Sources separately)
+def _expose_docs(docs: List[Any]) -> None:
+    """Expose docs to the Streamlit UI (to render clickable Sources separately)."""
     try:
         import streamlit as st
         st.session_state["last_docs"] = docs
     except Exception:
         pass
 
-    if not docs:
-        return None, lang, []
 
-    context = _build_context(docs)
-    srcs = _unique_sources(docs)
-    src_hint = "\n".join(f"- {s}" for s in srcs) if srcs else "-"
+def _replay(text: str, words_per_chunk: int = 4) -> Generator[str, None, None]:
+    """Simulated streaming for answers we already have (canned / cache hits)."""
+    parts = re.findall(r"\S+\s*|\s+", text or "")
+    for i in range(0, len(parts), words_per_chunk):
+        yield "".join(parts[i:i + words_per_chunk])
 
+
+# ============================ Answer cache ============================
+
+def _cache_lookup(user_input: str, lang: str,
+                  timeout: Optional[float] = None) -> Tuple[Optional[CachedAnswer], Any, str]:
+    """(hit or None, query vector, index version); the vector is reused by retrieve()'s cache."""
+    cache = get_cache()
+    if cache is None:
+        return None, None, ""
+    try:
+        vec, version = embed_query(user_input, timeout=timeout)
+    except Exception:
+        return None, None, ""
+    return cache.lookup(vec, lang, version), vec, version
+
+
+def _cache_store(vec: Any, version: str, user_input: str, lang: str, answer: str, docs: List[Any]) -> None:
+    cache = get_cache()
+    if cache is None or vec is None or not answer.strip() or answer.startswith("⚠️"):
+        return
+    cache.store(vec, CachedAnswer(user_input, lang, version, answer, list(docs)))
+
+
+def answer_cache_stats() -> dict:
+    cache = get_cache()
+    return cache.stats() if cache else {}
+
+
+def _canned_lookup(user_input: str) -> Optional[dict]:
+    """Precomputed answer for a welcome-tile prompt (built at ingest), if current."""
+    try:
+        return canned_answers.lookup(user_input)
+    except Exception:
+        return None
+
+
+# ============================ Prompt builder ============================
+# Static text first, then the per-request part, so every request of one
+# language starts with the same bytes (system prompt + rules + directives)
+# and a prefix-caching backend (vLLM) only prefills the context and question.
+# Keep _prompt_head free of anything request-specific.
+
+def _prompt_head(lang: str) -> str:
     directive = "Respond in English." if lang == "en" else "أجب باللغة العربية."
     end_with_sources = (
         "End your answer with a short '**Sources**' section (use Markdown links).\n"
         if INLINE_SOURCES else
         "Do NOT include a 'Sources' section; the app will render sources below the answer.\n"
     )
-
-    prompt = (
+    return (
         "Use the following context to answer the user accurately. "
-        "Answer ONLY with facts present in the context. If information is missing, say it is not available.\n\n"
+        "Answer ONLY with facts present in the context. If information is missing, say it is not available.\n"
+        f"{directive}\n"
+        f"{end_with_sources}\n"
+    )
+
+
+def _prompt_body(context: str, srcs: List[str], user_input: str) -> str:
+    """Per-request part: context in retrieval-rank order, then the question last."""
+    src_hint = "\n".join(f"- {s}" for s in srcs) if srcs else "-"
+    return (
         f"Context:\n{context}\n\n"
         f"Known sources (for reference only—do not invent new ones):\n{src_hint}\n\n"
-        f"Question: {user_input}\n"
-        f"{directive}\n"
-        f"{end_with_sources}"
+        f"Question: {user_input.strip()}\n"
         "Answer:"
     )
+
+
+_TOP_K = int(os.getenv("TOP_K", "6"))
+
+def _make_prompt_and_docs(user_input: str, budget_ms: Optional[float] = None,
+                          timeout: Optional[float] = None) -> Tuple[Optional[str], str, List[dict]]:
+    """
+    Returns: (prompt or None if no docs, lang, docs)
+    Also stores docs in Streamlit session_state['last_docs'] for the UI Sources box.
+    """
+    lang = _detect_lang(user_input)
+    docs = retrieve(user_input, top_k=_TOP_K, budget_ms=budget_ms, timeout=timeout)
+    _expose_docs(docs)
+
+    if not docs:
+        return None, lang, []
+
+    context = _build_context(docs, user_input)
+    prompt = _prompt_head(lang) + _prompt_body(context, _unique_sources(docs), user_input)
     return prompt, lang, docs
 
 
+# ============================ Deadline ============================
+# One latency budget per request (ANSWER_DEADLINE_MS, 0 = none). Retrieval
+# gets DEADLINE_RETRIEVE_SHARE of it (passed on as retrieve()'s rerank
+# budget); each LLM call gets what is left at that moment minus
+# DEADLINE_RESERVE_MS as its timeout (the budget of the whole call, retries
+# included; for streams also the longest wait for the first or a later chunk).
+# If the model has produced nothing by then, or fails, the user gets an
+# extractive answer from the retrieved chunks instead of an error.
+
+class _Deadline:
+    def __init__(self, total_ms: Optional[float] = None):
+        self.total_ms = float(os.getenv("ANSWER_DEADLINE_MS", "15000")) if total_ms is None else total_ms
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fallback: Optional[str] = None
+        self.sources_stop: Optional[int] = None   # tokens read when the stream was cut at a Sources heading
+
+    @classmethod
+    def start(cls) -> "_Deadline":
+        """Deadline of a user request; also what request_timings() reports on."""
+        dl = cls()
+        _request.set(dl)
+        return dl
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000.0
+
+    def mark(self, stage: str) -> None:
+        """Record the time spent since the previous mark under `stage`."""
+        self.stages[stage] = self.elapsed_ms() - sum(self.stages.values())
+
+    def budget_ms(self, stage: str) -> Optional[float]:
+        if self.total_ms <= 0:
+            return None
+        if stage == "retrieve":
+            return self.total_ms * float(os.getenv("DEADLINE_RETRIEVE_SHARE", "0.3"))
+        # whatever is left now: a second LLM call (expansion) only gets the rest
+        return self.total_ms - self.elapsed_ms() - float(os.getenv("DEADLINE_RESERVE_MS", "300"))
+
+    def left_s(self) -> Optional[float]:
+        """Seconds left before the reply is due (less the reserve); None = no deadline."""
+        left = self.budget_ms("llm")
+        return None if left is None else max(left, 0.0) / 1000.0
+
+    def llm_timeout_s(self) -> Optional[float]:
+        """Timeout for the next LLM call; None = no deadline (client default)."""
+        return self.left_s()
+
+    def exhausted(self) -> bool:
+        left = self.budget_ms("llm")
+        return left is not None and left < float(os.getenv("DEADLINE_MIN_LLM_MS", "1000"))
+
+    def overrun_stage(self) -> str:
+        budget = self.budget_ms("retrieve")
+        if budget is not None and self.stages.get("retrieve", 0.0) > budget:
+            return "retrieve"
+        return "llm"
+
+
+_request: "contextvars.ContextVar[Optional[_Deadline]]" = contextvars.ContextVar("chat_request", default=None)
+
+
+def request_timings() -> Dict[str, Any]:
+    """
+    Stage times (ms) of the last request run in this thread / asyncio task:
+    retrieve (canned + cache lookup, retrieval, packing), first_token (until
+    the first visible answer text), generate (rest of the answer), total,
+    plus the fallback stage if one was taken and, if generation was cancelled
+    at a model-written Sources heading, the tokens read until then.
+    """
+    dl = _request.get()
+    if dl is None:
+        return {}
+    out: Dict[str, Any] = {k: round(v, 1) for k, v in dl.stages.items()}
+    out["total"] = round(sum(dl.stages.values()), 1)
+    out["fallback"] = dl.fallback
+    out["sources_stop"] = dl.sources_stop
+    return out
+
+
+def _source_link(src: str) -> str:
+    if src.startswith(("http://", "https://")):
+        label = re.sub(r"^https?://", "", src).split("/")[0]
+        return f"[{label}]({src})"
+    return src
+
+
+def _extractive_answer(user_input: str, lang: str, docs: List[Any]) -> str:
+    """Best passages of the top chunks, one bullet each with its source - no LLM involved."""
+    per = int(os.getenv("FALLBACK_PASSAGE_TOKENS", "80"))
+    bullets = []
+    for body, src in context_packer.passages(docs)[:int(os.getenv("FALLBACK_PASSAGES", "3"))]:
+        text = context_packer.extract(body, user_input, per)
+        if text:
+            bullets.append(f"- {text}" + (f" ({_source_link(src)})" if src else ""))
+    if not bullets:
+        return _no_context_reply(lang)
+    intro = (
+        "The assistant is taking longer than usual, so here are the most relevant passages from our sources:"
+        if lang == "en" else
+        "يستغرق المساعد وقتًا أطول من المعتاد، وهذه أهم المقاطع ذات الصلة من مصادرنا:"
+    )
+    return intro + "\n\n" + "\n".join(bullets)
+
+
+def _fallback(user_input: str, p: Dict[str, Any], dl: _Deadline, stage: str,
+              error: Optional[BaseException] = None) -> str:
+    budget = dl.budget_ms(stage)
+    if stage == "llm" and budget is not None:   # what the LLM stage had when it started
+        budget = dl.total_ms - dl.stages.get("retrieve", 0.0) - float(os.getenv("DEADLINE_RESERVE_MS", "300"))
+    spent = dl.stages.get(stage, dl.elapsed_ms() - sum(dl.stages.values()))
+    detail = f"{spent:.0f} ms" + (f" of {budget:.0f} ms" if budget is not None else "")
+    dl.fallback = stage
+    print(f"[deadline] extractive fallback: stage={stage} {detail}, total {dl.elapsed_ms():.0f} ms"
+          + (f" ({type(error).__name__}: {error})" if error else ""))
+    return _extractive_answer(user_input, p["lang"], p["docs"])
+
+
+def _llm_text(norm: Dict[str, Any]) -> str:
+    """call_llm() reports HTTP failures as raw_text; turn them back into an exception."""
+    if norm["text"].startswith("[HTTP error]"):
+        raise RuntimeError(norm["text"])
+    return norm["text"]
+
+
 # ============================== Public API ==============================
 
 def process_user_input(user_input: str, stream: bool = False) -> Union[Generator[str, None, None], str]:
-    prompt, lang, docs = _make_prompt_and_docs(user_input)
-    system = SYSTEM_PROMPT_AR if lang == "ar" else SYSTEM_PROMPT_EN
-    max_new = int(os.getenv("MAX_NEW_TOKENS", "800"))
+    if stream:
+        return _stream_answer(user_input)
+    return _answer(user_input)
 
-    # If we have no docs, short-circuit.
-    if not docs or not prompt:
-        msg = _no_context_reply(lang)
-        return msg if not stream else (m for m in [msg])
 
-    if stream:
+def _prepare(user_input: str, dl: Optional[_Deadline] = None) -> Dict[str, Any]:
+    """
+    Everything before the LLM call (blocking: retrieval, embedding). Returns
+    {"answer", "replay"} when no generation is needed (canned / cached / no
+    context / retrieval server busy or failing), else {"prompt", "system",
+    "lang", "docs", "vec", "version"}. Waits on the retrieval server are
+    capped by what is left of the deadline.
+    """
+    dl = dl or _Deadline(0)
+    try:
+        lang = _detect_lang(user_input)
+        canned = _canned_lookup(user_input)
+        if canned:
+            _expose_docs(canned["docs"])
+            return {"answer": canned["answer"], "replay": True}
+        hit, vec, version = _cache_lookup(user_input, lang, timeout=dl.left_s())
+        if hit:
+            _expose_docs(hit.docs)
+            return {"answer": hit.answer, "replay": True}
+
         try:
-            for chunk in stream_llm(prompt, system=system, max_new_tokens=max_new):
-                if chunk:
-                    text = _strip_model_sources(_auto_linkify_markdown(_clean_response(chunk)))
-                    if text:
-                        yield text
-        except Exception as e:
-            yield f"⚠️ Model error: {e}"
-    else:
+            prompt, lang, docs = _make_prompt_and_docs(user_input, budget_ms=dl.budget_ms("retrieve"),
+                                                       timeout=dl.left_s())
+        except (retrieval_client.ServerError, TimeoutError, ConnectionError) as e:
+            print(f"[warn] retrieval failed after {dl.elapsed_ms():.0f} ms ({type(e).__name__}: {e})")
+            return {"answer": _busy_reply(lang), "replay": False}
+        # If we have no docs, short-circuit.
+        if not docs or not prompt:
+            return {"answer": _no_context_reply(lang), "replay": False}
+        return {"prompt": prompt, "system": SYSTEM_PROMPT_AR if lang == "ar" else SYSTEM_PROMPT_EN,
+                "lang": lang, "docs": docs, "vec": vec, "version": version}
+    finally:
+        dl.mark("retrieve")
+
+
+def _ready_chunks(p: Dict[str, Any]) -> List[str]:
+    return list(_replay(p["answer"])) if p["replay"] else [p["answer"]]
+
+
+def _early_answer(user_input: str, p: Dict[str, Any], dl: _Deadline) -> Optional[Dict[str, Any]]:
+    """{"answer", "replay"} when the model is not called: _prepare() answered, or retrieval left no time."""
+    if "answer" in p:
+        return p
+    if dl.exhausted():
+        return {"answer": _fallback(user_input, p, dl, "retrieve"), "replay": True}
+    return None
+
+
+def _max_new() -> int:
+    return int(os.getenv("MAX_NEW_TOKENS", "800"))
+
+
+def _llm_kwargs(system: str, dl: _Deadline, lang: str) -> Dict[str, Any]:
+    """Arguments of every LLM call of a request; the timeout is what the deadline leaves now."""
+    return {"system": system, "max_new_tokens": _max_new(), "timeout": dl.llm_timeout_s(),
+            "stop": _stop_sequences(lang)}
+
+
+def _needs_expansion(cleaned: str) -> bool:
+    return len(cleaned) < 80 and "غير متوف" not in cleaned and "available" not in cleaned.lower()
+
+
+def _expand_prompt(prompt: str) -> str:
+    return f"{prompt}\n\nExpand to ~200–300 words with 5–8 bullet points and proper Markdown links."
+
+
+# A full (non-streamed) answer is one LLM call plus, if it came out too short, an
+# expansion call. _completion() holds that logic once for the sync and async
+# clients: it yields the arguments of each call and is sent back the call's text
+# (or thrown its error); _complete() / _acomplete() only make the calls.
+
+def _completion(prompt: str, system: str, dl: _Deadline, lang: str) -> Generator[Dict[str, Any], str, str]:
+    cleaned = _clean_full((yield {"prompt": prompt, **_llm_kwargs(system, dl, lang)}))
+    # If the answer is too short, expand once (if the deadline leaves room).
+    if _needs_expansion(cleaned) and not dl.exhausted():
         try:
-            result = call_llm(prompt, system=system, max_new_tokens=max_new)["text"]
-            cleaned = _strip_model_sources(_auto_linkify_markdown(_clean_response(result)))
-
-            # If the answer is too short, expand once.
-            if len(cleaned) < 80 and "غير متوف" not in cleaned and "available" not in cleaned.lower():
-                expand_prompt = f"{prompt}\n\nExpand to ~200–300 words with 5–8 bullet points and proper Markdown links."
-                cleaned = _strip_model_sources(
-                    _auto_linkify_markdown(
-                        _clean_response(call_llm(expand_prompt, system=system, max_new_tokens=max_new)["text"])
-                    )
-                )
-            return cleaned
-        except Exception as e:
-            return f"⚠️ Model error: {e}"
+            longer = _clean_full((yield {"prompt": _expand_prompt(prompt), **_llm_kwargs(system, dl, lang)}))
+        except Exception as e:   # keep the first answer rather than an error string
+            print(f"[llm] expansion failed, keeping the short answer ({e})")
+            longer = ""
+        cleaned = longer or cleaned
+    return cleaned
+
+
+def _complete(prompt: str, system: str, dl: Optional[_Deadline] = None, lang: str = "en") -> str:
+    steps = _completion(prompt, system, dl or _Deadline(0), lang)
+    try:
+        call = next(steps)
+        while True:
+            try:
+                text = _llm_text(call_llm(**call))
+            except Exception as e:
+                call = steps.throw(e)
+            else:
+                call = steps.send(text)
+    except StopIteration as done:
+        return done.value
+
+
+class _StreamTurn:
+    """
+    One streamed answer after its LLM call has started, for the sync and async
+    generators alike: clean-up of the model chunks (stop reading once `stopped`,
+    at a "Sources" heading), first-token timing, and what the user gets when
+    the model fails or says nothing.
+    """
+
+    def __init__(self, user_input: str, p: Dict[str, Any], dl: _Deadline):
+        self.user_input, self.p, self.dl = user_input, p, dl
+        self.cleaner = _sanitizer()
+        self.chunks = 0
+        self.parts: List[str] = []
+
+    @property
+    def stopped(self) -> bool:
+        return self.cleaner.stopped
+
+    def feed(self, chunk: str) -> str:
+        self.chunks += 1
+        text = self._shown(self.cleaner.feed(chunk))
+        if self.cleaner.stopped:
+            _sources_stop(self.dl, self.chunks)
+        return text
+
+    def finish(self) -> str:
+        return self._shown(self.cleaner.finish())
+
+    def _shown(self, text: str) -> str:
+        if text:
+            if not self.parts:
+                self.dl.mark("first_token")
+            self.parts.append(text)
+        return text
+
+    def failed(self, error: BaseException) -> List[str]:
+        if self.parts:
+            return [f"⚠️ Model error: {error}"]
+        return list(_replay(_fallback(self.user_input, self.p, self.dl, self.dl.overrun_stage(), error)))
+
+    def completed(self) -> List[str]:
+        """Fallback chunks if the model produced nothing; otherwise caches the answer."""
+        if not self.parts:
+            return list(_replay(_fallback(self.user_input, self.p, self.dl, "llm")))
+        p = self.p
+        _cache_store(p["vec"], p["version"], self.user_input, p["lang"], "".join(self.parts), p["docs"])
+        return []
+
+
+def _stream_answer(user_input: str) -> Generator[str, None, None]:
+    dl = _Deadline.start()
+    p = _prepare(user_input, dl)
+    early = _early_answer(user_input, p, dl)
+    if early:
+        yield from _ready_chunks(early)
+        return
+
+    turn = _StreamTurn(user_input, p, dl)
+    tokens = stream_llm(p["prompt"], **_llm_kwargs(p["system"], dl, p["lang"]))
+    try:
+        for chunk in tokens:
+            text = turn.feed(chunk)
+            if text:
+                yield text
+            if turn.stopped:
+                break
+        text = turn.finish()
+        if text:
+            yield text
+    except Exception as e:
+        yield from turn.failed(e)
+        return
+    finally:
+        tokens.close()   # stops generation upstream (UI went away, or Sources heading reached)
+        dl.mark("generate")
+    yield from turn.completed()
+
+
+def _answer(user_input: str) -> str:
+    dl = _Deadline.start()
+    p = _prepare(user_input, dl)
+    early = _early_answer(user_input, p, dl)
+    if early:
+        return early["answer"]
+    try:
+        cleaned = _complete(p["prompt"], p["system"], dl, p["lang"])
+    except Exception as e:
+        return _fallback(user_input, p, dl, dl.overrun_stage(), e)
+    finally:
+        dl.mark("generate")
+    _cache_store(p["vec"], p["version"], user_input, p["lang"], cleaned, p["docs"])
+    return cleaned
+
+
+def generate_answer(user_input: str) -> Tuple[str, str, List[dict]]:
+    """
+    Full retrieve + LLM run without any answer caching: (answer, lang, docs).
+    Model errors propagate. Also used at ingest time to precompute tile answers.
+    """
+    prompt, lang, docs = _make_prompt_and_docs(user_input)
+    if not docs or not prompt:
+        return _no_context_reply(lang), lang, []
+    return _complete(prompt, SYSTEM_PROMPT_AR if lang == "ar" else SYSTEM_PROMPT_EN, lang=lang), lang, docs
+
+
+# ============================ Async API ============================
+# For an asyncio front end: retrieval (CPU / retrieval-server round trip)
+# runs in a worker thread, generation on the shared async HTTP pool, so one
+# process can hold many concurrent streams.
+
+async def aprocess_user_input(user_input: str, stream: bool = False) -> Union[AsyncGenerator[str, None], str]:
+    """Async process_user_input(): `async for c in await aprocess_user_input(q, stream=True)`."""
+    if stream:
+        return _astream_answer(user_input)
+    dl = _Deadline.start()
+    p = await asyncio.to_thread(_prepare, user_input, dl)
+    early = _early_answer(user_input, p, dl)
+    if early:
+        return early["answer"]
+    try:
+        cleaned = await _acomplete(p["prompt"], p["system"], dl, p["lang"])
+    except Exception as e:
+        return _fallback(user_input, p, dl, dl.overrun_stage(), e)
+    finally:
+        dl.mark("generate")
+    _cache_store(p["vec"], p["version"], user_input, p["lang"], cleaned, p["docs"])
+    return cleaned
+
+
+async def _acomplete(prompt: str, system: str, dl: _Deadline, lang: str) -> str:
+    """_complete() on the async client."""
+    steps = _completion(prompt, system, dl, lang)
+    try:
+        call = next(steps)
+        while True:
+            try:
+                text = _llm_text(await acall_llm(**call))
+            except Exception as e:
+                call = steps.throw(e)
+            else:
+                call = steps.send(text)
+    except StopIteration as done:
+        return done.value
+
+
+async def _astream_answer(user_input: str) -> AsyncGenerator[str, None]:
+    dl = _Deadline.start()
+    p = await asyncio.to_thread(_prepare, user_input, dl)
+    early = _early_answer(user_input, p, dl)
+    if early:
+        for text in _ready_chunks(early):
+            yield text
+        return
+
+    turn = _StreamTurn(user_input, p, dl)
+    tokens = astream_llm(p["prompt"], **_llm_kwargs(p["system"], dl, p["lang"]))
+    try:
+        async for chunk in tokens:
+            text = turn.feed(chunk)
+            if text:
+                yield text
+            if turn.stopped:
+                break
+        text = turn.finish()
+        if text:
+            yield text
+    except Exception as e:
+        for text in turn.failed(e):
+            yield text
+        return
+    finally:
+        await tokens.aclose()
+        dl.mark("generate")
+    for text in turn.completed():
+        yield text
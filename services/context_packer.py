@@ -0,0 +1,195 @@
+# services/context_packer.py
+"""
+Packs retrieved chunks into the LLM context under a token budget
+(CONTEXT_TOKENS, default 1500; 0 = no budget, chunks are joined as-is).
+
+  1. chunks of the same source that overlap (ingest cuts 1200-char windows
+     with a 150-char overlap) are merged back into one passage, kept at the
+     rank of its best chunk
+  2. passages longer than CONTEXT_PASSAGE_TOKENS are cut down to the
+     sentences sharing the most terms with the question (original order kept)
+  3. passages are added best-ranked first until the budget is spent; the
+     one that does not fit is trimmed the same way instead of dropped
+
+Tokens are counted with CONTEXT_TOKENIZER (a Hugging Face tokenizer name or
+path; needs `transformers`) when set, else estimated from character classes.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import os, re, math
+
+from core.lexical import tokenize
+
+
+# ---- Token counting ----
+
+_ARABIC_RE = re.compile(r"[\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF]")
+_SPACE_RE = re.compile(r"\s")
+_counter: Optional[Callable[[str], int]] = None
+
+
+def _approx_tokens(text: str) -> int:
+    """BPE-ish estimate: ~4 chars/token for Latin text, ~2.5 for Arabic script."""
+    if not text:
+        return 0
+    arabic = len(_ARABIC_RE.findall(text))
+    spaces = len(_SPACE_RE.findall(text))
+    return math.ceil(arabic / 2.5 + (len(text) - arabic - spaces) / 4.0 + spaces * 0.1)
+
+
+def count_tokens(text: str) -> int:
+    global _counter
+    if _counter is None:
+        name = os.getenv("CONTEXT_TOKENIZER", "")
+        _counter = _approx_tokens
+        if name:
+            try:
+                from transformers import AutoTokenizer
+                tok = AutoTokenizer.from_pretrained(name)
+                _counter = lambda s: len(tok.encode(s, add_special_tokens=False)) if s else 0
+            except Exception as e:
+                print(f"[warn] CONTEXT_TOKENIZER={name} unavailable ({e}); estimating tokens")
+    return _counter(text)
+
+
+# ---- Passages ----
+
+def _doc_parts(d: Any) -> Tuple[str, Optional[str]]:
+    if isinstance(d, str):
+        return d.strip(), None
+    if isinstance(d, dict):
+        body = d.get("text") or d.get("chunk") or d.get("content") or ""
+        return (body or "").strip(), d.get("source")
+    return str(d or "").strip(), None
+
+
+def _chunk_parts(docs: Iterable[Any]) -> List[Tuple[str, Optional[str]]]:
+    return [(b, s) for b, s in (_doc_parts(d) for d in docs or []) if b]
+
+
+def format_passage(body: str, src: Optional[str]) -> str:
+    return f"{body}\n\n(Source: {src})" if src else body
+
+
+def _overlap(a: str, b: str, min_chars: int) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if < min_chars)."""
+    for n in range(min(len(a), len(b)) - 1, min_chars - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def merge_overlapping(parts: List[Tuple[str, Optional[str]]], min_chars: int = 40) -> List[Tuple[str, Optional[str]]]:
+    """Stitch same-source chunks whose edges overlap; each result keeps its best rank."""
+    out: List[List[Any]] = []   # [body, src]
+    for body, src in parts:
+        placed = False
+        for p in out:
+            if src is None or p[1] != src:
+                continue
+            if body in p[0]:
+                placed = True
+            elif p[0] in body:
+                p[0] = body
+                placed = True
+            else:
+                n = _overlap(p[0], body, min_chars)
+                if n:
+                    p[0] = p[0] + body[n:]
+                    placed = True
+                else:
+                    n = _overlap(body, p[0], min_chars)
+                    if n:
+                        p[0] = body + p[0][n:]
+                        placed = True
+            if placed:
+                break
+        if not placed:
+            out.append([body, src])
+    return [(b, s) for b, s in out]
+
+
+def passages(docs: Iterable[Any]) -> List[Tuple[str, Optional[str]]]:
+    """(body, source) of the retrieved chunks, best-ranked first, overlapping ones merged (step 1)."""
+    return merge_overlapping(_chunk_parts(docs))
+
+
+# ---- Sentence extraction ----
+
+_SENT_RE = re.compile(r"[^.!?؟\n]+(?:[.!?؟]+|\n+|$)")
+
+
+def _sentences(text: str) -> List[str]:
+    return [s for s in (m.group(0).strip() for m in _SENT_RE.finditer(text)) if s]
+
+
+def extract(text: str, query: str, budget: int) -> str:
+    """Query-relevant sentences of text within `budget` tokens, in their original order."""
+    sents = _sentences(text)
+    if not sents:
+        return ""
+    q = set(tokenize(query))
+    scored = []
+    for i, s in enumerate(sents):
+        terms = set(tokenize(s))
+        hits = len(q & terms)
+        # ties: earlier sentences first (leads usually carry the topic)
+        scored.append((-hits, i, s))
+    keep, used = [], 0
+    for _, i, s in sorted(scored):
+        n = count_tokens(s) + 1
+        if used + n > budget:
+            continue
+        keep.append(i)
+        used += n
+    if not keep:
+        # a single sentence larger than the budget: hard cut at the word boundary
+        words, out = sents[sorted(scored)[0][1]].split(), []
+        for w in words:
+            if count_tokens(" ".join(out + [w])) > budget:
+                break
+            out.append(w)
+        return " ".join(out) + (" …" if out else "")
+    keep.sort()
+    pieces, prev = [], -1
+    for i in keep:
+        if prev >= 0 and i != prev + 1:
+            pieces.append("…")
+        pieces.append(sents[i])
+        prev = i
+    return " ".join(pieces)
+
+
+# ---- Packing ----
+
+def pack(docs: Iterable[Any], query: str = "", budget: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+    """(context, stats) - stats: raw_tokens, tokens, saved, chunks, passages."""
+    parts = _chunk_parts(docs)
+    raw = "\n\n".join(format_passage(b, s) for b, s in parts)
+    if budget is None:
+        budget = int(os.getenv("CONTEXT_TOKENS", "1500"))
+    raw_tokens = count_tokens(raw)
+    if budget <= 0 or not parts:
+        return raw, {"raw_tokens": raw_tokens, "tokens": raw_tokens, "saved": 0,
+                     "chunks": len(parts), "passages": len(parts)}
+
+    passage_max = int(os.getenv("CONTEXT_PASSAGE_TOKENS", "350"))
+    min_tokens = int(os.getenv("CONTEXT_MIN_TOKENS", "40"))   # smaller leftovers are not worth a passage
+    out: List[str] = []
+    used = 0
+    for body, src in merge_overlapping(parts):
+        overhead = count_tokens(format_passage("", src)) + 2
+        left = budget - used - overhead
+        if left < min_tokens:
+            break
+        n = count_tokens(body)
+        if n > min(passage_max, left):
+            body = extract(body, query, min(passage_max, left))
+            if not body:
+                continue
+            n = count_tokens(body)
+        out.append(format_passage(body, src))
+        used += n + overhead
+    context = "\n\n".join(out)
+    tokens = count_tokens(context)
+    return context, {"raw_tokens": raw_tokens, "tokens": tokens, "saved": max(0, raw_tokens - tokens),
+                     "chunks": len(parts), "passages": len(out)}
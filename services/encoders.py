@@ -0,0 +1,95 @@
+# services/encoders.py
+"""
+Query-encoder backends for the retriever. Both expose the subset of
+BGEM3FlagModel.encode() the retriever uses:
+    encode(texts, return_dense=True, return_sparse=False) ->
+        {"dense_vecs": np.ndarray, "lexical_weights": [{token_id: weight}, ...]}
+
+EMBED_BACKEND=torch  BGEM3FlagModel (fp32) - default
+EMBED_BACKEND=onnx   int8 ONNX export run through onnxruntime
+                     (build it with: python -m tools.export_onnx_encoder)
+"""
+from typing import Any, Dict, List, Optional
+import os
+
+import numpy as np
+
+
+def backend_name() -> str:
+    return (os.getenv("EMBED_BACKEND") or "torch").lower()
+
+
+def onnx_dir() -> str:
+    return os.getenv("ONNX_MODEL_DIR") or (os.getenv("BGE_MODEL_PATH") or "bge-m3").rstrip("/\\") + "-onnx"
+
+
+class OnnxEncoder:
+    """
+    BGE-M3 dense = L2-normalized CLS state; sparse = relu(sparse_linear(h)) per
+    token, max-pooled per token id (special tokens dropped), mirroring FlagEmbedding.
+    """
+
+    def __init__(self, model_dir: str, threads: Optional[int] = None, max_length: int = 512):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = int(threads or os.getenv("ONNX_THREADS") or os.getenv("OMP_NUM_THREADS") or 4)
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        path = os.path.join(model_dir, "model.int8.onnx")
+        if not os.path.exists(path):
+            path = os.path.join(model_dir, "model.onnx")
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+        self.special_ids = set(self.tokenizer.all_special_ids)
+        sp = os.path.join(model_dir, "sparse_linear.npz")
+        self.sparse_w: Optional[np.ndarray] = None
+        self.sparse_b: Optional[np.ndarray] = None
+        if os.path.exists(sp):
+            z = np.load(sp)
+            self.sparse_w, self.sparse_b = z["weight"], z["bias"]
+
+    def encode(self, texts: List[str], batch_size: int = 16, return_dense: bool = True,
+               return_sparse: bool = False, **kwargs: Any) -> Dict[str, Any]:
+        dense: List[np.ndarray] = []
+        lexical: List[Dict[str, float]] = []
+        for s in range(0, len(texts), batch_size):
+            batch = texts[s:s + batch_size]
+            enc = self.tokenizer(batch, padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            feed = {k: v.astype("int64") for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feed)[0]            # (B, T, H)
+            cls = hidden[:, 0]
+            dense.append(cls / np.linalg.norm(cls, axis=1, keepdims=True).clip(1e-12))
+            if return_sparse:
+                lexical.extend(self._lexical(hidden, enc["input_ids"], enc["attention_mask"]))
+        out: Dict[str, Any] = {"dense_vecs": np.vstack(dense).astype("float32") if dense else np.zeros((0, 0), "float32")}
+        if return_sparse:
+            if self.sparse_w is None:
+                raise RuntimeError(f"sparse_linear.npz missing in {onnx_dir()}; re-run tools.export_onnx_encoder")
+            out["lexical_weights"] = lexical
+        return out
+
+    def _lexical(self, hidden: np.ndarray, ids: np.ndarray, mask: np.ndarray) -> List[Dict[str, float]]:
+        w = np.maximum(hidden @ self.sparse_w.T + self.sparse_b, 0.0)[..., 0]   # (B, T)
+        rows = []
+        for b in range(len(ids)):
+            row: Dict[str, float] = {}
+            for t, tok in enumerate(ids[b]):
+                tok = int(tok)
+                if not mask[b, t] or tok in self.special_ids or w[b, t] <= 0:
+                    continue
+                if w[b, t] > row.get(str(tok), 0.0):
+                    row[str(tok)] = float(w[b, t])
+            rows.append(row)
+        return rows
+
+
+def load_encoder() -> Any:
+    if backend_name() == "onnx":
+        return OnnxEncoder(onnx_dir())
+    from FlagEmbedding import BGEM3FlagModel
+    return BGEM3FlagModel(os.getenv("BGE_MODEL_PATH") or "BAAI/bge-m3", use_fp16=False)
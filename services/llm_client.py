@@ -1,6 +1,11 @@
 # services/llm_client.py
-from typing import Optional, Dict, Any, Generator
-import os, json, requests
+from typing import Optional, Dict, Any, AsyncGenerator, Generator, List, Tuple
+import os, re, json, time, random, asyncio, weakref, threading, requests
+from collections import Counter, deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+
+from services.llm_router import Endpoint, endpoint_urls, get_router
 
 def _get_cfg() -> Dict[str, str]:
     return {
@@ -10,6 +15,10 @@ def _get_cfg() -> Dict[str, str]:
         "api_key": os.getenv("LLMAR_API_KEY", ""),
     }
 
+def _require_endpoints() -> None:
+    if not endpoint_urls():
+        raise RuntimeError("LLMAR_API_URL is not set.")
+
 def _headers() -> Dict[str, str]:
     cfg = _get_cfg()
     h = {"Content-Type": "application/json"}
@@ -41,47 +50,724 @@ def _eff_max(max_new_tokens: Optional[int], max_tokens: Optional[int]) -> int:
     try: return int(os.getenv("MAX_NEW_TOKENS", "800"))
     except Exception: return 800
 
+# ---- Pooled session ----
+# One keep-alive Session per process (LLM_POOL_SIZE connections per host), so
+# questions reuse TCP/TLS connections instead of handshaking every time.
+# Connection failures and 502/503/504 are retried LLM_RETRIES times with
+# jittered exponential backoff; read timeouts are not (the server may still
+# be generating).
+_RETRY_STATUS = {502, 503, 504}
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_stats: Counter = Counter()
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool = int(os.getenv("LLM_POOL_SIZE", "16"))
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool, max_retries=0)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+def _timeouts(timeout: Optional[float]) -> Tuple[float, float]:
+    """(connect, read) seconds; an explicit timeout overrides the read timeout."""
+    connect = float(os.getenv("LLM_CONNECT_TIMEOUT", "3.05"))
+    if timeout is None:
+        return connect, float(os.getenv("LLM_READ_TIMEOUT", "20"))
+    read = max(float(timeout), 0.05)
+    return min(connect, read), read
+
+def _deadline(timeout: Optional[float]) -> Optional[float]:
+    """An explicit timeout is the budget of the whole call, retries included."""
+    return None if timeout is None else time.monotonic() + float(timeout)
+
+def _left(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+def _no_time_for(deadline: Optional[float], pause: float) -> bool:
+    """True if a retry after `pause` would start with (almost) nothing of the budget left."""
+    return deadline is not None and deadline - time.monotonic() - pause < 0.1
+
+def _read_timeout(e: BaseException) -> bool:
+    """Read timeouts (requests, urllib3 inside iter_content, httpx) mean slow, not down:
+    they carry no health verdict for the router."""
+    return any("ReadTimeout" in type(x).__name__ for x in (e, *getattr(e, "args", ())))
+
+def _backoff(attempt: int) -> float:
+    base = float(os.getenv("LLM_BACKOFF_S", "0.25"))
+    return random.uniform(0, min(4.0, base * (2 ** attempt)))   # full jitter
+
+def _post(payload: Dict[str, Any], timeout: Optional[float] = None, stream: bool = False,
+          ep: Optional[Endpoint] = None) -> Tuple[requests.Response, Endpoint]:
+    """
+    POST through the pooled session to a routed endpoint (services/llm_router);
+    retries go to another replica when there is one. Raises
+    requests.RequestException. The caller owns get_router().end(ep, ...).
+    """
+    router = get_router()
+    retries = int(os.getenv("LLM_RETRIES", "2"))
+    deadline = _deadline(timeout)
+    attempt = 0
+    tried: List[Endpoint] = []
+    while True:
+        ep = ep or router.pick(exclude=tried)
+        router.begin(ep)
+        _stats["requests"] += 1
+        pause = _backoff(attempt)
+        try:
+            r = _get_session().post(ep.url, headers=_headers(), json=payload,
+                                    timeout=_timeouts(_left(deadline)), stream=stream)
+        except requests.RequestException as e:
+            router.end(ep, ok=None if _read_timeout(e) else False)
+            # connection errors (incl. connect timeouts, resets) are retried; read timeouts are not
+            if not isinstance(e, requests.ConnectionError) or attempt >= retries or _no_time_for(deadline, pause):
+                _stats["failed"] += 1
+                raise
+        else:
+            if r.status_code not in _RETRY_STATUS or attempt >= retries or _no_time_for(deadline, pause):
+                if r.status_code >= 400:
+                    _stats["failed"] += 1
+                    router.end(ep, ok=r.status_code < 500)
+                    r.close()
+                    r.raise_for_status()
+                return r, ep
+            r.close()
+            router.end(ep, ok=False)
+        tried.append(ep)
+        ep = None
+        _stats["retries"] += 1
+        time.sleep(pause)
+        attempt += 1
+
+def llm_stats() -> Dict[str, Any]:
+    """Request/retry counters plus connection reuse from the urllib3 pools."""
+    out: Dict[str, Any] = dict(_stats)
+    conns = reqs = 0
+    if _session is not None:
+        for adapter in {id(a): a for a in _session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                try:
+                    pool = pools[key]
+                except KeyError:
+                    continue
+                conns += pool.num_connections
+                reqs += pool.num_requests
+    out["connections_opened"] = conns
+    out["reused_requests"] = max(0, reqs - conns)
+    out["reuse_rate"] = round(1 - conns / reqs, 3) if reqs else 0.0
+    out["router"] = get_router().stats()
+    return out
+
+def _payload(prompt: str, system: Optional[str], temperature: float, max_new_tokens: Optional[int],
+             max_tokens: Optional[int], extra: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    LLM_PROMPT_MODE=text: one prompt string, system block first.
+    LLM_PROMPT_MODE=chat: OpenAI-style "messages" (vLLM /v1/chat/completions),
+    so the server applies the model's own chat template.
+    stop=[...] is sent as LLM_STOP_FIELD (default "stop"; empty = not sent).
+    Either way the system prompt leads, byte-identical across requests, which
+    lets a prefix cache reuse it.
+    """
+    cfg = _get_cfg()
+    payload: Dict[str, Any] = {
+        "llm_model_name": cfg["model"],
+        "llm_model_version": cfg["version"],
+        "temperature": float(temperature),
+        "max_tokens": _eff_max(max_new_tokens, max_tokens),
+    }
+    if os.getenv("LLM_PROMPT_MODE", "text").lower() == "chat":
+        payload["messages"] = ([{"role": "system", "content": system}] if system else []) + \
+            [{"role": "user", "content": prompt}]
+        if cfg["model"]:
+            payload["model"] = cfg["model"]
+    else:
+        payload["prompt"] = prompt if not system else f"[SYSTEM]\n{system}\n[/SYSTEM]\n{prompt}"
+    stop = extra.pop("stop", None)
+    stop_field = os.getenv("LLM_STOP_FIELD", "stop")
+    if stop and stop_field:
+        payload[stop_field] = list(stop)
+    payload.update({k: v for k, v in extra.items() if v is not None})
+    return payload
+
 def call_llm(
     prompt: str,
     system: Optional[str] = None,
     temperature: float = 0.2,
     max_new_tokens: Optional[int] = None,
     max_tokens: Optional[int] = None,
-    timeout: int = 20,
+    timeout: Optional[float] = None,
     **kwargs: Any,
 ) -> Dict[str, Any]:
-    cfg = _get_cfg()
-    if not cfg["url"]:
-        raise RuntimeError("LLMAR_API_URL is not set.")
-    full_prompt = prompt if not system else f"[SYSTEM]\n{system}\n[/SYSTEM]\n{prompt}"
-    payload: Dict[str, Any] = {
-        "prompt": full_prompt,
-        "llm_model_name": cfg["model"],
-        "llm_model_version": cfg["version"],
-        "temperature": float(temperature),
-        "max_tokens": _eff_max(max_new_tokens, max_tokens),
-    }
-    payload.update({k: v for k, v in kwargs.items() if v is not None})
+    _require_endpoints()
+    payload = _payload(prompt, system, temperature, max_new_tokens, max_tokens, kwargs)
+    t0 = time.perf_counter()
     try:
-        r = requests.post(cfg["url"], headers=_headers(), json=payload, timeout=timeout)
-        r.raise_for_status()
+        r, ep = _post(payload, timeout=timeout)
+        get_router().end(ep, ok=True, latency_ms=(time.perf_counter() - t0) * 1000.0)
         try: data = r.json()
         except ValueError: data = {"raw_text": r.text}
         return _normalize_response(data)
     except requests.RequestException as e:
         return _normalize_response({"raw_text": f"[HTTP error] {e}", "text": ""})
 
+# ---- Streaming ----
+# LLM_STREAM=1 asks the server for an incremental response ("stream": true)
+# and accepts SSE ("data: {...}" ... "data: [DONE]") or JSON lines ("\n" or
+# "\0" separated). Bytes are split into lines before decoding, so a multi-byte
+# Arabic character cut across network reads is never garbled. Servers that
+# send cumulative text (vLLM's legacy /generate) are turned into deltas; a
+# plain JSON reply is yielded once. Each request records time-to-first-token
+# and tokens/s (stream_stats()).
+_LINE_SPLIT = re.compile(rb"\r?\n|\x00")
+_stream_log: deque = deque(maxlen=int(os.getenv("LLM_STREAM_STATS_N", "500")))
+
+def _event_payload(line: bytes) -> Optional[str]:
+    """JSON text of one SSE/JSON-lines record; "" for [DONE]; None to skip the line."""
+    line = line.strip()
+    if not line or line.startswith(b":"):
+        return None
+    if line.startswith(b"data:"):
+        data = line[5:].strip()
+        return "" if data == b"[DONE]" else data.decode("utf-8", "replace")
+    if line.split(b":", 1)[0] in (b"event", b"id", b"retry"):
+        return None
+    return line.decode("utf-8", "replace")
+
+def _event_text(obj: Any) -> Tuple[str, str]:
+    """(text, kind): kind "delta" for OpenAI choices / TGI token events (always
+    increments), "full" for vLLM /generate {"text": [...]} (whole text so far),
+    "text" for anything else."""
+    if isinstance(obj, dict):
+        choices = obj.get("choices")
+        if isinstance(choices, list) and choices:
+            c = choices[0] or {}
+            return (c.get("delta") or {}).get("content") or c.get("text") or "", "delta"
+        tok = obj.get("token")
+        if isinstance(tok, dict):                 # TGI
+            return ("" if tok.get("special") else tok.get("text") or ""), "delta"
+        if isinstance(obj.get("text"), list):     # vLLM /generate: {"text": [...]}
+            text = obj["text"][0] if obj["text"] else ""
+            return (text if isinstance(text, str) else ""), "full"
+    text = _normalize_response(obj)["text"]
+    return (text if isinstance(text, str) else ""), "text"
+
+def _event_tokens(obj: Any) -> Optional[int]:
+    if isinstance(obj, dict):
+        usage = obj.get("usage") or {}
+        if isinstance(usage, dict) and usage.get("completion_tokens"):
+            return int(usage["completion_tokens"])
+        details = obj.get("details") or {}
+        if isinstance(details, dict) and details.get("generated_tokens"):
+            return int(details["generated_tokens"])
+    return None
+
+class _StreamDecoder:
+    """Incremental bytes -> text deltas for one streamed response (sync and async clients)."""
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.buf = b""
+        self.acc = ""                         # text received so far
+        self.cumulative = False               # events carry the whole text so far
+        self.usage: Optional[int] = None
+        self.events = 0
+        self.done = False                     # saw [DONE]
+
+    @property
+    def tokens(self) -> int:
+        return self.usage or self.events
+
+    def feed(self, block: bytes) -> List[str]:
+        self.buf += block
+        *lines, self.buf = _LINE_SPLIT.split(self.buf)
+        return self._deltas(lines)
+
+    def flush(self) -> List[str]:
+        lines, self.buf = [self.buf], b""
+        return self._deltas(lines)
+
+    def _deltas(self, lines: List[bytes]) -> List[str]:
+        out = []
+        for line in lines:
+            if self.done:
+                break
+            delta = self._line(line)
+            if delta:
+                out.append(delta)
+        return out
+
+    def _line(self, line: bytes) -> str:
+        data = _event_payload(line)
+        if data is None:
+            return ""
+        if data == "":
+            self.done = True
+            return ""
+        try:
+            obj: Any = json.loads(data)
+        except ValueError:
+            obj = data + "\n"
+        self.usage = _event_tokens(obj) or self.usage
+        text, kind = _event_text(obj)
+        if not text:
+            return ""
+        # Deltas that happen to extend the text so far (" ", " The") are still deltas:
+        # only vLLM's /generate shapes switch to cumulative decoding.
+        if kind != "delta" and self.prompt and text.startswith(self.prompt):   # /generate echoes the prompt
+            text = text[len(self.prompt):]
+            self.cumulative = True
+        elif kind == "full":
+            self.cumulative = True
+        delta = text[len(self.acc):] if self.cumulative else text
+        self.acc = text if self.cumulative else self.acc + text
+        if delta:
+            self.events += 1
+        return delta
+
+def _is_plain_json(content_type: str) -> bool:
+    return content_type.split(";")[0].strip() == "application/json"
+
+def _record_stream(t0: float, t_first: Optional[float], tokens: int, cancelled: bool) -> None:
+    end = time.perf_counter()
+    gen_s = end - (t_first or end)
+    _stream_log.append({
+        "ttft_ms": round((t_first - t0) * 1000.0, 1) if t_first else None,
+        "total_ms": round((end - t0) * 1000.0, 1),
+        "tokens": tokens,
+        "tok_s": round(tokens / gen_s, 1) if gen_s > 0 and tokens > 1 else None,
+        "cancelled": cancelled,
+    })
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+def stream_stats() -> Dict[str, Any]:
+    """TTFT / throughput over the last LLM_STREAM_STATS_N streamed requests."""
+    recs = list(_stream_log)
+    ttft = [r["ttft_ms"] for r in recs if r["ttft_ms"] is not None]
+    tps = [r["tok_s"] for r in recs if r["tok_s"]]
+    return {
+        "requests": len(recs),
+        "cancelled": sum(1 for r in recs if r["cancelled"]),
+        "ttft_p50_ms": _pct(ttft, 0.5), "ttft_p95_ms": _pct(ttft, 0.95),
+        "tok_s_mean": round(sum(tps) / len(tps), 1) if tps else None,
+        "last": recs[-1] if recs else None,
+    }
+
 def stream_llm(
     prompt: str,
     system: Optional[str] = None,
     temperature: float = 0.2,
     max_new_tokens: Optional[int] = None,
     max_tokens: Optional[int] = None,
-    timeout: int = 20,
+    timeout: Optional[float] = None,
+    cancel: Optional[threading.Event] = None,
     **kwargs: Any,
 ) -> Generator[str, None, None]:
-    # Fallback to one-shot (implement SSE here later if your API supports it)
-    norm = call_llm(prompt, system=system, temperature=temperature,
-                    max_new_tokens=max_new_tokens, max_tokens=max_tokens,
-                    timeout=timeout, **kwargs)
-    yield norm["text"]
+    """
+    Yields text deltas as the server produces them. Generation stops (and the
+    HTTP response is closed, freeing the server slot) when `cancel` is set or
+    the consumer closes / drops the generator, e.g. a Streamlit rerun.
+    """
+    if os.getenv("LLM_STREAM", "1") != "1":
+        norm = call_llm(prompt, system=system, temperature=temperature,
+                        max_new_tokens=max_new_tokens, max_tokens=max_tokens,
+                        timeout=timeout, **kwargs)
+        yield norm["text"]
+        return
+
+    _require_endpoints()
+    payload = _payload(prompt, system, temperature, max_new_tokens, max_tokens, kwargs)
+    payload["stream"] = True
+    delay = get_router().hedge_delay_s()
+    if delay is None:
+        yield from _stream_one(payload, timeout, cancel)
+    else:
+        yield from _hedged_stream(payload, timeout, cancel, delay)
+
+def _stream_one(payload: Dict[str, Any], timeout: Optional[float], cancel: Optional[threading.Event],
+                ep: Optional[Endpoint] = None, attempt: Any = None) -> Generator[str, None, None]:
+    """One streamed request; `attempt.r` is set to the response so a hedge can abort it."""
+    router = get_router()
+    t0 = time.perf_counter()
+    t_first: Optional[float] = None
+    dec = _StreamDecoder(payload.get("prompt", ""))
+    completed = errored = False
+    r, ep = _post(payload, timeout=timeout, stream=True, ep=ep)
+    if attempt is not None:
+        attempt.r = r
+
+    def first_token() -> None:
+        nonlocal t_first
+        if t_first is None:
+            t_first = time.perf_counter()
+            router.observe_ttft((t_first - t0) * 1000.0)
+
+    try:
+        if _is_plain_json(r.headers.get("Content-Type", "")):
+            # server ignored "stream": one-shot JSON
+            text = _normalize_response(r.json())["text"]
+            if text:
+                first_token()
+                dec.events = 1
+                yield text
+            completed = True
+            return
+        for block in _iter_blocks(r):
+            if cancel is not None and cancel.is_set():
+                break
+            for delta in dec.feed(block):
+                first_token()
+                yield delta
+            if dec.done:
+                break
+        else:
+            for delta in dec.flush():
+                first_token()
+                yield delta
+        completed = dec.done or not (cancel is not None and cancel.is_set())
+    except Exception as e:
+        if cancel is not None and cancel.is_set():
+            return          # aborted by a hedge: the closed response raised
+        errored = not _read_timeout(e)
+        raise
+    finally:
+        r.close()
+        router.end(ep, ok=False if errored else (True if t_first or completed else None),
+                   latency_ms=(t_first - t0) * 1000.0 if t_first else None)
+        _record_stream(t0, t_first, dec.tokens, cancelled=not completed)
+
+def _iter_blocks(r: requests.Response) -> Generator[bytes, None, None]:
+    """Body bytes as they arrive. iter_content(None) only does that for chunked
+    responses; a close-delimited stream would be read to EOF in one go. read1 hands
+    back the bytes off the wire, so it is only used when there is no Content-Encoding;
+    a compressed body is decoded by urllib3 in small reads instead."""
+    raw = r.raw
+    if getattr(raw, "chunked", True) or not hasattr(raw, "read1"):
+        yield from r.iter_content(chunk_size=None)
+        return
+    if r.headers.get("Content-Encoding", "identity").strip().lower() != "identity":
+        yield from raw.stream(1024, decode_content=True)
+        return
+    while True:
+        block = raw.read1(65536)
+        if not block:
+            return
+        yield block
+
+class _Attempt:
+    """One leg of a hedged stream; its first token is awaited on a helper thread."""
+
+    def __init__(self, payload: Dict[str, Any], timeout: Optional[float], ep: Endpoint):
+        self.ep = ep
+        self.cancel = threading.Event()
+        self.r: Optional[requests.Response] = None
+        self.gen = _stream_one(payload, timeout, self.cancel, ep=ep, attempt=self)
+        self.first: Future = Future()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._first, name="llm-hedge", daemon=True).start()
+
+    def _first(self) -> None:
+        try:
+            token = next(self.gen)
+        except StopIteration:
+            token = None
+        except BaseException as e:
+            self.first.set_exception(e)
+            return
+        with self._lock:
+            if self.cancel.is_set():
+                self.gen.close()     # lost the race while producing its first token
+            self.first.set_result(token)
+
+    def abort(self) -> None:
+        with self._lock:
+            self.cancel.set()
+            if self.first.done():
+                self.gen.close()
+        if self.r is not None:
+            try:
+                self.r.close()   # unblocks a read still waiting for the first bytes
+            except Exception:
+                pass
+
+def _hedged_stream(payload: Dict[str, Any], timeout: Optional[float], cancel: Optional[threading.Event],
+                   delay: float) -> Generator[str, None, None]:
+    """Start on one replica; if no token within `delay`, race a second one and keep the first to answer."""
+    router = get_router()
+    legs = [_Attempt(payload, timeout, router.pick())]
+    winner: Optional[_Attempt] = None
+    try:
+        done, _ = wait([legs[0].first], timeout=delay)
+        if not done:
+            other = router.pick(exclude=[legs[0].ep])
+            if other is not legs[0].ep:
+                router.counters["hedged"] += 1
+                legs.append(_Attempt(payload, timeout, other))
+        pending = list(legs)
+        error: Optional[BaseException] = None
+        while pending and winner is None:
+            wait([a.first for a in pending], timeout=0.25, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                return
+            for a in list(pending):
+                if not a.first.done():
+                    continue
+                pending.remove(a)
+                if a.first.exception() is not None:
+                    error = a.first.exception()
+                    continue
+                winner = a
+                break
+        if winner is None:
+            raise error or RuntimeError("LLM request failed")
+        if winner is not legs[0]:
+            router.counters["hedge_won"] += 1
+        for a in legs:
+            if a is not winner:
+                a.abort()
+        token = winner.first.result()
+        if token is None:
+            return
+        yield token
+        for token in winner.gen:
+            if cancel is not None and cancel.is_set():
+                break
+            yield token
+    finally:
+        for a in legs:
+            if a is not winner:
+                a.abort()
+        if winner is not None:
+            winner.gen.close()
+
+# ---- Async API ----
+# acall_llm / astream_llm mirror call_llm / stream_llm on httpx.AsyncClient, so
+# an event loop can hold hundreds of generations open without a thread each.
+# One client (connection pool of LLM_ASYNC_POOL_SIZE) per event loop; same
+# timeouts, retry policy, counters and stream stats as the sync client.
+# Cancelling the awaiting task, setting `cancel`, or `aclose()`-ing the
+# generator closes the response.
+_aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+def _aclient() -> Any:
+    import httpx
+    loop = asyncio.get_running_loop()
+    client = _aclients.get(loop)
+    if client is None or client.is_closed:
+        pool = int(os.getenv("LLM_ASYNC_POOL_SIZE", "200"))
+        client = httpx.AsyncClient(limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool))
+        _aclients[loop] = client
+    return client
+
+async def _apost(payload: Dict[str, Any], timeout: Optional[float] = None, stream: bool = False,
+                 ep: Optional[Endpoint] = None) -> Tuple[Any, Endpoint]:
+    """Async _post(): (httpx.Response, endpoint), unread when stream=True; raises httpx.HTTPError."""
+    import httpx
+    client = _aclient()
+    router = get_router()
+    # failures before any response header: connect errors, resets, dropped keep-alives
+    retry_exc = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+    retries = int(os.getenv("LLM_RETRIES", "2"))
+    deadline = _deadline(timeout)
+    attempt = 0
+    tried: List[Endpoint] = []
+    while True:
+        ep = ep or router.pick(exclude=tried)
+        router.begin(ep)
+        _stats["requests"] += 1
+        pause = _backoff(attempt)
+        connect, read = _timeouts(_left(deadline))
+        req = client.build_request("POST", ep.url, headers=_headers(), json=payload,
+                                   timeout=httpx.Timeout(read, connect=connect))
+        try:
+            r = await client.send(req, stream=stream)
+        except BaseException as e:
+            router.end(ep, ok=None if isinstance(e, asyncio.CancelledError) or _read_timeout(e) else False)
+            if not isinstance(e, retry_exc) or attempt >= retries or _no_time_for(deadline, pause):
+                if isinstance(e, httpx.HTTPError):
+                    _stats["failed"] += 1
+                raise
+        else:
+            if r.status_code not in _RETRY_STATUS or attempt >= retries or _no_time_for(deadline, pause):
+                if r.status_code >= 400:
+                    _stats["failed"] += 1
+                    router.end(ep, ok=r.status_code < 500)
+                    await r.aclose()
+                    r.raise_for_status()
+                return r, ep
+            await r.aclose()
+            router.end(ep, ok=False)
+        tried.append(ep)
+        ep = None
+        _stats["retries"] += 1
+        await asyncio.sleep(pause)
+        attempt += 1
+
+async def acall_llm(
+    prompt: str,
+    system: Optional[str] = None,
+    temperature: float = 0.2,
+    max_new_tokens: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    import httpx
+    _require_endpoints()
+    payload = _payload(prompt, system, temperature, max_new_tokens, max_tokens, kwargs)
+    t0 = time.perf_counter()
+    try:
+        r, ep = await _apost(payload, timeout=timeout)
+        get_router().end(ep, ok=True, latency_ms=(time.perf_counter() - t0) * 1000.0)
+        try: data = r.json()
+        except ValueError: data = {"raw_text": r.text}
+        return _normalize_response(data)
+    except httpx.HTTPError as e:
+        return _normalize_response({"raw_text": f"[HTTP error] {e}", "text": ""})
+
+async def astream_llm(
+    prompt: str,
+    system: Optional[str] = None,
+    temperature: float = 0.2,
+    max_new_tokens: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+    cancel: Optional[asyncio.Event] = None,
+    **kwargs: Any,
+) -> AsyncGenerator[str, None]:
+    """Async stream_llm(); consume with `async for` inside contextlib.aclosing() (or
+    call aclose()) so an abandoned stream is closed right away."""
+    if os.getenv("LLM_STREAM", "1") != "1":
+        norm = await acall_llm(prompt, system=system, temperature=temperature,
+                               max_new_tokens=max_new_tokens, max_tokens=max_tokens,
+                               timeout=timeout, **kwargs)
+        yield norm["text"]
+        return
+
+    _require_endpoints()
+    payload = _payload(prompt, system, temperature, max_new_tokens, max_tokens, kwargs)
+    payload["stream"] = True
+    delay = get_router().hedge_delay_s()
+    gen = _astream_one(payload, timeout, cancel) if delay is None \
+        else _ahedged_stream(payload, timeout, cancel, delay)
+    try:
+        async for token in gen:
+            yield token
+    finally:
+        await gen.aclose()
+
+async def _astream_one(payload: Dict[str, Any], timeout: Optional[float], cancel: Optional[asyncio.Event],
+                       ep: Optional[Endpoint] = None) -> AsyncGenerator[str, None]:
+    router = get_router()
+    t0 = time.perf_counter()
+    t_first: Optional[float] = None
+    dec = _StreamDecoder(payload.get("prompt", ""))
+    completed = errored = False
+    r, ep = await _apost(payload, timeout=timeout, stream=True, ep=ep)
+
+    def first_token() -> None:
+        nonlocal t_first
+        if t_first is None:
+            t_first = time.perf_counter()
+            router.observe_ttft((t_first - t0) * 1000.0)
+
+    try:
+        if _is_plain_json(r.headers.get("Content-Type", "")):
+            await r.aread()
+            text = _normalize_response(r.json())["text"]
+            if text:
+                first_token()
+                dec.events = 1
+                yield text
+            completed = True
+            return
+        cancelled = False
+        async for block in r.aiter_bytes():
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            for delta in dec.feed(block):
+                first_token()
+                yield delta
+            if dec.done:
+                break
+        else:
+            for delta in dec.flush():
+                first_token()
+                yield delta
+        completed = not cancelled
+    except Exception as e:
+        errored = not _read_timeout(e)
+        raise
+    finally:
+        await r.aclose()
+        router.end(ep, ok=False if errored else (True if t_first or completed else None),
+                   latency_ms=(t_first - t0) * 1000.0 if t_first else None)
+        _record_stream(t0, t_first, dec.tokens, cancelled=not completed)
+
+async def _ahedged_stream(payload: Dict[str, Any], timeout: Optional[float], cancel: Optional[asyncio.Event],
+                          delay: float) -> AsyncGenerator[str, None]:
+    """Async _hedged_stream(): races the first token of two generators, closes the loser."""
+    router = get_router()
+    first_ep = router.pick()
+    legs = {}   # first-token task -> generator
+    gen = _astream_one(payload, timeout, None, ep=first_ep)
+    legs[asyncio.ensure_future(gen.__anext__())] = gen
+    winner = None
+    try:
+        done, _ = await asyncio.wait(list(legs), timeout=delay)
+        if not done:
+            other = router.pick(exclude=[first_ep])
+            if other is not first_ep:
+                router.counters["hedged"] += 1
+                gen2 = _astream_one(payload, timeout, None, ep=other)
+                legs[asyncio.ensure_future(gen2.__anext__())] = gen2
+        pending = set(legs)
+        error: Optional[BaseException] = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, timeout=0.25, return_when=asyncio.FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                return
+            for task in done:
+                exc = task.exception()
+                if isinstance(exc, StopAsyncIteration):
+                    winner = task       # finished without a token
+                    break
+                if exc is not None:
+                    error = exc
+                    continue
+                winner = task
+                break
+        if winner is None:
+            raise error or RuntimeError("LLM request failed")
+        if legs[winner] is not gen:
+            router.counters["hedge_won"] += 1
+        for task in legs:
+            if task is not winner:
+                task.cancel()
+        if winner.exception() is not None:
+            return
+        yield winner.result()
+        async for token in legs[winner]:
+            if cancel is not None and cancel.is_set():
+                break
+            yield token
+    finally:
+        for task, g in legs.items():
+            if task is not winner:
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+            await g.aclose()
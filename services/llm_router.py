@@ -0,0 +1,180 @@
+# services/llm_router.py
+"""
+Endpoint selection for several LLM replicas (LLMAR_API_URLS=url1,url2,...;
+falls back to the single LLMAR_API_URL).
+
+Routing (LLM_ROUTING):
+  least_outstanding  fewest in-flight requests, EWMA latency breaks ties (default)
+  ewma               lowest EWMA latency x (in-flight + 1)
+Latency is time-to-first-token for streams, full response time otherwise.
+
+Health:
+  passive  LLM_EJECT_AFTER consecutive failures (connection errors, 5xx) eject
+           an endpoint for LLM_EJECT_S, doubling per repeated ejection (max 5 min)
+  active   every LLM_HEALTH_INTERVAL_S a GET <origin>LLM_HEALTH_PATH re-admits
+           or ejects endpoints (0 = off)
+If every endpoint is ejected the one due back soonest is still used.
+
+Hedging (LLM_HEDGE=1, needs 2+ healthy endpoints): llm_client starts a second
+stream on another replica when the first has produced no token after
+hedge_delay_s() - LLM_HEDGE_DELAY_MS, or the LLM_HEDGE_QUANTILE (p95) of
+recent TTFTs once LLM_HEDGE_MIN_SAMPLES are in - and cancels the loser.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+from collections import Counter, deque
+import os, time, random, threading
+
+import requests
+
+
+def endpoint_urls() -> List[str]:
+    raw = os.getenv("LLMAR_API_URLS") or os.getenv("LLMAR_API_URL") or ""
+    return [u.strip() for u in raw.split(",") if u.strip()]
+
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.ewma_ms: Optional[float] = None
+        self.fails = 0                 # consecutive
+        self.ejections = 0             # consecutive
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {"url": self.url, "outstanding": self.outstanding, "healthy": self.healthy,
+                "ewma_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+                "requests": self.requests, "errors": self.errors, "ejections": self.ejections}
+
+
+class Router:
+    def __init__(self, urls: Sequence[str]):
+        self.endpoints = [Endpoint(u) for u in urls]
+        self.policy = os.getenv("LLM_ROUTING", "least_outstanding").lower()
+        self.alpha = float(os.getenv("LLM_EWMA_ALPHA", "0.3"))
+        self.eject_after = int(os.getenv("LLM_EJECT_AFTER", "3"))
+        self.eject_s = float(os.getenv("LLM_EJECT_S", "30"))
+        self._ttft: deque = deque(maxlen=int(os.getenv("LLM_HEDGE_WINDOW", "200")))
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+        self._health: Optional[threading.Thread] = None
+
+    # ------------------------------ selection ------------------------------
+    def pick(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        with self._lock:
+            pool = [e for e in self.endpoints if e not in exclude] or list(self.endpoints)
+            live = [e for e in pool if e.healthy]
+            if not live:
+                return min(pool, key=lambda e: e.ejected_until)
+            random.shuffle(live)   # spread ties
+            if self.policy == "ewma":
+                return min(live, key=lambda e: (e.ewma_ms or 0.0) * (e.outstanding + 1))
+            return min(live, key=lambda e: (e.outstanding, e.ewma_ms or 0.0))
+
+    def healthy_count(self) -> int:
+        return sum(1 for e in self.endpoints if e.healthy)
+
+    # ------------------------------ accounting -----------------------------
+    def begin(self, ep: Endpoint) -> None:
+        with self._lock:
+            ep.outstanding += 1
+            ep.requests += 1
+
+    def end(self, ep: Endpoint, ok: Optional[bool], latency_ms: Optional[float] = None) -> None:
+        """ok=None: abandoned (cancelled, lost a hedge) - no health verdict."""
+        with self._lock:
+            ep.outstanding = max(0, ep.outstanding - 1)
+            if ok is None:
+                return
+            if ok:
+                ep.fails = ep.ejections = 0
+                if latency_ms is not None:
+                    ep.ewma_ms = latency_ms if ep.ewma_ms is None else \
+                        (1 - self.alpha) * ep.ewma_ms + self.alpha * latency_ms
+                return
+            ep.errors += 1
+            ep.fails += 1
+            if ep.fails >= self.eject_after and ep.healthy:
+                self._eject(ep)
+
+    def _eject(self, ep: Endpoint) -> None:
+        ep.ejected_until = time.monotonic() + min(300.0, self.eject_s * (2 ** ep.ejections))
+        ep.ejections += 1
+        ep.fails = 0
+        self.counters["ejections"] += 1
+        print(f"[llm] ejected {ep.url} for {ep.ejected_until - time.monotonic():.0f}s")
+
+    # ------------------------------ hedging --------------------------------
+    def observe_ttft(self, ms: float) -> None:
+        self._ttft.append(ms)
+
+    def hedge_delay_s(self) -> Optional[float]:
+        """Seconds to wait for a first token before hedging; None = do not hedge."""
+        if os.getenv("LLM_HEDGE", "0") != "1" or self.healthy_count() < 2:
+            return None
+        fixed = os.getenv("LLM_HEDGE_DELAY_MS")
+        if fixed:
+            return float(fixed) / 1000.0
+        samples = sorted(self._ttft)
+        if len(samples) < int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")):
+            return float(os.getenv("LLM_HEDGE_DEFAULT_MS", "2000")) / 1000.0
+        q = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+        p = samples[min(len(samples) - 1, int(q * len(samples)))]
+        return max(p, float(os.getenv("LLM_HEDGE_MIN_MS", "100"))) / 1000.0
+
+    # ---------------------------- active checks ----------------------------
+    def start_health_checks(self) -> None:
+        interval = float(os.getenv("LLM_HEALTH_INTERVAL_S", "10"))
+        if self._health is None and interval > 0 and len(self.endpoints) > 1:
+            self._health = threading.Thread(target=self._health_loop, args=(interval,),
+                                            name="llm-health", daemon=True)
+            self._health.start()
+
+    def _health_loop(self, interval: float) -> None:
+        path = os.getenv("LLM_HEALTH_PATH", "/health")
+        while _router is self:   # stop once replaced by a new endpoint list
+            time.sleep(interval)
+            for ep in self.endpoints:
+                p = urlparse(ep.url)
+                try:
+                    ok = requests.get(f"{p.scheme}://{p.netloc}{path}", timeout=2).status_code < 500
+                except requests.RequestException:
+                    ok = False
+                with self._lock:
+                    if ok and not ep.healthy:
+                        ep.ejected_until = 0.0
+                        ep.fails = 0
+                        self.counters["readmitted"] += 1
+                    elif not ok and ep.healthy:
+                        self._eject(ep)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self.counters)
+            out["endpoints"] = [e.stats() for e in self.endpoints]
+        delay = self.hedge_delay_s()
+        out["hedge_delay_ms"] = round(delay * 1000.0, 1) if delay is not None else None
+        return out
+
+
+_router: Optional[Router] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Router:
+    """Process-wide router; rebuilt if the configured endpoint list changes."""
+    global _router
+    urls = endpoint_urls()
+    if _router is None or [e.url for e in _router.endpoints] != urls:
+        with _router_lock:
+            if _router is None or [e.url for e in _router.endpoints] != urls:
+                _router = Router(urls)
+                _router.start_health_checks()
+    return _router
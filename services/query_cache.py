@@ -0,0 +1,249 @@
+# services/query_cache.py
+"""
+Two-level cache used by the retriever:
+  1) an in-process LRU (per Streamlit worker), and
+  2) an optional on-disk SQLite tier (QUERY_CACHE_DB) shared by all workers on a host.
+Values are pickled for the disk tier. Eviction there is size-based, least recently used
+first. SQLite triggers keep a running byte total, so a put never has to sum the table.
+Reads seldom write: a hit refreshes its access time only if that is older than
+touch_s, and the refreshes are saved with the next put (or once touch_batch pile up).
+"""
+from typing import Any, Dict, Hashable, Iterator, Optional
+import os, time, pickle, sqlite3, hashlib, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def make_key(*parts: Any) -> str:
+    """Stable string key from arbitrary parts (used by both tiers)."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+# ------------------------------ Memory tier ---------------------------------
+class LRUCache:
+    def __init__(self, max_items: int = 512):
+        self.max_items = max(0, int(max_items))
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.max_items:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"items": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# ------------------------------- Disk tier ----------------------------------
+class DiskCache:
+    """SQLite key/value store; safe to share between processes (WAL mode)."""
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, touch_s: float = 60.0, touch_batch: int = 64):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.touch_s = touch_s            # LRU order is kept at this resolution
+        self.touch_batch = touch_batch    # pending atime refreshes that force a write on their own
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache(atime)")
+        # Running byte total shared by every process on the file: summed once for a
+        # database that predates it, then updated by the triggers on each write.
+        with self._transaction():
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_bytes (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_bytes_ins AFTER INSERT ON cache BEGIN"
+                " UPDATE cache_bytes SET total = total + new.size; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_bytes_del AFTER DELETE ON cache BEGIN"
+                " UPDATE cache_bytes SET total = total - old.size; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_bytes_upd AFTER UPDATE OF size ON cache BEGIN"
+                " UPDATE cache_bytes SET total = total + new.size - old.size; END"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO cache_bytes(id, total) SELECT 0, COALESCE(SUM(size), 0) FROM cache"
+            )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _flush_touches(self) -> None:
+        """Write the pending atime refreshes (inside the caller's transaction)."""
+        touched, self._touched = self._touched, {}
+        if touched:
+            self._conn.executemany("UPDATE cache SET atime=? WHERE key=?", [(t, k) for k, t in touched.items()])
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT value, atime FROM cache WHERE key=?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                now = time.time()
+                if now - row[1] >= self.touch_s:
+                    self._touched[key] = now
+                    if len(self._touched) >= self.touch_batch:
+                        with self._transaction():
+                            self._flush_touches()
+            except sqlite3.Error:
+                self.misses += 1
+                return None
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                with self._transaction():
+                    self._flush_touches()   # before eviction picks the least recently used rows
+                    # upsert, not INSERT OR REPLACE: REPLACE's implicit delete skips delete triggers
+                    self._conn.execute(
+                        "INSERT INTO cache(key, value, size, atime) VALUES (?,?,?,?)"
+                        " ON CONFLICT(key) DO UPDATE SET value=excluded.value, size=excluded.size, atime=excluded.atime",
+                        (key, sqlite3.Binary(blob), len(blob), time.time()),
+                    )
+                    self._evict()
+            except sqlite3.Error:
+                pass
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT total FROM cache_bytes").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least-recently-used rows until we are ~10% under the limit.
+        target = int(self.max_bytes * 0.9)
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY atime").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM cache WHERE key=?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self, prefix: str = "") -> None:
+        """Delete every entry, or those whose key starts with prefix."""
+        with self._lock:
+            self._touched.clear()
+            try:
+                if prefix:
+                    # key range on the primary key: prefix <= key < prefix + U+10FFFF
+                    self._conn.execute("DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, prefix + "\U0010ffff"))
+                else:
+                    self._conn.execute("DELETE FROM cache")
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            items = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            size = self._conn.execute("SELECT total FROM cache_bytes").fetchone()[0]
+        except sqlite3.Error:
+            items, size = 0, 0
+        return {"items": items, "bytes": size, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+# ------------------------------ Two-level -----------------------------------
+class QueryCache:
+    """Memory LRU in front of an optional shared DiskCache; keys are namespaced."""
+
+    def __init__(self, namespace: str, max_items: int = 512, disk: Optional[DiskCache] = None):
+        self.namespace = namespace
+        self.mem = LRUCache(max_items)
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[Any]:
+        v = self.mem.get(key)
+        if v is not None:
+            return v
+        if self.disk is not None:
+            v = self.disk.get(f"{self.namespace}:{key}")
+            if v is not None:
+                self.mem.put(key, v)   # promote
+        return v
+
+    def put(self, key: str, value: Any) -> None:
+        self.mem.put(key, value)
+        if self.disk is not None:
+            self.disk.put(f"{self.namespace}:{key}", value)
+
+    def clear(self) -> None:
+        """Both tiers; on disk only this namespace (the file is shared with other caches and workers)."""
+        self.mem.clear()
+        if self.disk is not None:
+            self.disk.clear(f"{self.namespace}:")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.mem.stats(), "disk": self.disk.stats() if self.disk else None}
+
+
+_disk: Optional[DiskCache] = None
+_disk_lock = threading.Lock()
+
+def shared_disk_cache() -> Optional[DiskCache]:
+    """Process-wide DiskCache from QUERY_CACHE_DB / QUERY_CACHE_DB_MB (None if disabled)."""
+    global _disk
+    path = os.getenv("QUERY_CACHE_DB", "")
+    if not path:
+        return None
+    with _disk_lock:
+        if _disk is None:
+            try:
+                _disk = DiskCache(path, int(float(os.getenv("QUERY_CACHE_DB_MB", "64")) * 1024 * 1024))
+            except (sqlite3.Error, OSError):
+                return None
+    return _disk
@@ -0,0 +1,149 @@
+# services/retrieval_client.py
+"""
+Thin client for services/retrieval_server.
+
+RETRIEVAL_SERVER_URL = http://127.0.0.1:8600  or  unix:///run/ibtikar/retrieval.sock
+Connections are kept alive per thread. Errors:
+  ConnectionError  server unreachable; it is treated as down for
+                   RETRIEVAL_RETRY_AFTER_S so callers fall back without
+                   waiting on every request
+  ServerBusy       503 back-pressure, after RETRIEVAL_BUSY_RETRIES waits
+                   (RETRIEVAL_BUSY_WAIT_MS, doubling) that fit in the timeout;
+                   not a reason to fall back
+  ServerError      other non-200 replies; RETRIEVAL_DOWN_AFTER_5XX 5xx in a
+                   row mark the server down like a connection failure
+  TimeoutError     no reply within the timeout; never retried
+The timeout (RETRIEVAL_TIMEOUT_S, or less if the caller passes one) bounds a
+whole call, busy retries included.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import os, json, time, socket, threading
+import http.client
+from urllib.parse import urlparse
+
+_local = threading.local()
+_down_until = 0.0
+
+
+def server_url() -> str:
+    return os.getenv("RETRIEVAL_SERVER_URL", "")
+
+
+def enabled() -> bool:
+    return bool(server_url()) and time.monotonic() >= _down_until
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def _conn(timeout: float) -> http.client.HTTPConnection:
+    c = getattr(_local, "conn", None)
+    if c is None:
+        u = urlparse(server_url())
+        if u.scheme == "unix":
+            c = _UnixConnection(u.path, timeout)
+        else:
+            c = http.client.HTTPConnection(u.hostname or "127.0.0.1", u.port or 80, timeout=timeout)
+        _local.conn = c
+    c.timeout = timeout
+    return c
+
+
+class ServerError(RuntimeError):
+    def __init__(self, status: int, error: Any):
+        super().__init__(f"retrieval server {status}: {error}")
+        self.status = status
+
+
+class ServerBusy(ServerError):
+    """503: every server slot stayed taken for RETRIEVAL_QUEUE_TIMEOUT_S."""
+
+
+_fails_5xx = 0
+_fails_lock = threading.Lock()
+
+
+def _mark_down() -> None:
+    global _down_until
+    _down_until = time.monotonic() + float(os.getenv("RETRIEVAL_RETRY_AFTER_S", "30"))
+
+
+def _send(method: str, path: str, data: Optional[bytes], headers: Dict[str, str],
+          timeout: float) -> Tuple[int, Any]:
+    for attempt in (1, 2):   # one retry on a stale keep-alive connection
+        c = _conn(timeout)
+        try:
+            c.request(method, path, body=data, headers=headers)
+            r = c.getresponse()
+            return r.status, json.loads(r.read() or b"{}")
+        except socket.timeout as e:
+            # the server is slow, not gone: a retry would only double the caller's wait
+            c.close(); _local.conn = None
+            raise TimeoutError(f"retrieval server timed out after {timeout:g}s") from e
+        except (http.client.HTTPException, OSError) as e:
+            c.close(); _local.conn = None
+            if attempt == 2:
+                _mark_down()
+                raise ConnectionError(f"retrieval server unreachable: {e}") from e
+    raise AssertionError("unreachable")
+
+
+def _request(method: str, path: str, body: Optional[Dict[str, Any]] = None, timeout: float = 10.0,
+             busy_retries: Optional[int] = None) -> Any:
+    """timeout: seconds for the whole call, 503 waits and retries included."""
+    global _fails_5xx
+    deadline = time.monotonic() + timeout
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"} if data else {}
+    if busy_retries is None:
+        busy_retries = int(os.getenv("RETRIEVAL_BUSY_RETRIES", "2"))
+    wait = float(os.getenv("RETRIEVAL_BUSY_WAIT_MS", "200")) / 1000.0
+    for attempt in range(busy_retries + 1):
+        status, payload = _send(method, path, data, headers, max(deadline - time.monotonic(), 0.05))
+        if status != 503 or attempt == busy_retries or time.monotonic() + wait >= deadline:
+            break
+        time.sleep(wait)
+        wait *= 2
+    with _fails_lock:
+        if status < 500 or status == 503:
+            _fails_5xx = 0
+        else:
+            _fails_5xx += 1
+            if _fails_5xx >= int(os.getenv("RETRIEVAL_DOWN_AFTER_5XX", "3")):
+                _fails_5xx = 0
+                _mark_down()
+    if status == 200:
+        return payload
+    error = payload.get("error") if isinstance(payload, dict) else payload
+    raise (ServerBusy if status == 503 else ServerError)(status, error)
+
+
+def _timeout(timeout: Optional[float]) -> float:
+    limit = float(os.getenv("RETRIEVAL_TIMEOUT_S", "10"))
+    return limit if timeout is None else min(limit, max(timeout, 0.05))
+
+
+def retrieve(query: str, top_k: int = 6, budget_ms: Optional[float] = None, scope: Any = None,
+             timeout: Optional[float] = None) -> Any:
+    return _request("POST", "/retrieve", {"query": query, "top_k": top_k, "budget_ms": budget_ms,
+                                          "scope": scope}, _timeout(timeout))["docs"]
+
+
+def embed(text: str, timeout: Optional[float] = None) -> Tuple[List[float], str]:
+    r = _request("POST", "/embed", {"text": text}, _timeout(timeout))
+    return r["vector"], r["index_version"]
+
+
+def ready(timeout: float = 2.0) -> bool:
+    try:
+        return bool(_request("GET", "/readyz", timeout=timeout, busy_retries=0).get("ready"))
+    except Exception:
+        return False
@@ -0,0 +1,138 @@
+# services/retrieval_server.py
+"""
+Standalone retrieval service: one process per host owns BGE-M3, the reranker
+and the index; every Streamlit worker talks to it through
+services/retrieval_client (set RETRIEVAL_SERVER_URL).
+
+run:  python -m services.retrieval_server --port 8600
+      python -m services.retrieval_server --unix /run/ibtikar/retrieval.sock
+
+POST /retrieve  {"query": str, "top_k": int, "scope": str|list|null, "budget_ms": float|null}
+                -> {"docs": [...]}
+POST /embed     {"text": str} -> {"vector": [...], "index_version": str}
+GET  /healthz, /readyz, /stats
+
+Concurrency is bounded by --workers (RETRIEVAL_WORKERS); requests waiting
+longer than RETRIEVAL_QUEUE_TIMEOUT_S get 503 so clients fall back quickly.
+Concurrent requests are micro-batched (RETRIEVE_BATCHING defaults to 1 here).
+"""
+from typing import Any, Dict, Tuple
+import os, json, argparse, threading, socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ.setdefault("RETRIEVE_BATCHING", "1")
+os.environ["RETRIEVAL_SERVER_URL"] = ""   # this process *is* the server; never call out to itself
+
+from services import retriever  # noqa: E402  (env above must be set first)
+
+_slots = threading.BoundedSemaphore(int(os.getenv("RETRIEVAL_WORKERS", "4")))
+_ready = threading.Event()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive for the clients' pooled connections
+
+    def _send(self, code: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/healthz"):
+            return self._send(200, {"alive": True})
+        if self.path.startswith("/readyz"):
+            return self._send(200 if _ready.is_set() else 503, {"ready": _ready.is_set()})
+        if self.path.startswith("/stats"):
+            return self._send(200, {"cache": retriever.cache_stats(), "rerank": retriever.rerank_stats(),
+                                    "batching": retriever.batch_stats(), "store": retriever.store_stats()})
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(n) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": "invalid JSON"})
+        if self.path.startswith("/retrieve"):
+            return self._guarded(self._retrieve, req)
+        if self.path.startswith("/embed"):
+            return self._guarded(self._embed, req)
+        self._send(404, {"error": "not found"})
+
+    def _guarded(self, fn, req: Dict[str, Any]) -> None:
+        if not _slots.acquire(timeout=float(os.getenv("RETRIEVAL_QUEUE_TIMEOUT_S", "5"))):
+            return self._send(503, {"error": "busy"})
+        try:
+            code, body = fn(req)
+        except Exception as e:
+            code, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            _slots.release()
+        self._send(code, body)
+
+    def _retrieve(self, req: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        query = req.get("query") or ""
+        docs = retriever.retrieve_local(query, top_k=int(req.get("top_k") or 6),
+                                        budget_ms=req.get("budget_ms"), scope=req.get("scope"))
+        return 200, {"docs": docs}
+
+    def _embed(self, req: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        vec, version = retriever.embed_query(req.get("text") or "")
+        return 200, {"vector": [float(x) for x in vec], "index_version": version}
+
+    def address_string(self) -> str:   # unix sockets have no (host, port)
+        return str(self.client_address[0]) if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        conn, _ = super().get_request()
+        return conn, ("unix", 0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default=os.getenv("RETRIEVAL_SERVER_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("RETRIEVAL_SERVER_PORT", "8600")))
+    ap.add_argument("--unix", default=os.getenv("RETRIEVAL_SERVER_SOCKET", ""))
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+    global _slots
+    if args.workers:
+        _slots = threading.BoundedSemaphore(args.workers)
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)
+        server = _UnixHTTPServer(args.unix, _Handler)
+        where = f"unix:{args.unix}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), _Handler)
+        server.daemon_threads = True
+        where = f"http://{args.host}:{args.port}"
+
+    print("[retrieval] loading models/index ...")
+    retriever.warmup()
+    _ready.set()
+    print(f"[retrieval] ready on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,380 @@
 # services/retriever.py
-from typing import List, Dict, Any, Optional
-import os, json
-import faiss, numpy as np
-from FlagEmbedding import BGEM3FlagModel
-try:
-    from FlagEmbedding import FlagReranker
-except Exception:
-    FlagReranker = None  # graceful fallback
+from typing import List, Dict, Any, Optional, Tuple
+import os, json, time, threading
+from collections import Counter
+import numpy as np
+
+from core.chunk_store import ChunkStore, SOURCE_TYPES, has_chunk_store, read_source_arrays, source_arrays
+from core.lexical import BM25Index, ar_normalize as _ar_normalize, has_bm25
+from core.sparse import SparseStore, has_sparse, to_query
+from core.vectorstore import StorePaths, bm25_prefix, sparse_prefix, read_index_meta, resolve_store, verify_build
+from services.query_cache import QueryCache, make_key, shared_disk_cache
+from services.batcher import MicroBatcher
+from services.encoders import load_encoder, backend_name
+from services import retrieval_client
 
 # --------------------------- Source allowlist --------------------------------
 ALLOW_DOMAINS = {
     "teknofest.ibtikar.org.tr",
     "ibtikar.org.tr",
 }
-def _allowed(src: str) -> bool:
-    if not src: return False
-    if src.startswith("gdoc:"): return True
-    try:
-        from urllib.parse import urlparse
-        return urlparse(src).netloc in ALLOW_DOMAINS
-    except Exception:
-        return False
+
+# Named scopes a caller (or the UI) can pass to retrieve(scope=...); a scope
+# may also be a raw domain ("ibtikar.org.tr") or a source type ("gdoc").
+SCOPES: Dict[str, Dict[str, Any]] = {
+    "teknofest": {"domains": {"teknofest.ibtikar.org.tr"}},
+    "ibtikar":   {"domains": {"ibtikar.org.tr"}},
+    "gdocs":     {"types": {"gdoc"}},
+    "lms":       {"types": {"lms"}},
+}
 
 # ------------------------------ Globals --------------------------------------
-_model: Optional[BGEM3FlagModel] = None
-_index = None
-_docs: List[Dict[str, Any]] = []
+# Heavy deps (faiss, FlagEmbedding/torch) are imported on first _load() so that
+# importing this module - and app.py - stays fast; services/warmup runs _load()
+# in the background at process start.
+faiss: Any = None
+_load_lock = threading.Lock()
+_loaded = False
+_model: Any = None   # BGEM3FlagModel or services.encoders.OnnxEncoder (EMBED_BACKEND)
 _reranker: Any = None
+_store: Any = None   # the live _Store; replaced as a whole on hot reload
+
+# Second-stage scorer: "cross" (bge-reranker-large), "sparse" (BGE-M3 dense +
+# lexical weights from ingest; no cross-encoder is loaded) or "none".
+_RERANK_MODE = os.getenv("RERANK_MODE", "cross").lower()
+
+# --------------------------- Query caches ------------------------------------
+# Embeddings are keyed on the exact text (+ model); ranked results on the
+# normalized query, top_k, RECALL_K and the index fingerprint.
+_CACHE_ON = os.getenv("QUERY_CACHE", "1") == "1"
+_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+_emb_cache = QueryCache("emb", _CACHE_SIZE, shared_disk_cache() if _CACHE_ON else None)
+_res_cache = QueryCache("res", _CACHE_SIZE, shared_disk_cache() if _CACHE_ON else None)
+_spw_cache = QueryCache("spw", _CACHE_SIZE)   # query lexical weights (sparse mode)
+
+def cache_stats() -> Dict[str, Any]:
+    return {"embeddings": _emb_cache.stats(), "results": _res_cache.stats(), "index_version": index_version()}
+
+# VECTORSTORE_MMAP=1: memory-map index + chunk store so all workers on a host
+# share one page-cached copy (and cold start does not grow with corpus size).
+_MMAP = os.getenv("VECTORSTORE_MMAP", "0") == "1"
+
+def _read_index(path: str):
+    if not _MMAP:
+        return faiss.read_index(path)
+    # IO_FLAG_MMAP covers IVF inverted lists; IO_FLAG_MMAP_IFC (newer faiss)
+    # also maps flat codes. Fall back to a heap copy if the build lacks both.
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(path, flags)
+    except Exception:
+        return faiss.read_index(path)
+
+def _apply_search_params(index) -> None:
+    """Runtime knobs for ANN indexes written by ingest/build_index (no-op for flat)."""
+    try:
+        index = faiss.downcast_index(index)
+    except Exception:
+        pass
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(os.getenv("FAISS_EF_SEARCH", "64"))
+        return
+    try:
+        faiss.extract_index_ivf(index).nprobe = int(os.getenv("FAISS_NPROBE", "8"))
+    except Exception:
+        pass   # not an IVF index
+
+def _read_docs(path: str) -> Any:
+    if _MMAP and has_chunk_store(path):
+        return ChunkStore(path)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+class _Store:
+    """
+    One loaded vector-store build: index, docs and everything derived from
+    them. A query takes a reference once and uses only that, so a hot reload
+    never mixes the index of one build with the docs of another.
+    """
+
+    def __init__(self, paths: StorePaths):
+        self.paths = paths
+        self.version = paths.version
+        self.index = _read_index(paths.faiss)
+        _apply_search_params(self.index)
+        self.deduped = bool(read_index_meta(paths.faiss).get("deduped"))   # skip _dedup_by_text
+        self.docs: Any = _read_docs(paths.docs)   # list from docs.json, or a memory-mapped ChunkStore
+        self.bm25: Optional[BM25Index] = None
+        self.sparse: Optional[SparseStore] = None
+        if _HYBRID and has_bm25(bm25_prefix(paths.faiss)):
+            self.bm25 = BM25Index(bm25_prefix(paths.faiss))
+        if _RERANK_MODE == "sparse" and has_sparse(sparse_prefix(paths.faiss)):
+            self.sparse = SparseStore(sparse_prefix(paths.faiss))
+        self.filters: Dict[Any, Tuple[np.ndarray, Any]] = {}   # scope key -> (mask, faiss SearchParameters)
+        self._build_source_arrays()
+
+    def _build_source_arrays(self) -> None:
+        """Per-chunk metadata arrays (no URL parsing per query): memory-mapped from the
+        files ingest writes next to the chunk store; builds without them are scanned once."""
+        n = len(self.docs)
+        arrays = read_source_arrays(self.paths.docs, n) or source_arrays(self.docs, n)
+        self.source_id, self.domain_id, self.source_type, self.source_names, self.domain_names = arrays
+        allowed_domains = [j for j, name in enumerate(self.domain_names) if name == "gdoc" or name in ALLOW_DOMAINS]
+        self.allowed_mask = np.isin(self.domain_id, allowed_domains)
 
 def _load():
-    global _model, _index, _docs, _reranker
+    if _loaded:
+        return
+    with _load_lock:
+        _load_locked()
+
+def _load_locked():
+    global faiss, _model, _reranker, _store, _loaded
+    if faiss is None:
+        import faiss
     if _model is None:
-        _model = BGEM3FlagModel(os.getenv("BGE_MODEL_PATH") or "BAAI/bge-m3", use_fp16=False)
-    if _index is None:
-        _index = faiss.read_index(os.getenv("FAISS_INDEX_PATH"))
-    if not _docs:
-        _docs = json.load(open(os.getenv("DOCS_JSON_PATH"), encoding="utf-8"))
-    if _reranker is None and FlagReranker:
+        _model = load_encoder()
+    if _store is None:
+        _store = _Store(resolve_store())
+    if _reranker is None and _RERANK_MODE == "cross":
         try:
+            from FlagEmbedding import FlagReranker
             _reranker = FlagReranker(os.getenv("RERANK_MODEL", "BAAI/bge-reranker-large"), use_fp16=False)
         except Exception:
-            _reranker = None
+            _reranker = None  # graceful fallback
+    _loaded = True
+    _start_watcher()
+
+def _current() -> "_Store":
+    _load()
+    return _store
+
+# ------------------------------ Hot reload -----------------------------------
+# ingest_runner publishes each build under vectorstore/builds/<id>/ and then
+# flips vectorstore/current. A daemon thread polls the pointer every
+# VECTORSTORE_POLL_S seconds (0 = off), loads a new build next to the live one
+# and swaps the reference; in-flight queries finish on the build they started
+# with. Only the versioned layout is followed: files overwritten in place
+# (legacy layout) could be caught half-written.
+_POLL_S = float(os.getenv("VECTORSTORE_POLL_S", "10"))
+_watcher: Optional[threading.Thread] = None
+_reload_lock = threading.Lock()
+_reloads: Counter = Counter()
+
+def reload_store(force: bool = False) -> bool:
+    """Load the build `current` points at if it differs from the live one. True if swapped."""
+    with _reload_lock:
+        return _reload_locked(force)
+
+def _reload_locked(force: bool) -> bool:
+    global _store
+    paths = resolve_store()
+    live = _store
+    if live is not None and paths.version == live.version and not force:
+        return False
+    if not paths.build_dir and live is not None and not force:
+        return False
+    if paths.build_dir and not verify_build(paths.build_dir):
+        _reloads["rejected"] += 1
+        print(f"[warn] vector store build {paths.version} failed its manifest check; "
+              f"keeping {live.version if live else None}")
+        return False
+    t = time.perf_counter()
+    new = _Store(paths)
+    _store = new
+    _reloads["swapped"] += 1
+    print(f"[retriever] vector store {live.version if live else None} -> {new.version} "
+          f"({len(new.docs)} chunks) loaded in {time.perf_counter() - t:.1f}s")
+    return True
+
+def _watch() -> None:
+    while True:
+        time.sleep(_POLL_S)
+        try:
+            reload_store()
+        except Exception as e:
+            _reloads["failed"] += 1
+            print(f"[warn] vector store reload failed: {e}")
+
+def _start_watcher() -> None:
+    global _watcher
+    if _watcher is None and _POLL_S > 0:
+        _watcher = threading.Thread(target=_watch, name="vectorstore-watch", daemon=True)
+        _watcher.start()
+
+def store_stats() -> Dict[str, Any]:
+    s = _store
+    return {"index_version": s.version if s else "", "build_dir": s.paths.build_dir if s else "",
+            "chunks": len(s.docs) if s else 0, "reloads": dict(_reloads)}
+
+def warmup() -> None:
+    """Load everything and run one dummy encode + search (+ rerank) so the first user query is warm.
+    With a retrieval server configured and ready, nothing is loaded in this process."""
+    if retrieval_client.enabled() and retrieval_client.ready():
+        return
+    _search(_current(), ["تجمع ابتكار Ibtikar"], 1)
+    if _reranker is not None:
+        _reranker.compute_score([("ابتكار", "تجمع ابتكار")])
+
+def _model_id() -> str:
+    return f"{backend_name()}:{os.getenv('BGE_MODEL_PATH') or 'BAAI/bge-m3'}"
 
 def _embed(texts: List[str]) -> np.ndarray:
-    vecs = _model.encode(texts, return_dense=True)["dense_vecs"]
-    return np.asarray(vecs, dtype="float32")
+    if _RERANK_MODE != "sparse":
+        vecs = _model.encode(texts, return_dense=True)["dense_vecs"]
+        return np.asarray(vecs, dtype="float32")
+    # Same forward pass also yields the query lexical weights for rescoring
+    enc = _model.encode(texts, return_dense=True, return_sparse=True)
+    for t, w in zip(texts, enc["lexical_weights"]):
+        _spw_cache.put(make_key(_model_id(), t), to_query(w))
+    return np.asarray(enc["dense_vecs"], dtype="float32")
+
+def _query_sparse(query: str) -> Tuple[np.ndarray, np.ndarray]:
+    q = _spw_cache.get(make_key(_model_id(), query))
+    if q is None:
+        q = to_query(_model.encode([query], return_dense=False, return_sparse=True)["lexical_weights"][0])
+        _spw_cache.put(make_key(_model_id(), query), q)
+    return q
+
+def _embed_cached(texts: List[str]) -> np.ndarray:
+    """_embed() with the embedding cache in front; only misses hit the model (in one call)."""
+    if not _CACHE_ON:
+        return _embed(texts)
+    keys = [make_key(_model_id(), t) for t in texts]
+    out: List[Optional[np.ndarray]] = [_emb_cache.get(k) for k in keys]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        fresh = _embed([texts[i] for i in missing])
+        for i, v in zip(missing, fresh):
+            out[i] = v
+            _emb_cache.put(keys[i], v)
+    return np.vstack(out).astype("float32", copy=False)
+
+# ---------------------------- Hybrid (lexical) -------------------------------
+# With a BM25 index next to the FAISS index, dense and lexical rankings are
+# fused with reciprocal-rank fusion; the BM25 side works on Arabic-normalized
+# tokens, so the second (normalized) dense query is no longer needed.
+_HYBRID = os.getenv("HYBRID_SEARCH", "1") == "1"
+_RRF_K = int(os.getenv("RRF_K", "60"))
+
+def _rrf(*rankings: List[int]) -> Dict[int, float]:
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for r, i in enumerate(ranking):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (_RRF_K + r + 1)
+    return fused
+
+# ------------------------- Dense recall (+ batching) -------------------------
+_ALL = ("*",)   # scope key meaning "no filtering at all"
+
+def _scope_key(scope: Any) -> Tuple[str, ...]:
+    if not scope:
+        return ()
+    if isinstance(scope, str):
+        scope = [scope]
+    return tuple(sorted(str(x).lower() for x in scope))
+
+def _scope_mask(s: _Store, key: Tuple[str, ...]) -> np.ndarray:
+    """Allowlist AND (union of the requested scopes)."""
+    if key == _ALL:
+        return np.ones(len(s.allowed_mask), dtype=bool)
+    if not key:
+        return s.allowed_mask
+    want = np.zeros(len(s.allowed_mask), dtype=bool)
+    for name in key:
+        spec = SCOPES.get(name) or ({"types": {name}} if name in SOURCE_TYPES else {"domains": {name}})
+        doms = [j for j, d in enumerate(s.domain_names) if d in spec.get("domains", ())]
+        types = [SOURCE_TYPES[t] for t in spec.get("types", ()) if t in SOURCE_TYPES]
+        want |= np.isin(s.domain_id, doms) | np.isin(s.source_type, types)
+    return s.allowed_mask & want
+
+def _search_params(s: _Store, mask: np.ndarray) -> Any:
+    """faiss SearchParameters restricting search to mask (None if this faiss build lacks them)."""
+    try:
+        bits = np.packbits(mask, bitorder="little")
+        sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits))
+        idx = faiss.downcast_index(s.index)
+        if hasattr(idx, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=sel, efSearch=int(os.getenv("FAISS_EF_SEARCH", "64")))
+        else:
+            try:
+                faiss.extract_index_ivf(idx)
+                params = faiss.SearchParametersIVF(sel=sel, nprobe=int(os.getenv("FAISS_NPROBE", "8")))
+            except Exception:
+                params = faiss.SearchParameters(sel=sel)
+        params._keep = (bits, sel)   # the selector only borrows these buffers
+        return params
+    except Exception:
+        return None
+
+def _filter(s: _Store, key: Tuple[str, ...]) -> Tuple[np.ndarray, Any]:
+    f = s.filters.get(key)
+    if f is None:
+        mask = _scope_mask(s, key)
+        f = s.filters[key] = (mask, _search_params(s, mask) if mask.any() else None)
+    return f
+
+def _search(s: _Store, texts: List[str], k: int, key: Tuple[str, ...] = ()) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """One encode + one FAISS search over the permitted subset -> [(D_row, I_row)]."""
+    x = _embed_cached(texts)
+    mask, params = _filter(s, key)
+    if not mask.any():
+        return [(np.empty(0, "float32"), np.empty(0, "int64")) for _ in texts]
+    if params is not None:
+        D, I = s.index.search(x, k, params=params)
+        return [(D[j], I[j]) for j in range(len(texts))]
+    # faiss without selector support: over-fetch, then drop via the mask array
+    D, I = s.index.search(x, min(s.index.ntotal, k * 4))
+    out = []
+    for d, i in zip(D, I):
+        ok = (i >= 0) & mask[np.clip(i, 0, len(mask) - 1)]
+        out.append((d[ok][:k], i[ok][:k]))
+    return out
+
+def _search_items(items: List[Tuple[_Store, str, int, Tuple[str, ...]]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Batch entry point: one encode + one search per distinct (build, scope) in the batch."""
+    out: List[Any] = [None] * len(items)
+    groups: Dict[Tuple[_Store, Tuple[str, ...]], List[int]] = {}
+    for j, (s, _, _, key) in enumerate(items):
+        groups.setdefault((s, key), []).append(j)
+    for (s, key), js in groups.items():
+        kmax = max(items[j][2] for j in js)
+        rows = _search(s, [items[j][1] for j in js], kmax, key)
+        for j, (d, i) in zip(js, rows):
+            k = items[j][2]
+            out[j] = (d[:k], i[:k])
+    return out
+
+# RETRIEVE_BATCHING=1: coalesce queries from concurrent sessions that arrive
+# within RETRIEVE_BATCH_WAIT_MS into one encode + search (max RETRIEVE_BATCH_MAX).
+_BATCHING = os.getenv("RETRIEVE_BATCHING", "0") == "1"
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+def _get_batcher() -> MicroBatcher:
+    # first queries arrive concurrently: a second batcher would split them across two worker threads
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    _search_items,
+                    max_wait_ms=float(os.getenv("RETRIEVE_BATCH_WAIT_MS", "5")),
+                    max_batch=int(os.getenv("RETRIEVE_BATCH_MAX", "32")),
+                    name="retrieve-batcher",
+                )
+    return _batcher
+
+def _dense_recall(s: _Store, texts: List[str], k: int, key: Tuple[str, ...] = ()) -> List[Tuple[np.ndarray, np.ndarray]]:
+    if not _BATCHING:
+        return _search(s, texts, k, key)
+    return _get_batcher().submit_many([(s, t, k, key) for t in texts])
+
+def batch_stats() -> Dict[str, Any]:
+    return _batcher.stats() if _batcher else {"batches": 0, "items": 0, "mean_batch": 0.0, "batch_sizes": {}}
 
 def _dedup_by_text(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Legacy query-time dedup, only for indexes built without ingest/dedup."""
     seen, out = set(), []
     for r in items:
         t = (r.get("text") or "").strip().lower()
@@ -54,40 +382,207 @@ def _dedup_by_text(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             seen.add(t); out.append(r)
     return out
 
-def _ar_normalize(s: str) -> str:
-    import re
-    s = re.sub(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]", "", s or "")
-    return s.replace("أ","ا").replace("إ","ا").replace("آ","ا").replace("ى","ي").replace("ة","ه")
+def _cache_query(query: str) -> str:
+    return " ".join(_ar_normalize(query).lower().split())
 
-def retrieve(query: str, top_k: int = 6) -> List[Dict[str, Any]]:
-    _load()
+# ------------------------------- Reranking -----------------------------------
+# RERANK_MODE=sparse replaces the cross-encoder with dense cosine +
+# SPARSE_WEIGHT * BGE-M3 lexical-weight overlap (a fraction of the CPU/RAM).
+# Cross-encoder scores are cached per (normalized query, chunk id, index version).
+# The rerank is skipped when the first-stage top-k is clearly separated from the
+# rest (gap between rank k and k+1 >= RERANK_SKIP_MARGIN on L2 distance, or
+# RRF_SKIP_MARGIN on fused scores in hybrid mode), and shrunk or
+# skipped when RETRIEVE_BUDGET_MS would otherwise be overrun.
+_score_cache = QueryCache("rrk", int(os.getenv("RERANK_CACHE_SIZE", "8192")),
+                          shared_disk_cache() if _CACHE_ON else None)
+_rerank_stats: Counter = Counter()
+_rerank_ms_per_pair: Optional[float] = None   # EWMA of observed cost
+
+def rerank_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = dict(_rerank_stats)
+    out["ms_per_pair"] = round(_rerank_ms_per_pair, 3) if _rerank_ms_per_pair else None
+    return out
+
+def _dense_cos(s: _Store, query: str, ids: List[int], dense: Dict[int, float]) -> np.ndarray:
+    """Cosine from the L2 distances of recall (BGE-M3 vectors are unit-norm);
+    chunks found only lexically are reconstructed from the index when possible."""
+    out = np.zeros(len(ids), dtype="float32")
+    qv = None
+    for j, i in enumerate(ids):
+        if i in dense:
+            out[j] = 1.0 - dense[i] / 2.0
+            continue
+        try:
+            if qv is None:
+                qv = _embed_cached([query])[0]
+            out[j] = float(np.dot(qv, s.index.reconstruct(int(i))))
+        except Exception:
+            pass   # e.g. IVF without a direct map / PQ codes
+    return out
+
+def _sparse_scores(s: _Store, query: str, cand: List[Tuple[int, Dict[str, Any], float]],
+                   dense: Dict[int, float]) -> List[float]:
+    ids = [i for i, _, _ in cand]
+    w = float(os.getenv("SPARSE_WEIGHT", "0.3"))
+    scores = _dense_cos(s, query, ids, dense) + w * s.sparse.scores(_query_sparse(query), ids)
+    return [float(x) for x in scores]
+
+def _score_pairs(s: _Store, query: str, cand: List[Tuple[int, Dict[str, Any], float]],
+                 dense: Optional[Dict[int, float]] = None) -> List[float]:
+    global _rerank_ms_per_pair
+    if _RERANK_MODE == "sparse":
+        return _sparse_scores(s, query, cand, dense or {})
+    qn = _cache_query(query)
+    keys = [make_key(qn, i, s.version) for i, _, _ in cand]
+    scores: List[Optional[float]] = [_score_cache.get(k) for k in keys]
+    missing = [j for j, v in enumerate(scores) if v is None]
+    _rerank_stats["score_cache_hit"] += len(cand) - len(missing)
+    _rerank_stats["score_cache_miss"] += len(missing)
+    if missing:
+        t = time.perf_counter()
+        fresh = _reranker.compute_score([(query, cand[j][1].get("text", "")) for j in missing], batch_size=32)
+        fresh = [float(x) for x in np.atleast_1d(fresh)]
+        ms = (time.perf_counter() - t) * 1000.0 / len(missing)
+        _rerank_ms_per_pair = ms if _rerank_ms_per_pair is None else 0.8 * _rerank_ms_per_pair + 0.2 * ms
+        for j, v in zip(missing, fresh):
+            scores[j] = v
+            _score_cache.put(keys[j], v)
+    return [float(v) for v in scores]
+
+def _rerank(s: _Store, query: str, cand: List[Tuple[int, Dict[str, Any], float]], top_k: int,
+            t0: float, budget_ms: float, margin: float = 0.0,
+            dense: Optional[Dict[int, float]] = None) -> Tuple[List[Tuple[int, Dict[str, Any], float]], bool]:
+    """cand: [(chunk_id, doc, rank_key)], lower key = better; dense: chunk_id -> L2
+    distance from recall. Returns (candidates in final order, complete); complete
+    is False when the time budget skipped or shrank the rerank."""
+    by_key = sorted(cand, key=lambda c: c[2])
+    scorer = s.sparse if _RERANK_MODE == "sparse" else _reranker if _RERANK_MODE == "cross" else None
+    if scorer is None:
+        _rerank_stats["skip_disabled"] += 1
+        return by_key, True
+    if len(cand) <= top_k:
+        _rerank_stats["skip_small"] += 1
+        return by_key, True
+
+    if margin > 0 and by_key[top_k][2] - by_key[top_k - 1][2] >= margin:
+        _rerank_stats["skip_margin"] += 1
+        return by_key, True
+
+    n = len(by_key)
+    if budget_ms > 0 and _rerank_ms_per_pair:
+        left = budget_ms - (time.perf_counter() - t0) * 1000.0
+        fits = int(left / _rerank_ms_per_pair) if left > 0 else 0
+        if fits <= top_k:
+            _rerank_stats["skip_budget"] += 1
+            return by_key, False
+        n = min(n, fits)
+
+    head, tail = by_key[:n], by_key[n:]
+    scores = _score_pairs(s, query, head, dense)
+    _rerank_stats[("shrunk" if tail else "full") + ("_sparse" if _RERANK_MODE == "sparse" else "")] += 1
+    ranked = [c for c, _ in sorted(zip(head, scores), key=lambda x: x[1], reverse=True)]
+    return ranked + tail, not tail
+
+def index_version() -> str:
+    return _store.version if _store is not None else ""
+
+def live_store() -> StorePaths:
+    """Build this process answers from: the loaded store (loading it if retrieval is local),
+    or, while a retrieval server serves and nothing is loaded here, the build `current` names."""
+    if _store is None and retrieval_client.enabled():
+        return resolve_store()
+    return _current().paths
+
+def embed_query(text: str, timeout: Optional[float] = None) -> Tuple[np.ndarray, str]:
+    """(unit-norm query embedding, index version) - shares the embedding cache
+    with retrieve(), so embedding a question first costs nothing extra."""
+    if retrieval_client.enabled():
+        try:
+            vec, version = retrieval_client.embed(text, timeout=timeout)
+            return np.asarray(vec, dtype="float32"), version
+        except ConnectionError:
+            if os.getenv("RETRIEVAL_FALLBACK", "1") != "1":
+                raise
+    s = _current()
+    v = _embed_cached([text])[0]
+    return v / max(float(np.linalg.norm(v)), 1e-12), s.version
+
+def retrieve(query: str, top_k: int = 6, budget_ms: Optional[float] = None,
+             scope: Any = None, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    scope: optional name/list from SCOPES (e.g. "teknofest"), a domain or a
+    source type ("gdoc" | "web" | "lms"); always intersected with ALLOW_DOMAINS.
+
+    With RETRIEVAL_SERVER_URL set this is a thin client of services/retrieval_server;
+    if the server is unreachable (or marked down) it falls back to in-process
+    retrieval (RETRIEVAL_FALLBACK=0 to raise instead). A busy, failing or slow
+    server raises: loading the models into every worker then would only add
+    memory pressure to an overloaded host. timeout (seconds) caps the wait on
+    the server, busy retries included.
+    """
+    if retrieval_client.enabled():
+        try:
+            return retrieval_client.retrieve(query, top_k=top_k, budget_ms=budget_ms, scope=scope, timeout=timeout)
+        except ConnectionError:
+            if os.getenv("RETRIEVAL_FALLBACK", "1") != "1":
+                raise
+    return retrieve_local(query, top_k=top_k, budget_ms=budget_ms, scope=scope)
+
+def retrieve_local(query: str, top_k: int = 6, budget_ms: Optional[float] = None,
+                   scope: Any = None) -> List[Dict[str, Any]]:
+    """In-process retrieval (what the retrieval server runs)."""
+    t0 = time.perf_counter()
+    s = _current()   # one build for the whole query, even if a reload lands meanwhile
     recall_k = int(os.getenv("RECALL_K", "60"))
+    if budget_ms is None:
+        budget_ms = float(os.getenv("RETRIEVE_BUDGET_MS", "0") or 0)
+    key = _scope_key(scope)
 
-    # Search with original + Arabic-normalized query (if Arabic present)
+    res_key = make_key(_cache_query(query), top_k, recall_k, s.version, _RERANK_MODE, key)
+    if _CACHE_ON:
+        hit = _res_cache.get(res_key)
+        if hit is not None:
+            return list(hit)
+
+    # Dense search with the original query (+ Arabic-normalized variant when
+    # there is no lexical index to cover exact/normalized terms)
     queries = [query]
-    if any("\u0600" <= c <= "\u06FF" for c in query):
+    if s.bm25 is None and any("\u0600" <= c <= "\u06FF" for c in query):
         queries.append(_ar_normalize(query))
 
-    # Merge recall results
-    idxs: List[int] = []
-    for q in _embed(queries):
-        D, I = _index.search(q.reshape(1, -1), recall_k)
-        idxs.extend([i for i in I[0] if i >= 0])
-
-    # Unique while preserving order
-    seen = set(); merged = []
-    for i in idxs:
-        if i not in seen and 0 <= i < len(_docs):
-            seen.add(i); merged.append(_docs[i])
-
-    # Filter by allowed sources (fallback if empty)
-    cand = [r for r in merged if _allowed(r.get("source",""))] or merged[:max(top_k, 10)]
-
-    # Optional reranking
-    if _reranker and len(cand) > top_k:
-        pairs = [(query, r.get("text","")) for r in cand]
-        scores = _reranker.compute_score(pairs, batch_size=32)
-        cand = [r for r,_ in sorted(zip(cand, scores), key=lambda x: x[1], reverse=True)]
-
-    cand = _dedup_by_text(cand)
-    return cand[:top_k]
+    # Exact top-k over the permitted subset (bitmap selector inside FAISS);
+    # if nothing is permitted, fall back to unfiltered recall as before.
+    mask, _ = _filter(s, key)
+    filtered = bool(mask.any())
+    if not filtered:
+        mask = np.ones(len(s.docs), dtype=bool)
+
+    # Merge recall results: best distance per id
+    best: Dict[int, float] = {}
+    for D, I in _dense_recall(s, queries, recall_k, key if filtered else _ALL):
+        for d, i in zip(D, I):
+            i = int(i)
+            if 0 <= i < len(s.docs) and (i not in best or d < best[i]):
+                best[i] = float(d)
+
+    if s.bm25 is not None:
+        # Rank key = -RRF score (lower is better, like an L2 distance)
+        dense_rank = sorted(best, key=best.get)
+        lex_ids, _ = s.bm25.search(query, int(os.getenv("LEXICAL_K", str(recall_k))), mask=mask)
+        fused = _rrf(dense_rank, [int(i) for i in lex_ids if 0 <= i < len(s.docs)])
+        cand = [(i, s.docs[i], -f) for i, f in sorted(fused.items(), key=lambda x: -x[1])]
+        margin = float(os.getenv("RRF_SKIP_MARGIN", "0") or 0)
+    else:
+        cand = [(i, s.docs[i], d) for i, d in best.items()]
+        margin = float(os.getenv("RERANK_SKIP_MARGIN", "0") or 0)
+    if not filtered:
+        cand = cand[:max(top_k, 10)]
+
+    # Optional reranking (cached, adaptive)
+    cand, complete = _rerank(s, query, cand, top_k, t0, budget_ms, margin, best)
+
+    out = [doc for _, doc, _ in cand]
+    out = (out if s.deduped else _dedup_by_text(out))[:top_k]
+    if _CACHE_ON and complete:   # a budget-degraded order must not outlive this request
+        _res_cache.put(res_key, out)
+    return list(out)
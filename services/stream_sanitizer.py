@@ -0,0 +1,343 @@
+# services/stream_sanitizer.py
+"""
+Answer clean-up for streamed model output (also used one-shot for full
+answers, so both paths give the same text):
+
+  1. drop [thought] / [/thought], <|...|> special tokens and "/think" to end of line
+  2. drop ``` fenced blocks ``` (an unclosed fence is kept as text)
+  3. drop leading whitespace and an "Answer:" / "إجابة:" lead-in
+  4. Markdown-link naked URLs and bare domains; existing [label](url) links
+     are kept as they are
+  5. cut everything from a "Sources" / "المصادر" heading line on (unless
+     INLINE_SOURCES) and trailing whitespace
+
+Each stage is a small state machine that emits decided text at once and
+holds back only the tail that later input could still change (a partial
+tag, an open fence, the current word, a line that may turn into the
+Sources heading). Held text is never re-scanned from the start, so the
+work is linear in the output length.
+"""
+from typing import Optional
+import re
+
+_TAG_MAX = 64        # longest <|...|> special token we wait for
+_LABEL_MAX = 300     # [label](url) limits: a "[" further from its "]" / ")" is plain text
+_URL_MAX = 2000
+
+
+def _is_word(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+def _prefixes(*words: str) -> str:
+    return "|".join(re.escape(w[:k]) for w in words for k in range(1, len(w) + 1))
+
+
+# ---- 1. special tokens ----
+
+_TAG_START_RE = re.compile(r"[\[</]")
+
+
+class _Tags:
+    def __init__(self) -> None:
+        self.buf = ""
+        self.drop_line = False    # inside "/think ..." up to the newline
+
+    def feed(self, text: str, final: bool = False) -> str:
+        s, out, i, start = self.buf + text, [], 0, 0
+        n = len(s)
+        while i < n:
+            if self.drop_line:
+                j = s.find("\n", i)
+                if j < 0:
+                    i = start = n
+                    break
+                self.drop_line = False
+                i = start = j         # the newline itself stays
+                continue
+            m = _TAG_START_RE.search(s, i)
+            if not m:
+                i = n
+                break
+            i = m.start()
+            end = self._match(s, i, final)
+            if end is None:           # undecided: hold from here
+                break
+            if end < 0:               # not a tag
+                i += 1
+                continue
+            out.append(s[start:i])
+            if end == 0:              # /think: drop to end of line
+                self.drop_line = True
+                end = i + 6
+            i = start = end
+        out.append(s[start:i])
+        self.buf = s[i:]
+        return "".join(out)
+
+    @staticmethod
+    def _match(s: str, i: int, final: bool) -> Optional[int]:
+        """End index of the token at i; -1 = none; 0 = '/think' (line); None = undecided."""
+        n, c = len(s), s[i]
+        if c == "[":
+            seg = s[i:i + 10].lower()
+            for lit in ("[thought]", "[/thought]"):
+                if seg.startswith(lit):
+                    return i + len(lit)
+            if not final and i + 10 > n and any(lit.startswith(seg) for lit in ("[thought]", "[/thought]")):
+                return None
+            return -1
+        if c == "<":
+            if i + 1 >= n:
+                return -1 if final else None
+            if s[i + 1] != "|":
+                return -1
+            k = s.find(">", i + 2, i + 2 + _TAG_MAX)
+            if k < 0:
+                return -1 if final or n >= i + 2 + _TAG_MAX else None
+            return k + 1 if k - 1 >= i + 2 and s[k - 1] == "|" else -1
+        # "/think" followed by a word boundary
+        seg = s[i + 1:i + 6].lower()
+        if len(seg) < 5:
+            return None if not final and "think".startswith(seg) else -1
+        if seg != "think":
+            return -1
+        if i + 6 >= n:
+            return 0 if final else None
+        return -1 if _is_word(s[i + 6]) else 0
+
+
+# ---- 2. fenced blocks ----
+
+class _Fences:
+    def __init__(self) -> None:
+        self.buf = ""
+        self.open = False      # buf starts with an opening ``` whose close is pending
+        self.scan = 3          # where to look for the closing fence in buf
+
+    def feed(self, text: str, final: bool = False) -> str:
+        s, out = self.buf + text, []
+        i = 0
+        while True:
+            if self.open:
+                j = s.find("```", i + self.scan)
+                if j < 0:
+                    if final:              # never closed: kept as text
+                        out.append(s[i:])
+                        i = len(s)
+                        self.open = False
+                    else:
+                        self.scan = max(3, len(s) - i - 2)
+                    break
+                i = j + 3
+                self.open = False
+                continue
+            k = s.find("`", i)
+            if k < 0:
+                out.append(s[i:])
+                i = len(s)
+                break
+            if s.startswith("```", k):
+                out.append(s[i:k])
+                i, self.open, self.scan = k, True, 3
+                continue
+            if not final and k + 3 > len(s) and "```".startswith(s[k:]):
+                out.append(s[i:k])
+                i = k
+                break
+            out.append(s[i:k + 1])
+            i = k + 1
+        self.buf = s[i:]
+        return "".join(out)
+
+
+# ---- 3. lead-in ----
+
+_ANSWER_RE = re.compile(r"\s*(?:answer|إجابة)\s*:\s*", re.IGNORECASE)
+_ANSWER_MAYBE_RE = re.compile(r"\s*(?:(?:answer|إجابة)\s*|" + _prefixes("answer", "إجابة") + r")?", re.IGNORECASE)
+
+
+class _LeadIn:
+    def __init__(self) -> None:
+        self.buf = ""
+        self.done = False
+
+    def feed(self, text: str, final: bool = False) -> str:
+        if self.done:
+            return text
+        s = self.buf + text
+        m = _ANSWER_RE.match(s)
+        if m and (m.end() < len(s) or final):
+            self.done, self.buf = True, ""
+            return s[m.end():]
+        if not final and (m or _ANSWER_MAYBE_RE.fullmatch(s)):
+            self.buf = s
+            return ""
+        self.done, self.buf = True, ""
+        return s.lstrip()
+
+
+# ---- 4. links ----
+
+_LINK_RE = re.compile(
+    r"(?P<md>\[[^\]]{1,%d}\]\(https?://[^)]{1,%d}\))"       # existing Markdown link: keep
+    r"|(?P<url>(?<!\()https?://[^\s)]+)"                    # naked URL
+    r"|(?<![(\]])\b(?P<dom>(?:www\.)?[A-Za-z0-9.-]+\.[A-Za-z]{2,}(?:/[^\s)]+)?)\b"   # bare domain
+    % (_LABEL_MAX, _URL_MAX)
+)
+_LINK_SCAN_RE = re.compile(r"[\[\s]")
+
+
+def _link(m: "re.Match[str]") -> str:
+    if m.group("md"):
+        return m.group(0)
+    url = m.group("url") or m.group("dom")
+    link = url if url.startswith(("http://", "https://")) else "https://" + url
+    label = re.sub(r"^https?://", "", link).split("/")[0]
+    return f"[{label}]({link})"
+
+
+def linkify(text: str) -> str:
+    """Wrap naked URLs and bare domains as Markdown links (one pass: output is never re-scanned)."""
+    return _LINK_RE.sub(_link, text or "")
+
+
+def _md_link_end(s: str, i: int, final: bool) -> Optional[int]:
+    """s[i] == '[': end of the [label](http...) link starting there, -1 if none, None if undecided."""
+    n = len(s)
+    j = s.find("]", i + 1, i + 2 + _LABEL_MAX)
+    if j < 0:
+        return -1 if final or n >= i + 2 + _LABEL_MAX else None
+    if j == i + 1:
+        return -1
+    p = j + 1
+    if p >= n:
+        return -1 if final else None
+    if s[p] != "(":
+        return -1
+    rest = s[p + 1:p + 9]
+    if rest.startswith("https://"):
+        q = p + 9
+    elif rest.startswith("http://"):
+        q = p + 8
+    elif not final and p + 9 > n and ("https://".startswith(rest) or "http://".startswith(rest)):
+        return None
+    else:
+        return -1
+    k = s.find(")", q, q + _URL_MAX + 1)
+    if k < 0:
+        return -1 if final or n >= q + _URL_MAX + 1 else None
+    return k + 1 if k > q else -1
+
+
+class _Links:
+    """
+    Text is released up to the last whitespace that no [label](url) link
+    spans: matches never cross such a point, so the released part links
+    exactly as it would inside the whole answer.
+    """
+
+    def __init__(self) -> None:
+        self.buf = ""
+        self.pos = 0      # scanned up to here in buf
+        self.safe = 0     # buf[:safe] can be released
+
+    def feed(self, text: str, final: bool = False) -> str:
+        s = self.buf + text
+        if final:
+            self.buf, self.pos, self.safe = "", 0, 0
+            return linkify(s)
+        pos = self.pos
+        while True:
+            m = _LINK_SCAN_RE.search(s, pos)
+            if not m:
+                pos = len(s)
+                break
+            i = m.start()
+            if s[i] != "[":
+                self.safe = pos = i + 1
+                continue
+            end = _md_link_end(s, i, final)
+            if end is None:
+                pos = i
+                break
+            pos = end if end > 0 else i + 1
+        cut = self.safe
+        self.buf, self.pos, self.safe = s[cut:], pos - cut, 0
+        return linkify(s[:cut])
+
+
+# ---- 5. Sources heading + trailing whitespace ----
+
+_SOURCES_RE = re.compile(r"\n+\s*(?:#{1,3}\s*)?(?:\*\*?\s*)?(?:sources|المصادر)", re.IGNORECASE)
+_SOURCES_MAYBE_RE = re.compile(r"\n+\s*(?:#{1,3}\s*)?(?:\*\*?\s*)?(?:" + _prefixes("sources", "المصادر") + r")?",
+                               re.IGNORECASE)
+_NON_SPACE_RE = re.compile(r"\S")
+
+
+class _Tail:
+    def __init__(self, strip_sources: bool) -> None:
+        self.strip_sources = strip_sources
+        self.buf = ""
+        self.stopped = False      # reached the Sources heading; everything after is dropped
+
+    def feed(self, text: str, final: bool = False) -> str:
+        if self.stopped:
+            return ""
+        s = self.buf + text
+        end = len(s)              # s[:end] is decided
+        if self.strip_sources:
+            i = 0
+            while True:
+                i = s.find("\n", i)
+                if i < 0:
+                    break
+                if _SOURCES_RE.match(s, i):
+                    self.stopped = True
+                    end = i
+                    break
+                if not final and _SOURCES_MAYBE_RE.fullmatch(s, i):
+                    end = i
+                    break
+                # no heading can start in this newline run: skip to the next line
+                m = _NON_SPACE_RE.search(s, i)
+                i = s.find("\n", m.start()) if m else -1
+                if i < 0:
+                    break
+        head = s[:end]
+        keep = len(head.rstrip())   # trailing whitespace waits for more text
+        self.buf = "" if self.stopped or final else s[keep:]
+        return head[:keep]
+
+
+# ---- Pipeline ----
+
+class StreamSanitizer:
+    """feed(chunk) -> text safe to show now; finish() -> the rest. `stopped` once the Sources heading is reached."""
+
+    def __init__(self, linkify: bool = True, strip_sources: bool = True):
+        self._tail = _Tail(strip_sources)
+        self._stages = [_Tags(), _Fences(), _LeadIn()] + ([_Links()] if linkify else []) + [self._tail]
+
+    @property
+    def stopped(self) -> bool:
+        return self._tail.stopped
+
+    def feed(self, chunk: str) -> str:
+        for stage in self._stages:
+            if not chunk:
+                return ""
+            chunk = stage.feed(chunk)
+        return chunk
+
+    def finish(self) -> str:
+        text = ""
+        for stage in self._stages:
+            text = stage.feed(text, final=True)
+        return text
+
+
+def sanitize(text: str, linkify: bool = True, strip_sources: bool = True) -> str:
+    """One-shot form: the same result as streaming `text` in any split."""
+    s = StreamSanitizer(linkify=linkify, strip_sources=strip_sources)
+    return s.feed(text or "") + s.finish()
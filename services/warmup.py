@@ -0,0 +1,80 @@
+# services/warmup.py
+"""
+Background warm-up + readiness for the chat process.
+
+start_warmup() (idempotent, once per process) loads the encoder, reranker,
+FAISS index and chunk store in a daemon thread and runs a dummy query, so the
+UI can show "warming up" instead of blocking the first user for tens of
+seconds. With HEALTH_PORT set, a tiny HTTP probe is served on 127.0.0.1:
+  GET /healthz  -> 200 while the process is alive
+  GET /readyz   -> 200 once warm, 503 while warming / after a failure
+"""
+from typing import Any, Dict, Optional
+import os, json, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_state: Dict[str, Any] = {"state": "cold", "started_at": None, "ready_at": None, "seconds": None, "error": None}
+_lock = threading.Lock()
+_ready = threading.Event()
+_health_server: Optional[ThreadingHTTPServer] = None
+
+
+def _run() -> None:
+    t0 = time.time()
+    try:
+        from services import retriever
+        retriever.warmup()
+        _state.update(state="ready", ready_at=time.time(), seconds=round(time.time() - t0, 1))
+        _ready.set()
+    except Exception as e:
+        _state.update(state="failed", error=f"{type(e).__name__}: {e}", seconds=round(time.time() - t0, 1))
+
+
+def start_warmup() -> None:
+    with _lock:
+        if _state["state"] == "cold":
+            _state.update(state="warming", started_at=time.time())
+            threading.Thread(target=_run, name="warmup", daemon=True).start()
+        port = int(os.getenv("HEALTH_PORT", "0") or 0)
+        if port and _health_server is None:
+            _start_health_server(port)
+
+
+def readiness() -> Dict[str, Any]:
+    return dict(_state)
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def wait_ready(timeout: Optional[float] = None) -> bool:
+    return _ready.wait(timeout)
+
+
+class _Probe(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/healthz"):
+            code, body = 200, {"alive": True}
+        elif self.path.startswith("/readyz"):
+            code, body = (200 if is_ready() else 503), readiness()
+        else:
+            code, body = 404, {"error": "not found"}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):   # keep probes out of the service log
+        pass
+
+
+def _start_health_server(port: int) -> None:
+    global _health_server
+    try:
+        _health_server = ThreadingHTTPServer((os.getenv("HEALTH_HOST", "127.0.0.1"), port), _Probe)
+    except OSError:
+        return   # another worker on this host already serves the probe
+    threading.Thread(target=_health_server.serve_forever, name="health", daemon=True).start()
@@ -0,0 +1,156 @@
+# tests/test_llm_router.py
+# services/llm_router.Router health and llm_client hedging against
+# tools/mock_llm replicas with injected 503s and stalls: ejection and its
+# back-off, read timeouts carrying no verdict, the hedge and its loser's
+# release, and no hedging with a single healthy replica.
+# run: python -m pytest -q tests/test_llm_router.py   (or python tests/test_llm_router.py)
+import os, sys, time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import llm_client, llm_router
+from tools.mock_llm import MockConfig, serve
+
+# no retries, no hedge, no health probes unless a test asks for them
+_ENV = {"LLM_RETRIES": "0", "LLM_BACKOFF_S": "0.01", "LLM_HEALTH_INTERVAL_S": "0", "LLM_EJECT_AFTER": "2",
+        "LLM_EJECT_S": "0.3", "LLM_HEDGE": "0", "LLM_HEDGE_DELAY_MS": "", "LLM_STREAM": "1"}
+
+
+@pytest.fixture
+def mock_replica():
+    """mock_replica(**config) -> (url, config) of a running mock; change the config's rates
+    while it runs. The servers are shut down after the test."""
+    servers = []
+
+    def start(**kw):
+        opts = dict(tps=400.0, ttft_ms=0.0, ttft_sigma=0.0, prefill_ms_per_1k=0.0, answer_tokens=8, seed=1)
+        opts.update(kw)
+        cfg = MockConfig(**opts)
+        srv = serve(cfg)
+        servers.append(srv)
+        return f"http://127.0.0.1:{srv.server_port}/generate", cfg
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+@pytest.fixture
+def make_router(monkeypatch):
+    """make_router(urls, **env) -> fresh process router over urls with _ENV plus env set; the
+    environment and llm_router's process router are restored after the test."""
+    monkeypatch.setattr(llm_router, "_router", None)
+
+    def make(urls, **env):
+        for k, v in {**_ENV, "LLMAR_API_URLS": ",".join(urls), **env}.items():
+            monkeypatch.setenv(k, v)
+        llm_router._router = None
+        return llm_router.get_router()
+
+    return make
+
+
+def _record_ends(router):
+    """List that collects (url, ok) for every Router.end call."""
+    calls, end = [], router.end
+    def recording(ep, ok, latency_ms=None):
+        calls.append((ep.url, ok))
+        end(ep, ok, latency_ms)
+    router.end = recording
+    return calls
+
+
+def _wait_for(cond, timeout=3.0):
+    t = time.monotonic() + timeout
+    while not cond() and time.monotonic() < t:
+        time.sleep(0.02)
+    return cond()
+
+
+def test_ejection_after_failures_doubles_backoff(mock_replica, make_router):
+    url, cfg = mock_replica(error_rate=1.0)
+    router = make_router([url])
+    ep = router.endpoints[0]
+
+    assert llm_client.call_llm("hi")["text"].startswith("[HTTP error] 503")   # #1
+    assert ep.healthy and ep.fails == 1
+    llm_client.call_llm("hi")                                                 # #2 -> ejected for LLM_EJECT_S
+    assert not ep.healthy and ep.ejections == 1
+    assert 0.2 < ep.ejected_until - time.monotonic() <= 0.3
+    assert cfg.counters["errors"] == 2
+
+    assert _wait_for(lambda: ep.healthy)
+    llm_client.call_llm("hi"); llm_client.call_llm("hi")
+    assert not ep.healthy and ep.ejections == 2
+    assert 0.5 < ep.ejected_until - time.monotonic() <= 0.6   # doubled
+    assert router.counters["ejections"] == 2
+
+    # only one replica: still used while ejected; a success resets the back-off
+    cfg.error_rate = 0.0
+    assert llm_client.call_llm("hi")["text"].startswith("Ibtikar")
+    assert ep.ejections == 0 and ep.fails == 0
+
+
+def test_read_timeout_does_not_eject(mock_replica, make_router):
+    url, cfg = mock_replica(stall_rate=1.0, stall_s=1.0)
+    router = make_router([url])
+    ends = _record_ends(router)
+    ep = router.endpoints[0]
+    for _ in range(3):
+        assert llm_client.call_llm("hi", timeout=0.2)["text"].startswith("[HTTP error]")
+    try:
+        "".join(llm_client.stream_llm("hi", timeout=0.2))
+        raise AssertionError("stream did not time out")
+    except Exception as e:
+        assert llm_client._read_timeout(e), e
+    assert ends == [(url, None)] * 4
+    assert ep.healthy and ep.fails == 0 and ep.errors == 0 and ep.ejections == 0
+
+
+def test_hedge_fires_after_delay_and_releases_loser(mock_replica, make_router):
+    slow, _ = mock_replica(ttft_ms=1200.0)
+    fast, fast_cfg = mock_replica()
+    router = make_router([slow, fast], LLM_HEDGE="1", LLM_HEDGE_DELAY_MS="200")
+    ends = _record_ends(router)
+    pick = router.pick
+    router.pick = lambda exclude=(): pick(exclude) if exclude else router.endpoints[0]   # start on the slow one
+
+    assert router.hedge_delay_s() == 0.2
+    t = time.perf_counter()
+    out = "".join(llm_client.stream_llm("hi"))
+    dt = time.perf_counter() - t
+    assert out.startswith("Ibtikar")
+    assert 0.2 <= dt < 1.0, dt
+    assert router.counters["hedged"] == 1 and router.counters["hedge_won"] == 1
+    assert fast_cfg.counters["streams"] == 1
+    assert (fast, True) in ends
+
+    # the slow leg answers after it lost: its response is closed with no health verdict
+    assert _wait_for(lambda: any(u == slow for u, _ in ends)), ends
+    assert (slow, None) in ends and (slow, False) not in ends
+    assert _wait_for(lambda: all(e.outstanding == 0 for e in router.endpoints))
+    assert all(e.healthy and e.fails == 0 for e in router.endpoints)
+
+
+def test_single_healthy_replica_never_hedges(mock_replica, make_router):
+    slow, cfg = mock_replica(ttft_ms=400.0)
+    router = make_router([slow], LLM_HEDGE="1", LLM_HEDGE_DELAY_MS="100")
+    assert router.hedge_delay_s() is None
+    assert "".join(llm_client.stream_llm("hi"))
+    assert router.counters["hedged"] == 0 and cfg.counters["requests"] == 1
+
+    # two replicas, one ejected: still no second leg
+    other, other_cfg = mock_replica()
+    router = make_router([slow, other], LLM_HEDGE="1", LLM_HEDGE_DELAY_MS="100")
+    for _ in range(router.eject_after):
+        router.end(router.endpoints[1], ok=False)
+    assert router.healthy_count() == 1 and router.hedge_delay_s() is None
+    assert "".join(llm_client.stream_llm("hi"))
+    assert router.counters["hedged"] == 0 and other_cfg.counters["requests"] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-q", __file__]))   # the tests need pytest's fixtures
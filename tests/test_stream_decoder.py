@@ -0,0 +1,73 @@
+# tests/test_stream_decoder.py
+# services/llm_client._StreamDecoder on the stream shapes servers send:
+# delta events that happen to extend the text so far must stay deltas, and
+# only vLLM /generate (prompt echo, {"text": [...]}) is decoded as cumulative.
+# run: python -m pytest -q tests/test_stream_decoder.py   (or python tests/test_stream_decoder.py)
+import os, sys, json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.llm_client import _StreamDecoder
+
+# deltas where each one starts with the text before it
+PREFIX_DELTAS = [
+    [" ", " The", " chatbot", " answers", "."],
+    ["\n", "\nHello", " world"],
+    ["#", "## Title", " more"],
+    ["a", "ab", "abc"],
+]
+
+
+def _decode(events, prompt="", split=None):
+    """Joined output for SSE events (dicts), fed whole or cut every `split` bytes."""
+    body = "".join(f"data: {json.dumps(e, ensure_ascii=False)}\n\n" for e in events) + "data: [DONE]\n\n"
+    raw = body.encode("utf-8")
+    dec = _StreamDecoder(prompt)
+    step = split or len(raw)
+    out = []
+    for i in range(0, len(raw), step):
+        out += dec.feed(raw[i:i + step])
+    out += dec.flush()
+    assert dec.done
+    return "".join(out)
+
+
+def test_openai_deltas_that_extend_the_text():
+    for deltas in PREFIX_DELTAS:
+        events = [{"choices": [{"index": 0, "delta": {"content": d}}]} for d in deltas]
+        for prompt in ("", "Question: what is Ibtikar?"):
+            for split in (None, 1, 7):
+                assert _decode(events, prompt, split) == "".join(deltas), (deltas, prompt, split)
+
+
+def test_tgi_tokens_that_extend_the_text():
+    for deltas in PREFIX_DELTAS:
+        events = [{"token": {"id": i, "text": d, "special": False}} for i, d in enumerate(deltas)]
+        assert _decode(events, "Q") == "".join(deltas), deltas
+
+
+def test_openai_completion_text_chunks():
+    deltas = PREFIX_DELTAS[0]
+    events = [{"choices": [{"index": 0, "text": d}]} for d in deltas]
+    assert _decode(events) == "".join(deltas)
+
+
+def test_vllm_generate_cumulative():
+    prompt = "Question: hi\nAnswer:"
+    steps = [" The", " The chatbot", " The chatbot answers."]
+    assert _decode([{"text": [prompt + s]} for s in steps], prompt) == " The chatbot answers."
+    assert _decode([{"text": [s]} for s in steps], prompt) == " The chatbot answers."   # no echo
+    assert _decode([{"text": prompt + s} for s in steps], prompt) == " The chatbot answers."
+
+
+def test_deltas_echoing_the_prompt_are_kept():
+    # a delta equal to the prompt's start is model output, not an echo
+    events = [{"choices": [{"delta": {"content": d}}]} for d in ["Q", "Q: yes"]]
+    assert _decode(events, "Q") == "QQ: yes"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print("ok", name)
@@ -0,0 +1,126 @@
+# tests/test_stream_sanitizer.py
+# Adversarial chunk splits for services/stream_sanitizer: whatever way the
+# model output is cut into stream chunks, the text shown must equal the
+# one-shot clean-up of the whole answer.
+# run: python -m pytest -q tests/test_stream_sanitizer.py   (or python tests/test_stream_sanitizer.py)
+import os, sys, time, random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.stream_sanitizer import StreamSanitizer, sanitize
+
+CORPUS = [
+    "Answer: Ibtikar supports startups.",
+    "  إجابة :  تجمع ابتكار يدعم الشركات الناشئة.",
+    "Answers are below: see ibtikar.org.tr for details.",
+    "<|im_start|>assistant\nHello<|im_end|> world<|end_of_turn|>",
+    "a <| not a tag > b <||> c <|> d <|x|y|>e",
+    "[thought]hidden?[/thought]Visible [THOUGHT] text [x](https://a.b) [/thought]",
+    "Before /think secret plan\nAfter /thinking is fine /think",
+    "Intro\n```python\nprint('x')\n```\nOutro ``` unclosed fence",
+    "````x``` y `` z ` w",
+    "Visit https://ibtikar.org.tr/programs/incubation?x=1 or www.example.com/a/b today.",
+    "Already linked: [Ibtikar site](https://ibtikar.org.tr/about) and [a b\nc](http://x.y/z w) end",
+    "Nested [a [b](https://c.d) e] and [](https://empty.io) and [x](ftp://no.pe)",
+    "(https://in.paren) and (bare.domain.com) and ](after.bracket.com)",
+    "Mail info@ibtikar.org, site ibtikar.org.tr. Node.js e.g. v1.2",
+    "Points:\n- one\n- two\n\n### **Sources**\n- https://ibtikar.org.tr\n- more",
+    "Text\n\n  **المصادر:**\n- رابط",
+    "Line\n#### Sources is not a heading\nsources at line start\nend",
+    "Keep\n## Sourcing partners\nok",
+    "Resources\nSourcesque\n  \n \t\n",
+    "no trailing newline\n\n\n",
+    "\n\n\nSources: at the very start",
+    "x" * 300 + " [" + "l" * 400 + "](https://long.label) tail",
+    "[open bracket without close " + "y " * 200,
+    "mixed عربي ibtikar.org.tr و https://example.com/ar/صفحة نص",
+]
+
+
+def _stream(text, cuts, **kw):
+    s = StreamSanitizer(**kw)
+    out, prev = [], 0
+    for c in list(cuts) + [len(text)]:
+        out.append(s.feed(text[prev:c]))
+        prev = c
+    out.append(s.finish())
+    return "".join(out)
+
+
+def test_expected_output():
+    assert sanitize("Answer: Ibtikar supports startups.") == "Ibtikar supports startups."
+    assert sanitize("<|im_start|>assistant\nHello<|im_end|> world<|end_of_turn|>") == "assistant\nHello world"
+    assert sanitize("a <|> b <||> c") == "a <|> b  c"
+    assert sanitize("Before /think secret\nAfter") == "Before \nAfter"
+    assert sanitize("Intro\n```\ncode\n```\nOutro") == "Intro\n\nOutro"
+    assert sanitize("see https://x.com/a") == "see [x.com](https://x.com/a)"
+    assert sanitize("see x.com/a") == "see [x.com](https://x.com/a)"
+    assert sanitize("[X](https://x.com) ok") == "[X](https://x.com) ok"
+    assert sanitize("Hi\n\n**Sources:**\n- a") == "Hi"
+    assert sanitize("Hi\n\n**Sources:**\n- a", strip_sources=False) == "Hi\n\n**Sources:**\n- a"
+    assert sanitize("Hi\n#### Sources") == "Hi\n#### Sources"
+    assert sanitize("نص\nالمصادر: ...") == "نص"
+
+
+def test_every_two_way_split():
+    for text in CORPUS:
+        whole = sanitize(text)
+        for i in range(len(text) + 1):
+            assert _stream(text, [i]) == whole, (text, i)
+
+
+def test_char_by_char():
+    for text in CORPUS:
+        for kw in ({}, {"linkify": False}, {"strip_sources": False}):
+            assert _stream(text, range(1, len(text)), **kw) == sanitize(text, **kw), (text, kw)
+
+
+def test_random_splits():
+    rng = random.Random(7)
+    for text in CORPUS:
+        whole = sanitize(text)
+        for _ in range(200):
+            k = rng.randint(1, min(12, len(text)))
+            cuts = sorted(rng.sample(range(1, len(text)), k - 1)) if len(text) > k else []
+            assert _stream(text, cuts) == whole, (text, cuts)
+
+
+def test_sources_heading_stops_stream():
+    s = StreamSanitizer()
+    shown = s.feed("Answer body.\n\n## Sour")
+    assert not s.stopped
+    shown += s.feed("ces\n- https://ibtikar.org.tr")
+    assert s.stopped
+    assert s.feed(" more text") == ""
+    assert shown + s.finish() == "Answer body."
+
+
+def test_holds_only_undecided_tail():
+    # plain prose: at most the current word (it could still become a domain) plus the space is held
+    s = StreamSanitizer()
+    text = "Ibtikar runs incubation and mentoring programs for young founders " * 20
+    shown = ""
+    for i in range(len(text)):
+        shown += s.feed(text[i])
+        held = len(text[:i + 1].strip()) - len(shown)
+        assert held <= len(text[:i + 1].rsplit(" ", 2)[-2 if text[i] == " " else -1]) + 1, (i, held)
+
+
+def _timed(n):
+    text = ("Visit ibtikar.org.tr and https://example.com/p [doc](https://d.io/x) now. " * n)
+    t = time.perf_counter()
+    _stream(text, range(1, len(text), 3))
+    return time.perf_counter() - t
+
+
+def test_linear_work():
+    _timed(50)
+    small, big = _timed(400), _timed(1600)
+    assert big < small * 8, (small, big)   # ~4x for linear work; quadratic re-scans give ~16x
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print("ok", name)
@@ -0,0 +1,97 @@
+# tools/bench_prefill.py
+# Time-to-first-token (≈ prefill) of the chat prompt layouts against the live
+# LLM endpoint, one token generated per request:
+#   legacy  context first, instructions after it (layout before the prefix-cache change)
+#   text    static head first, one prompt string      (LLM_PROMPT_MODE=text)
+#   chat    static head first, system/user messages   (LLM_PROMPT_MODE=chat; needs a chat endpoint)
+# Each question is retrieved once and sent once per layout, so any speed-up
+# comes from the prefix shared *between* questions, not from repeats.
+# run: python -m tools.bench_prefill [--layouts legacy,text,chat] [--questions q.txt] [--n 20]
+import os, sys, time, argparse
+
+import yaml
+from dotenv import load_dotenv; load_dotenv()
+
+
+def _legacy_prompt(context: str, srcs, question: str, lang: str) -> str:
+    directive = "Respond in English." if lang == "en" else "أجب باللغة العربية."
+    src_hint = "\n".join(f"- {s}" for s in srcs) if srcs else "-"
+    return (
+        "Use the following context to answer the user accurately. "
+        "Answer ONLY with facts present in the context. If information is missing, say it is not available.\n\n"
+        f"Context:\n{context}\n\n"
+        f"Known sources (for reference only—do not invent new ones):\n{src_hint}\n\n"
+        f"Question: {question}\n"
+        f"{directive}\n"
+        "Do NOT include a 'Sources' section; the app will render sources below the answer.\n"
+        "Answer:"
+    )
+
+
+def _questions(path: str, n: int):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            qs = [l.strip() for l in f if l.strip()]
+    else:
+        with open(os.path.join("ingest", "canned_prompts.yaml"), encoding="utf-8") as f:
+            qs = list((yaml.safe_load(f) or {}).get("prompts") or [])
+    return qs[:n]
+
+
+def _ttft_ms(prompt: str, system: str, mode: str) -> float:
+    from services.llm_client import stream_llm
+    os.environ["LLM_PROMPT_MODE"] = mode
+    t = time.perf_counter()
+    gen = stream_llm(prompt, system=system, max_new_tokens=1)
+    try:
+        next(gen, None)
+    finally:
+        gen.close()
+    return (time.perf_counter() - t) * 1000
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else 0.0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--layouts", default="legacy,text,chat")
+    ap.add_argument("--questions", default="", help="one question per line (default: ingest/canned_prompts.yaml)")
+    ap.add_argument("--n", type=int, default=20)
+    args = ap.parse_args()
+
+    os.environ["LLM_HEDGE"] = "0"
+    from services import chat_logic as cl
+    from services.retriever import retrieve
+
+    cases = []
+    for q in _questions(args.questions, args.n):
+        lang = cl._detect_lang(q)
+        docs = retrieve(q, top_k=cl._TOP_K)
+        if not docs:
+            continue
+        context = cl._build_context(docs, q)
+        srcs = cl._unique_sources(docs)
+        system = cl.SYSTEM_PROMPT_AR if lang == "ar" else cl.SYSTEM_PROMPT_EN
+        cases.append((q, lang, context, srcs, system))
+    if not cases:
+        sys.exit("no questions with retrieved context")
+
+    print(f"{len(cases)} questions")
+    print(f"{'layout':8} {'p50_ms':>8} {'p95_ms':>8} {'first_ms':>9}")
+    for layout in [l.strip() for l in args.layouts.split(",") if l.strip()]:
+        lat = []
+        for q, lang, context, srcs, system in cases:
+            if layout == "legacy":
+                lat.append(_ttft_ms(_legacy_prompt(context, srcs, q, lang), system, "text"))
+            else:
+                prompt = cl._prompt_head(lang) + cl._prompt_body(context, srcs, q)
+                lat.append(_ttft_ms(prompt, system, layout))
+        # the first request of a layout warms the shared prefix; later ones show the steady state
+        print(f"{layout:8} {_pct(lat[1:] or lat, 0.5):8.1f} {_pct(lat[1:] or lat, 0.95):8.1f} {lat[0]:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# tools/check_encoder.py
+# Compare the torch and ONNX query encoders on the current corpus:
+# cosine agreement of dense vectors, per-query latency and process RSS.
+# run: python -m tools.check_encoder [--n 200] [--queries 50]
+import os, sys, json, time, argparse, subprocess, tempfile
+
+import numpy as np
+from dotenv import load_dotenv; load_dotenv()
+
+
+def _rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        import resource   # peak RSS; KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _texts(n: int):
+    from core.chunk_store import ChunkStore, has_chunk_store
+    from core.vectorstore import resolve_store
+    path = resolve_store().docs   # the live build (falls back to DOCS_JSON_PATH for the legacy layout)
+    docs = ChunkStore(path) if has_chunk_store(path) else json.load(open(path, encoding="utf-8"))
+    return [docs[i]["text"] for i in range(min(n, len(docs)))]
+
+
+def _worker(backend: str, n: int, n_queries: int, out: str):
+    """Runs in a fresh process so RSS reflects one backend only."""
+    os.environ["EMBED_BACKEND"] = backend
+    from services.encoders import load_encoder
+    rss0 = _rss_mb()
+    t = time.perf_counter()
+    enc = load_encoder()
+    load_s = time.perf_counter() - t
+    texts = _texts(n)
+    vecs = np.asarray(enc.encode(texts, batch_size=16)["dense_vecs"], dtype="float32")
+    lat = []
+    for q in texts[:n_queries]:
+        q = q[:200]   # query-sized input
+        t = time.perf_counter(); enc.encode([q]); lat.append((time.perf_counter() - t) * 1000)
+    np.save(out, vecs)
+    print(json.dumps({"backend": backend, "load_s": round(load_s, 2), "rss_mb": round(_rss_mb(), 1),
+                      "model_rss_mb": round(_rss_mb() - rss0, 1),
+                      "p50_ms": round(float(np.percentile(lat, 50)), 2),
+                      "p95_ms": round(float(np.percentile(lat, 95)), 2)}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200, help="corpus chunks to compare")
+    ap.add_argument("--queries", type=int, default=50, help="single-query latency samples")
+    ap.add_argument("--worker", choices=["torch", "onnx"])
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    if args.worker:
+        return _worker(args.worker, args.n, args.queries, args.out)
+
+    tmp = tempfile.mkdtemp()
+    res, vecs = {}, {}
+    for b in ("torch", "onnx"):
+        out = os.path.join(tmp, f"{b}.npy")
+        p = subprocess.run([sys.executable, "-m", "tools.check_encoder", "--worker", b, "--out", out,
+                            "--n", str(args.n), "--queries", str(args.queries)],
+                           capture_output=True, text=True)
+        if p.returncode != 0:
+            print(f"[error] {b} backend failed:\n{p.stderr[-2000:]}")
+            return
+        res[b] = json.loads(p.stdout.strip().splitlines()[-1])
+        vecs[b] = np.load(out)
+
+    cos = np.sum(vecs["torch"] * vecs["onnx"], axis=1)
+    # top-10 neighbour overlap when each backend searches its own corpus vectors
+    st, so = vecs["torch"] @ vecs["torch"].T, vecs["onnx"] @ vecs["onnx"].T
+    k = min(10, len(cos))
+    overlap = np.mean([len(set(np.argsort(-st[i])[:k]) & set(np.argsort(-so[i])[:k])) / k for i in range(len(cos))])
+
+    print(f"chunks compared : {len(cos)}")
+    print(f"cosine torch/onnx: mean {cos.mean():.4f}  p5 {np.percentile(cos, 5):.4f}  min {cos.min():.4f}")
+    print(f"top-{k} overlap   : {overlap:.3f}")
+    print(f"{'backend':<8} {'load s':>7} {'RSS MB':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for b, r in res.items():
+        print(f"{b:<8} {r['load_s']:>7} {r['rss_mb']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# tools/export_onnx_encoder.py
+# Export the BGE-M3 encoder to ONNX (+ dynamic int8 quantization) for EMBED_BACKEND=onnx.
+# run: python -m tools.export_onnx_encoder [--out DIR] [--no-quantize]
+import os, argparse
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv; load_dotenv()
+
+from services.encoders import onnx_dir
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=os.getenv("BGE_MODEL_PATH") or "BAAI/bge-m3")
+    ap.add_argument("--out", default=onnx_dir())
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--no-quantize", action="store_true")
+    args = ap.parse_args()
+
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out = Path(args.out); out.mkdir(parents=True, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModel.from_pretrained(args.model).eval()
+
+    sample = tok(["تجمع ابتكار", "Ibtikar"], padding=True, return_tensors="pt")
+    fp32 = out / "model.onnx"
+    print(f"[export] {args.model} -> {fp32}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (sample["input_ids"], sample["attention_mask"]), str(fp32),
+            input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "seq"},
+                          "attention_mask": {0: "batch", 1: "seq"},
+                          "last_hidden_state": {0: "batch", 1: "seq"}},
+            opset_version=args.opset,
+        )
+    tok.save_pretrained(out)
+
+    # Sparse head (lexical weights) as plain arrays for the numpy side
+    sp = Path(args.model) / "sparse_linear.pt"
+    if sp.exists():
+        state = torch.load(sp, map_location="cpu")
+        np.savez(out / "sparse_linear.npz", weight=state["weight"].numpy(), bias=state["bias"].numpy())
+        print("[export] sparse_linear.npz written")
+    else:
+        print("[warn] sparse_linear.pt not found; RERANK_MODE=sparse will need the torch backend.")
+
+    if not args.no_quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8 = out / "model.int8.onnx"
+        quantize_dynamic(str(fp32), str(int8), weight_type=QuantType.QInt8)
+        print(f"[export] int8 -> {int8} ({int8.stat().st_size / 2**20:.0f} MB, fp32 {fp32.stat().st_size / 2**20:.0f} MB)")
+    print("[done] set EMBED_BACKEND=onnx (ONNX_MODEL_DIR=%s)" % out)
+
+
+if __name__ == "__main__":
+    main()
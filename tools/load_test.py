@@ -0,0 +1,223 @@
+# tools/load_test.py
+# Drive services/chat_logic under N concurrent chat sessions and report
+# throughput, end-to-end latency, time to first visible text and the
+# per-stage breakdown (chat_logic.request_timings()) as a table and JSON.
+# Each session asks --turns questions (Arabic/English mix, --ar-share) with
+# exponential think time in between, like users on the Streamlit UI.
+# --mock starts tools/mock_llm in-process and points LLMAR_API_URL at it, so
+# only retrieval runs for real; otherwise the configured LLM endpoint is used.
+# The answer cache and canned answers are off unless --allow-cache.
+# run: python -m tools.load_test --sessions 20 --turns 5 --mock [--mock-tps 40 --mock-slots 16]
+#      python -m tools.load_test --sessions 100 --mode async --mock --json load.json
+import os, sys, json, time, random, asyncio, argparse, threading
+from collections import Counter
+
+from dotenv import load_dotenv; load_dotenv()
+
+from tools import mock_llm
+
+QUESTIONS_EN = [
+    "What is Ibtikar and how did it start?",
+    "What programs does Ibtikar offer for startups?",
+    "How can I join Ibtikar?",
+    "Does Ibtikar provide mentoring for entrepreneurs?",
+    "What events or trainings are coming up?",
+    "Who are Ibtikar's partners?",
+    "How do I apply to the incubation program?",
+    "Where is Ibtikar located and how can I contact them?",
+]
+QUESTIONS_AR = [
+    "ما هو تجمع ابتكار وكيف كانت بدايته؟",
+    "ما هي رؤية ورسالة تجمع ابتكار؟",
+    "ما هي الأنشطة والمشاريع التي ينفذها تجمع ابتكار؟",
+    "كيف يمكنني الانضمام إلى تجمع ابتكار؟",
+    "هل يقدم تجمع ابتكار برامج احتضان للشركات الناشئة؟",
+    "ما هي الدورات التدريبية المتاحة حاليًا؟",
+    "كيف أتواصل مع فريق تجمع ابتكار؟",
+    "من هم شركاء تجمع ابتكار؟",
+]
+
+
+def _question_pool(path: str):
+    if not path:
+        return QUESTIONS_EN, QUESTIONS_AR
+    from services.chat_logic import _detect_lang
+    with open(path, encoding="utf-8") as f:
+        qs = [l.strip() for l in f if l.strip()]
+    en = [q for q in qs if _detect_lang(q) == "en"]
+    ar = [q for q in qs if _detect_lang(q) == "ar"]
+    return en or ar, ar or en
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else 0.0
+
+
+def _dist(xs):
+    if not xs:
+        return {}
+    return {"n": len(xs), "mean": round(sum(xs) / len(xs), 1), "p50": round(_pct(xs, 0.50), 1),
+            "p95": round(_pct(xs, 0.95), 1), "p99": round(_pct(xs, 0.99), 1), "max": round(max(xs), 1)}
+
+
+# ---- Sessions ----
+
+def _plan(args, seed: int):
+    rng = random.Random(seed)
+    en, ar = _question_pool(args.questions)
+    turns = []
+    for _ in range(args.turns):
+        q = rng.choice(ar if rng.random() < args.ar_share else en)
+        think = rng.expovariate(1000.0 / args.think_ms) if args.think_ms > 0 else 0.0
+        turns.append((q, think))
+    return turns
+
+
+def _record(q: str, t0: float, t_first, chars: int, error):
+    from services.chat_logic import _detect_lang, request_timings
+    return {"lang": _detect_lang(q), "e2e_ms": (time.perf_counter() - t0) * 1000.0,
+            "ttft_ms": (t_first - t0) * 1000.0 if t_first else None, "chars": chars,
+            "error": error, "stages": request_timings()}
+
+
+def _thread_session(args, sid: int, out: list, lock: threading.Lock):
+    from services.chat_logic import process_user_input
+    time.sleep(args.ramp_s * sid / max(1, args.sessions))
+    for q, think in _plan(args, args.seed + sid):
+        t0, t_first, chars, error = time.perf_counter(), None, 0, None
+        try:
+            for chunk in process_user_input(q, stream=True):
+                if t_first is None and chunk:
+                    t_first = time.perf_counter()
+                chars += len(chunk)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        rec = _record(q, t0, t_first, chars, error)
+        with lock:
+            out.append(rec)
+        time.sleep(think)
+
+
+async def _async_session(args, sid: int, out: list):
+    from services.chat_logic import aprocess_user_input
+    await asyncio.sleep(args.ramp_s * sid / max(1, args.sessions))
+    for q, think in _plan(args, args.seed + sid):
+        t0, t_first, chars, error = time.perf_counter(), None, 0, None
+        try:
+            gen = await aprocess_user_input(q, stream=True)
+            try:
+                async for chunk in gen:
+                    if t_first is None and chunk:
+                        t_first = time.perf_counter()
+                    chars += len(chunk)
+            finally:
+                await gen.aclose()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        out.append(_record(q, t0, t_first, chars, error))
+        await asyncio.sleep(think)
+
+
+# ---- Report ----
+
+def _report(args, recs, wall_s: float):
+    from services.llm_client import llm_stats, stream_stats
+    ok = [r for r in recs if not r["error"]]
+    stages = {}
+    for name in ("retrieve", "first_token", "generate", "total"):
+        stages[name] = _dist([r["stages"][name] for r in ok if name in r["stages"]])
+    by_lang = {lang: {"requests": len(rs), "e2e_ms": _dist([r["e2e_ms"] for r in rs])}
+               for lang in ("en", "ar") for rs in [[r for r in ok if r["lang"] == lang]] if rs}
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "requests": len(recs),
+        "errors": len(recs) - len(ok),
+        "error_samples": sorted({r["error"] for r in recs if r["error"]})[:5],
+        "fallbacks": dict(Counter(r["stages"].get("fallback") for r in ok if r["stages"].get("fallback"))),
+        "sources_stops": sum(1 for r in ok if r["stages"].get("sources_stop") is not None),
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "chars_per_s": round(sum(r["chars"] for r in ok) / wall_s, 1) if wall_s else 0.0,
+        "e2e_ms": _dist([r["e2e_ms"] for r in ok]),
+        "ttft_ms": _dist([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]),
+        "stages_ms": stages,
+        "by_lang": by_lang,
+        "llm": llm_stats(),
+        "llm_stream": stream_stats(),
+    }
+
+
+def _table(rep) -> str:
+    lines = [
+        f"sessions={rep['config']['sessions']} mode={rep['config']['mode']} "
+        f"requests={rep['requests']} errors={rep['errors']} fallbacks={rep['fallbacks'] or 0} "
+        f"sources_stops={rep['sources_stops']}",
+        f"wall {rep['wall_s']} s   throughput {rep['throughput_rps']} req/s   {rep['chars_per_s']} chars/s",
+        "",
+        f"{'metric':22} {'n':>5} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}",
+    ]
+    rows = [("e2e_ms", rep["e2e_ms"]), ("ttft_ms (first text)", rep["ttft_ms"])]
+    rows += [(f"stage.{k}", v) for k, v in rep["stages_ms"].items()]
+    rows += [(f"e2e_ms [{k}]", v["e2e_ms"]) for k, v in rep["by_lang"].items()]
+    for name, d in rows:
+        if d:
+            lines.append(f"{name:22} {d['n']:5d} {d['mean']:9.1f} {d['p50']:9.1f} {d['p95']:9.1f} "
+                         f"{d['p99']:9.1f} {d['max']:9.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=10)
+    ap.add_argument("--turns", type=int, default=5, help="questions per session")
+    ap.add_argument("--think-ms", type=float, default=2000.0, help="mean pause between a session's questions")
+    ap.add_argument("--ramp-s", type=float, default=2.0, help="spread session starts over this many seconds")
+    ap.add_argument("--mode", choices=("thread", "async"), default="thread",
+                    help="thread = process_user_input per session thread (Streamlit); async = aprocess_user_input")
+    ap.add_argument("--ar-share", type=float, default=0.5)
+    ap.add_argument("--questions", default="", help="file with one question per line (default: built-in mix)")
+    ap.add_argument("--allow-cache", action="store_true", help="keep the answer cache and canned answers on")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", default="", help="write the JSON report here ('-' = stdout)")
+    ap.add_argument("--mock", action="store_true", help="serve the LLM from tools/mock_llm")
+    mock_llm.add_args(ap, prefix="mock-")
+    args = ap.parse_args()
+
+    if not args.allow_cache:
+        os.environ["ANSWER_CACHE"] = "0"
+        os.environ["CANNED_ANSWERS"] = "0"
+    if args.mock:
+        srv = mock_llm.serve(mock_llm.config_from_args(args, prefix="mock-"))
+        os.environ["LLMAR_API_URL"] = f"http://127.0.0.1:{srv.server_port}/generate"
+        os.environ.pop("LLMAR_API_URLS", None)
+        print(f"[load] mock LLM at {os.environ['LLMAR_API_URL']}", file=sys.stderr)
+
+    from services.chat_logic import process_user_input  # noqa: F401  (import cost outside the timing)
+    recs: list = []
+    t0 = time.perf_counter()
+    if args.mode == "async":
+        async def run():
+            await asyncio.gather(*[_async_session(args, i, recs) for i in range(args.sessions)])
+        asyncio.run(run())
+    else:
+        lock = threading.Lock()
+        threads = [threading.Thread(target=_thread_session, args=(args, i, recs, lock), daemon=True)
+                   for i in range(args.sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    rep = _report(args, recs, time.perf_counter() - t0)
+
+    print(_table(rep))
+    if args.json == "-":
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+        print(f"[load] report written to {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
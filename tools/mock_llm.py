@@ -0,0 +1,254 @@
+# tools/mock_llm.py
+# Stand-in for the LLM endpoint (LLMAR_API_URL) for load tests and local runs.
+# Accepts the services/llm_client payload ("prompt", or "messages" with
+# LLM_PROMPT_MODE=chat) and answers
+#   one-shot   {"text": ..., "details": {"generated_tokens": n}}
+#   streaming  SSE (TGI-style {"token": {"text": ...}}, or OpenAI chat deltas
+#              for "messages" payloads) ending with "data: [DONE]"
+# Timing: TTFT is log-normal around --ttft-ms (spread --ttft-sigma) plus
+# --prefill-ms-per-1k per 1000 prompt characters; tokens then come at
+# --tps per request. --slots caps concurrent generations (a batch-size
+# stand-in); extra requests queue, and that wait counts toward TTFT.
+# Errors: --error-rate answers 503, --stall-rate holds the request for
+# --stall-s before answering (to trip client timeouts).
+# --sources-tokens ends each answer with a "Sources" section of about that
+# many tokens, as models do unprompted; a "stop" list in the request ends the
+# answer before the first stop string (vLLM semantics: not included).
+# run: python -m tools.mock_llm [--port 8700] [--tps 40] [--ttft-ms 400] [--error-rate 0.01]
+#      then LLMAR_API_URL=http://127.0.0.1:8700/generate
+from typing import Any, Dict, List, Optional, Tuple
+import re, json, math, time, random, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_EN = ("Ibtikar is an innovation cluster that supports startups, researchers and "
+       "entrepreneurs through incubation, mentoring, training programs and "
+       "partnerships with universities and companies .").split()
+_AR = ("تجمع ابتكار هو مجتمع للابتكار يدعم الشركات الناشئة والباحثين ورواد الأعمال "
+       "عبر الاحتضان والإرشاد وبرامج التدريب والشراكات مع الجامعات والشركات .").split()
+
+
+class MockConfig:
+    def __init__(self, tps: float = 40.0, ttft_ms: float = 400.0, ttft_sigma: float = 0.4,
+                 prefill_ms_per_1k: float = 20.0, answer_tokens: int = 250, slots: int = 0,
+                 error_rate: float = 0.0, stall_rate: float = 0.0, stall_s: float = 30.0,
+                 sources_tokens: int = 0, seed: Optional[int] = None):
+        self.tps = tps
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_s = stall_s
+        self.sources_tokens = sources_tokens
+        self.slots = threading.BoundedSemaphore(slots) if slots > 0 else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {"requests": 0, "streams": 0, "errors": 0, "stalls": 0, "tokens": 0,
+                                         "stopped": 0}
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[key] += n
+
+    def ttft_s(self, prompt_chars: int) -> float:
+        with self.lock:
+            base = self.ttft_ms * math.exp(self.rng.gauss(0.0, self.ttft_sigma)) if self.ttft_ms > 0 else 0.0
+        return (base + self.prefill_ms_per_1k * prompt_chars / 1000.0) / 1000.0
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+
+def _prompt_text(req: Dict[str, Any]) -> str:
+    if isinstance(req.get("messages"), list):
+        return "\n".join(str(m.get("content") or "") for m in req["messages"] if isinstance(m, dict))
+    return str(req.get("prompt") or "")
+
+
+def _answer_tokens(prompt: str, n: int, sources: int = 0) -> List[str]:
+    # answer in the language of the question (the last "Question:" line if present)
+    q = prompt.rsplit("Question:", 1)[-1]
+    ar = bool(re.search(r"[\u0600-\u06FF]", q))
+    words = _AR if ar else _EN
+    if n <= sources:
+        sources = 0
+    body = [w + " " for w in (words * (n // len(words) + 1))[:n - max(0, sources)]]
+    if sources <= 0:
+        return body
+    tail = ["\n\n", "**", "المصادر" if ar else "Sources", ":**", "\n"]
+    while len(tail) < sources:
+        tail += ["- ", "https", "://", "ibtikar", ".org", ".tr", f"/p{len(tail)}", "\n"]
+    return body + tail[:sources]
+
+
+def _apply_stop(tokens: List[str], stops: List[str]) -> Tuple[List[str], bool]:
+    """Tokens up to (not including) the first stop string; True if one was hit."""
+    stops = [x for x in stops if x]
+    longest = max((len(x) for x in stops), default=0)
+    text = ""
+    for tok in tokens:
+        start = max(0, len(text) - longest)
+        text += tok
+        hits = [k for k in (text.find(x, start) for x in stops) if k >= 0]
+        if hits:
+            out, left = [], min(hits)
+            for t in tokens:
+                if left <= 0:
+                    break
+                out.append(t[:left])
+                left -= len(t)
+            return out, True
+    return tokens, False
+
+
+def make_handler(cfg: MockConfig):
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a):
+            pass
+
+        def _json(self, code: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith(("/health", "/healthz")):
+                return self._json(200, {"ok": True})
+            if self.path.startswith("/stats"):
+                with cfg.lock:
+                    return self._json(200, dict(cfg.counters))
+            self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                n = int(self.headers.get("Content-Length") or 0)
+                req = json.loads(self.rfile.read(n) or b"{}")
+            except ValueError:
+                return self._json(400, {"error": "bad json"})
+            cfg.count("requests")
+            if cfg.roll(cfg.error_rate):
+                cfg.count("errors")
+                return self._json(503, {"error": "injected"})
+            if cfg.roll(cfg.stall_rate):
+                cfg.count("stalls")
+                time.sleep(cfg.stall_s)
+
+            prompt = _prompt_text(req)
+            n_tok = max(1, min(int(req.get("max_tokens") or cfg.answer_tokens), cfg.answer_tokens))
+            tokens = _answer_tokens(prompt, n_tok, cfg.sources_tokens)
+            stop = req.get("stop")
+            tokens, stopped = _apply_stop(tokens, [stop] if isinstance(stop, str) else list(stop or []))
+            if stopped:
+                cfg.count("stopped")
+            t_start = time.perf_counter()
+            if cfg.slots is not None:
+                cfg.slots.acquire()
+            try:
+                time.sleep(max(0.0, cfg.ttft_s(len(prompt)) - (time.perf_counter() - t_start)))
+                if req.get("stream"):
+                    self._stream(tokens, chat="messages" in req)
+                else:
+                    time.sleep(len(tokens) / cfg.tps if cfg.tps > 0 else 0.0)
+                    cfg.count("tokens", len(tokens))
+                    self._json(200, {"text": "".join(tokens).strip(),
+                                     "details": {"generated_tokens": len(tokens)}})
+            finally:
+                if cfg.slots is not None:
+                    cfg.slots.release()
+
+        def _stream(self, tokens: List[str], chat: bool) -> None:
+            cfg.count("streams")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            gap = 1.0 / cfg.tps if cfg.tps > 0 else 0.0
+            t_next = time.perf_counter()
+            try:
+                for i, tok in enumerate(tokens):
+                    if chat:
+                        ev: Dict[str, Any] = {"choices": [{"index": 0, "delta": {"content": tok}}]}
+                    else:
+                        ev = {"token": {"id": i, "text": tok, "special": False}}
+                    if i == len(tokens) - 1:
+                        if chat:
+                            ev["usage"] = {"completion_tokens": len(tokens)}
+                        else:
+                            ev["details"] = {"generated_tokens": len(tokens)}
+                    self._chunk(f"data: {json.dumps(ev, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    cfg.count("tokens")
+                    t_next += gap
+                    time.sleep(max(0.0, t_next - time.perf_counter()))
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+            except OSError:   # client went away (cancel / deadline)
+                self.close_connection = True
+
+        def _chunk(self, data: bytes) -> None:
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+    return _Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass   # clients dropping connections (cancelled streams, deadlines) is expected under load
+
+
+def serve(cfg: MockConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start in a daemon thread; the URL is http://host:<server.server_port>/generate."""
+    srv = _Server((host, port), make_handler(cfg))
+    threading.Thread(target=srv.serve_forever, name="mock-llm", daemon=True).start()
+    return srv
+
+
+def add_args(ap: argparse.ArgumentParser, prefix: str = "") -> None:
+    ap.add_argument(f"--{prefix}tps", type=float, default=40.0, help="tokens/s per request")
+    ap.add_argument(f"--{prefix}ttft-ms", type=float, default=400.0, help="median time to first token")
+    ap.add_argument(f"--{prefix}ttft-sigma", type=float, default=0.4, help="log-normal spread of TTFT")
+    ap.add_argument(f"--{prefix}prefill-ms-per-1k", type=float, default=20.0, help="extra TTFT per 1000 prompt chars")
+    ap.add_argument(f"--{prefix}answer-tokens", type=int, default=250)
+    ap.add_argument(f"--{prefix}slots", type=int, default=0, help="max concurrent generations (0 = unlimited)")
+    ap.add_argument(f"--{prefix}error-rate", type=float, default=0.0)
+    ap.add_argument(f"--{prefix}stall-rate", type=float, default=0.0)
+    ap.add_argument(f"--{prefix}stall-s", type=float, default=30.0)
+    ap.add_argument(f"--{prefix}sources-tokens", type=int, default=0,
+                    help="end answers with a Sources section of ~N tokens")
+    ap.add_argument(f"--{prefix}seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace, prefix: str = "") -> MockConfig:
+    p = prefix.replace("-", "_")
+    return MockConfig(**{k: getattr(args, p + k) for k in (
+        "tps", "ttft_ms", "ttft_sigma", "prefill_ms_per_1k", "answer_tokens", "slots",
+        "error_rate", "stall_rate", "stall_s", "sources_tokens", "seed")})
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8700)
+    add_args(ap)
+    args = ap.parse_args()
+    srv = serve(config_from_args(args), args.host, args.port)
+    print(f"[mock-llm] http://{args.host}:{srv.server_port}/generate")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()